@@ -0,0 +1,142 @@
+import os
+import asyncio
+import ipaddress
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from ratelimit import TokenBucket
+
+
+class Overloaded(Exception):
+    """Request bị từ chối để bảo vệ hệ thống; `status` = 429 (hết quota của key), 413 (batch không bao giờ vừa
+    quota) hoặc 503 (stage quá tải)."""
+
+    def __init__(self, stage: str, reason: str, retry_after: float = 1.0, status: int = 503):
+        super().__init__(f"{stage} overloaded ({reason})")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+def parse_networks(spec: str) -> list:
+    """"10.0.0.0/8, 127.0.0.1" -> danh sách ip_network (TRUSTED_PROXIES)."""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+def _trusted(addr: str, trusted: list) -> bool:
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in trusted)
+
+
+def client_address(peer: str, forwarded_for: Optional[str], trusted: list) -> str:
+    """IP của client để tính quota anonymous.
+
+    Chỉ tin X-Forwarded-For khi kết nối đến từ proxy trong `trusted`; khi đó đi từ phải sang trái, bỏ các proxy
+    tin cậy, lấy địa chỉ đầu tiên không phải proxy (phần bên trái do client tự ghi, giả mạo được)."""
+    if not forwarded_for or not _trusted(peer, trusted):
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop, trusted):
+            return hop
+    return hops[0] if hops else peer
+
+
+class KeyLimiter:
+    """Token bucket riêng cho từng API key (hoặc IP với request không có key), giữ tối đa `max_keys` bucket (LRU).
+
+    Mỗi câu hỏi tốn một token. Batch được chờ tối đa `max_wait` giây để trả phần vượt burst theo `rate`;
+    batch lớn hơn `max_cost(max_wait)` không bao giờ vừa -> 413."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rejected = 0
+
+    def max_cost(self, max_wait: float) -> float:
+        return self.burst + self.rate * max_wait
+
+    def check(self, key: str, cost: float = 1.0, max_wait: float = 0.0) -> float:
+        """Trả về số giây caller phải chờ trước khi chạy (0 với request đơn còn token)."""
+        if cost > self.max_cost(max_wait):
+            self.rejected += 1
+            raise Overloaded("api_key", "batch_too_large", retry_after=0, status=413)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, burst=self.burst)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        wait = bucket.reserve(cost, max_wait)
+        if wait is None:
+            self.rejected += 1
+            raise Overloaded("api_key", "rate_limited", retry_after=bucket.retry_after(cost) - max_wait, status=429)
+        return wait
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "keys": len(self.buckets), "rejected": self.rejected}
+
+
+class StageGate:
+    """Giới hạn số request đồng thời của một stage (embed / ES / summarizer), phần dư xếp hàng có hạn.
+
+    Hàng đợi đầy -> từ chối ngay; chờ quá `max_wait` giây -> từ chối. Không bao giờ chờ vô hạn."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._sem = asyncio.Semaphore(limit)
+        self.inflight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "timeout": 0}
+
+    def saturated(self) -> bool:
+        return self.inflight >= self.limit or self.queued > 0
+
+    @asynccontextmanager
+    async def slot(self, max_wait: Optional[float] = None):
+        if self._sem.locked():
+            if self.queued >= self.max_queue:
+                self.shed["queue_full"] += 1
+                raise Overloaded(self.name, "queue_full", retry_after=self.max_wait)
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                await asyncio.wait_for(self._sem.acquire(), self.max_wait if max_wait is None else max_wait)
+            except asyncio.TimeoutError:
+                self.shed["timeout"] += 1
+                raise Overloaded(self.name, "timeout", retry_after=self.max_wait)
+            finally:
+                self.queued -= 1
+        else:
+            await self._sem.acquire()
+        self.inflight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "inflight": self.inflight, "queued": self.queued, "peak_queued": self.peak_queued,
+                "max_queue": self.max_queue, "max_wait_s": self.max_wait, "admitted": self.admitted, "shed": dict(self.shed)}
+
+
+def gate_from_env(name: str, limit: int, max_queue: int, max_wait_ms: float) -> StageGate:
+    """ADMISSION_<NAME>_LIMIT / _QUEUE / _WAIT_MS."""
+    prefix = f"ADMISSION_{name.upper()}"
+    return StageGate(name, int(os.getenv(f"{prefix}_LIMIT", str(limit))), int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+                     float(os.getenv(f"{prefix}_WAIT_MS", str(max_wait_ms))) / 1000)
@@ -0,0 +1,222 @@
+"""Load test offline cho main.py: chạy đúng FastAPI app thật với ES / LLM / embedding giả (bench_fakes.py).
+
+    python bench_api.py --requests 2000 --concurrency 64 --endpoint ask
+    python bench_api.py --endpoint stream --llm-ms 400 --unique 1.0
+    python bench_api.py --endpoint batch --batch-size 32 --json bench_output.txt
+
+Báo cáo p50/p95/p99 latency, RPS, latency theo stage (từ meta.trace) và bộ nhớ (RSS + tracemalloc theo module).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import functools
+import tracemalloc
+from collections import defaultdict
+
+# Phải set trước khi import main (config đọc lúc import)
+os.environ.setdefault("TRACE_RESPONSES", "1")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("LAZY_STARTUP", "0")
+# Bench dồn tải bằng một key -> tắt quota / gate (admission.py) để đo pipeline, bật lại bằng ADMISSION_ENABLED=1
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import httpx
+
+import main
+from bench_fakes import SPECIES, FakeAsyncElasticsearch, HashEmbedder, fake_llm, make_corpus, percentile
+
+TEMPLATES = [
+    "{vn} sống ở đâu",
+    "{vn} có độc không",
+    "kể về {vn}",
+    "{sci} là con gì",
+    "liệt kê các loài rắn độc ở việt nam",
+    "danh sách rắn lành",
+    "đặc điểm của {vn}",
+]
+
+
+def make_questions(n: int, unique: float, seed: int) -> list:
+    """`unique` = tỉ lệ câu hỏi khác nhau (0 -> lặp lại nhiều, đo hiệu quả cache; 1 -> toàn câu mới)."""
+    rng = random.Random(seed)
+    pool_size = max(1, int(n * unique))
+    pool = []
+    for i in range(pool_size):
+        sci, vn, *_ = SPECIES[i % len(SPECIES)]
+        q = rng.choice(TEMPLATES).format(vn=vn.lower(), sci=sci)
+        pool.append(q if i < len(SPECIES) * len(TEMPLATES) else f"{q} #{i}")
+    return [pool[rng.randrange(pool_size)] for _ in range(n)]
+
+
+def install_fakes(args):
+    """Thay các hook khởi động của main.py bằng backend giả; phần còn lại của app chạy y nguyên."""
+    embedder = HashEmbedder(dims=main.EMBEDDING_DIMS, latency_ms=args.embed_ms, per_item_ms=args.embed_item_ms)
+    docs = make_corpus(args.corpus, embedder=HashEmbedder(dims=main.EMBEDDING_DIMS))
+
+    async def connect_es():
+        with main.startup_phase("es_connect"):
+            main.resources["es"] = FakeAsyncElasticsearch(docs, latency_ms=args.es_ms)
+
+    main._import_heavy = lambda: None
+    main._load_embed_model = lambda: (embedder, lambda texts: embedder.encode(texts, batch_size=len(texts)))
+    main._connect_es = connect_es
+    main._init_llm = functools.partial(main._init_llm, fake_llm(args.llm_ms, args.llm_tokens, args.llm_token_ms))
+    if args.no_cache:
+        main.SEMANTIC_CACHE_ENABLED = False
+        for cache in (main.PARSE_CACHE, main.EMBED_CACHE, main.ANSWER_CACHE):
+            cache.get = lambda key, default=None: default
+
+
+def parse_sse(text: str) -> dict:
+    meta = {}
+    for block in text.split("\n\n"):
+        if block.startswith("event: meta"):
+            meta = json.loads(block.split("data: ", 1)[1])
+    return {"stages_ms": {k[:-3]: v for k, v in meta.get("timings", {}).items()}}
+
+
+async def run_load(args, questions: list) -> dict:
+    latencies = []
+    stage_ms = defaultdict(list)
+    errors = 0
+    headers = {"X-API-Key": main.API_KEY_VAL}
+
+    if args.endpoint == "batch":
+        jobs = [questions[i:i + args.batch_size] for i in range(0, len(questions), args.batch_size)]
+    else:
+        jobs = questions
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                job = queue.get_nowait()
+                t = time.perf_counter()
+                try:
+                    if args.endpoint == "ask":
+                        r = await client.post("/api/ask-snake", json={"question": job}, headers=headers)
+                        trace = r.json().get("meta", {}).get("trace", {})
+                    elif args.endpoint == "stream":
+                        r = await client.post("/api/ask-snake/stream", json={"question": job}, headers=headers)
+                        trace = parse_sse(r.text)
+                    else:
+                        r = await client.post("/api/ask-snake/batch", json={"questions": job}, headers=headers)
+                        trace = r.json().get("meta", {}).get("trace", {})
+                    if r.status_code != 200:
+                        errors += 1
+                        continue
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - t) * 1000)
+                for stage, ms in trace.get("stages_ms", {}).items():
+                    stage_ms[stage].append(ms)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "endpoint": args.endpoint,
+        "requests": len(jobs),
+        "questions": len(questions),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "rps": round(len(jobs) / wall, 1) if wall else 0.0,
+        "qps": round(len(questions) / wall, 1) if wall else 0.0,
+        "latency_ms": {p: round(percentile(latencies, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "stages_ms": {
+            stage: {p: round(percentile(v, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+            for stage, v in sorted(stage_ms.items())
+        },
+    }
+
+
+async def bench(args) -> dict:
+    install_fakes(args)
+    questions = make_questions(args.requests, args.unique, args.seed)
+
+    tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    async with main.lifespan(main.app):
+        startup = dict(main.STARTUP["phases"])
+        snap_before = tracemalloc.take_snapshot()
+        if args.warmup:
+            warm = argparse.Namespace(**{**vars(args), "concurrency": min(args.concurrency, 8)})
+            await run_load(warm, questions[:args.warmup])
+        report = await run_load(args, questions)
+        snap_after = tracemalloc.take_snapshot()
+        report["embedder"] = main.resources["embedder"].stats()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    by_module = defaultdict(int)
+    for stat in snap_after.compare_to(snap_before, "filename"):
+        name = os.path.basename(stat.traceback[0].filename)
+        by_module[name] += stat.size_diff
+    report["startup_s"] = startup
+    report["memory"] = {
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_growth_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 2),
+        "retained_kb_by_module": {k: round(v / 1024, 1) for k, v in sorted(by_module.items(), key=lambda kv: -kv[1])[:10]},
+    }
+    report["caches"] = {
+        "parse": main.PARSE_CACHE.stats(),
+        "embed": main.EMBED_CACHE.stats(),
+        "answer": main.ANSWER_CACHE.stats(),
+        "semantic": main.SEMANTIC_CACHE.stats(),
+    }
+    return report
+
+
+def print_report(r: dict):
+    print(f"\n=== {r['endpoint']}: {r['requests']} requests ({r['questions']} questions), {r['errors']} errors ===")
+    print(f"wall {r['wall_s']}s | {r['rps']} req/s | {r['qps']} questions/s")
+    print("latency ms  " + "  ".join(f"{k}={v}" for k, v in r["latency_ms"].items()))
+    print("\nstage            p50       p95       p99")
+    for stage, v in r["stages_ms"].items():
+        print(f"{stage:<12}{v['p50']:>9}{v['p95']:>10}{v['p99']:>10}")
+    print(f"\nstartup (s): {r['startup_s']}")
+    print(f"memory: {json.dumps(r['memory'], ensure_ascii=False)}")
+    print(f"embedder: {r['embedder']}")
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--endpoint", choices=["ask", "stream", "batch"], default="ask")
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--unique", type=float, default=0.3, help="tỉ lệ câu hỏi khác nhau")
+    ap.add_argument("--corpus", type=int, default=500, help="số document giả trong index")
+    ap.add_argument("--es-ms", type=float, default=8.0)
+    ap.add_argument("--llm-ms", type=float, default=300.0)
+    ap.add_argument("--llm-tokens", type=int, default=40)
+    ap.add_argument("--llm-token-ms", type=float, default=2.0)
+    ap.add_argument("--embed-ms", type=float, default=15.0, help="chi phí cố định mỗi lần encode")
+    ap.add_argument("--embed-item-ms", type=float, default=3.0, help="chi phí thêm cho mỗi câu trong batch")
+    ap.add_argument("--warmup", type=int, default=0)
+    ap.add_argument("--no-cache", action="store_true", help="tắt mọi cache để đo pipeline thô")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    report = asyncio.run(bench(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,113 @@
+"""Chạy crawler_wiki.py với Wikipedia giả (bench_fakes.FakeWikipedia), không cần mạng / Mongo / MySQL.
+
+    python bench_crawler.py --species 2000 --concurrency 16 --rate 40
+    python bench_crawler.py --serve 8765        # qua server HTTP thật trên localhost thay vì MockTransport
+
+Lượt 1: cào mới toàn bộ. Lượt 2: mọi bản ghi quá hạn, `--edit-ratio` số trang bị sửa -> chỉ các trang đó được cào lại.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from ratelimit import TokenBucket
+from bench_fakes import SPECIES, FakeWikipedia
+from crawler_wiki import WikiClient, crawl
+
+
+class MemoryWriter:
+    """Thay MongoBulkWriter: giữ document trong dict (mô phỏng $set + upsert)."""
+
+    def __init__(self):
+        self.docs = {}
+        self.written = 0
+
+    async def add(self, name: str, fields: dict):
+        self.docs.setdefault(name, {"scientific_name": name}).update(fields)
+        self.written += 1
+
+    async def flush(self):
+        pass
+
+
+async def run_pass(args, fake: FakeWikipedia, names: list, existing: dict, writer: MemoryWriter) -> dict:
+    limiter = TokenBucket(args.rate, burst=args.burst)
+    if args.serve:
+        client = httpx.AsyncClient(timeout=30)
+        api = f"http://127.0.0.1:{args.serve}/{{lang}}/w/api.php"
+    else:
+        client = httpx.AsyncClient(transport=fake.transport(), timeout=30)
+        api = "http://fake-wiki/{lang}/w/api.php"
+    before = fake.requests
+    started = time.perf_counter()
+    async with client:
+        wiki = WikiClient(client, limiter, api=api)
+        stats = await crawl(names, existing, writer, wiki, concurrency=args.concurrency, refresh_days=args.refresh_days)
+    wall = time.perf_counter() - started
+    return {
+        "wall_s": round(wall, 2),
+        "species_per_s": round(len(names) / wall, 1) if wall else 0.0,
+        "server_requests": fake.requests - before,
+        **stats,
+        **wiki.stats(),
+        "limiter": limiter.stats(),
+    }
+
+
+async def bench(args) -> dict:
+    names = [f"{SPECIES[i % len(SPECIES)][0]}{'' if i < len(SPECIES) else f' sp{i}'}" for i in range(args.species)]
+    fake = FakeWikipedia.from_species(names, latency_ms=args.latency_ms, max_rps=args.max_rps, seed=args.seed)
+    server = fake.serve(args.serve) if args.serve else None
+    try:
+        writer = MemoryWriter()
+        first = await run_pass(args, fake, names, {}, writer)
+
+        # Lượt 2: đẩy last_scraped về quá hạn, sửa một phần trang
+        edited = 0
+        for (lang, title) in list(fake.pages)[: int(len(fake.pages) * args.edit_ratio)]:
+            doc = writer.docs.get(title, {})
+            if doc.get("language") == lang:
+                fake.edit(lang, title)
+                edited += 1
+        for doc in writer.docs.values():
+            doc["last_scraped"] = 0
+        second = await run_pass(args, fake, names, {k: dict(v) for k, v in writer.docs.items()}, writer)
+    finally:
+        if server:
+            server.shutdown()
+
+    # Crawler cũ: tuần tự, sleep(1) mỗi loài, 1-2 request (vi rồi en nếu vi không có)
+    requests_old = sum(1 + (("vi", n) not in fake.pages) for n in names)
+    legacy = len(names) * 1.0 + requests_old * args.latency_ms / 1000
+    return {"species": len(names), "pages": len(fake.pages), "edited": edited,
+            "legacy_estimate_s": round(legacy, 1), "first_pass": first, "refresh_pass": second,
+            "server_throttled": fake.throttled}
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--species", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--rate", type=float, default=40.0, help="request/giây phía crawler")
+    ap.add_argument("--burst", type=float, default=10.0)
+    ap.add_argument("--max-rps", type=float, default=0.0, help="server giả trả 429 khi vượt (0 = tắt)")
+    ap.add_argument("--latency-ms", type=float, default=80.0)
+    ap.add_argument("--edit-ratio", type=float, default=0.1)
+    ap.add_argument("--refresh-days", type=float, default=30.0)
+    ap.add_argument("--serve", type=int, default=0, help="port cho server HTTP thật (0 = MockTransport)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    report = asyncio.run(bench(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,166 @@
+"""Đo es_client.ResilientSearch (pool + hedging + circuit breaker) so với AsyncElasticsearch mặc định,
+chạy với server ES giả qua HTTP thật (bench_fakes.FakeElasticsearchHttp), không cần Elasticsearch.
+
+    python bench_es_client.py
+    python bench_es_client.py --queries 2000 --concurrency 32 --slow-ratio 0.05 --slow-ms 400
+    python bench_es_client.py --brownout-s 5 --timeout 2 --fallback     # + index local khi breaker mở
+
+Pha 1 (tail): 1 phần `slow_ratio` request bị chậm thêm `slow_ms` -> p50/p95/p99 có và không có hedging.
+Pha 2 (brownout): server treo `timeout` giây rồi trả 503 trong `brownout_s` giây -> latency / lỗi / số request
+bị breaker chặn ngay, và số câu trả lời degraded từ index local nếu bật `--fallback`.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+from bench_fakes import FakeAsyncElasticsearch, FakeElasticsearchHttp, HashEmbedder, make_corpus, percentile
+from es_client import CircuitBreaker, ResilientSearch, SearchUnavailable, connect_es
+from search_backend import LocalSearchBackend, write_local_index
+
+DIMS = 64
+
+
+def make_bodies(docs: list, n: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for _ in range(n):
+        vec = np.asarray(docs[int(rng.integers(len(docs)))]["vector_embedding"], dtype=np.float32)
+        vec = vec + rng.normal(0, 0.02, vec.shape).astype(np.float32)
+        bodies.append({"size": 5, "_source": ["scientific_name", "vietnamese_name"],
+                       "knn": {"field": "vector_embedding", "query_vector": vec.tolist(), "k": 5, "num_candidates": 50}})
+    return bodies
+
+
+async def run(client, bodies: list, concurrency: int, fallback=None, during=None, rate: float = 0.0) -> dict:
+    """`rate` > 0: gửi open-loop `rate` query/giây (như traffic thật) thay vì dồn hết vào hàng đợi."""
+    latencies, outcomes = [], {"ok": 0, "degraded": 0, "short_circuited": 0, "error": 0}
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(body):
+        async with sem:
+            t = time.perf_counter()
+            try:
+                await client.search(index="snakes", body=body)
+                outcomes["ok"] += 1
+            except Exception as e:
+                if isinstance(e, SearchUnavailable) and str(e) == "circuit open":
+                    outcomes["short_circuited"] += 1
+                else:
+                    outcomes["error"] += 1
+                if fallback is not None:
+                    await fallback.search(index="snakes", body=body)
+                    outcomes["degraded"] += 1
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    started = time.perf_counter()
+    side = asyncio.ensure_future(during()) if during is not None else None
+    tasks = []
+    for b in bodies:
+        tasks.append(asyncio.ensure_future(one(b)))
+        if rate:
+            await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    if side is not None:
+        await side
+    wall = time.perf_counter() - started
+    return {
+        "qps": round(len(bodies) / wall, 1),
+        "latency_ms": {p: round(percentile(latencies, q), 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        **outcomes,
+    }
+
+
+def clients(args):
+    from elasticsearch import AsyncElasticsearch
+
+    host = f"http://127.0.0.1:{args.port}"
+    plain = AsyncElasticsearch(host, request_timeout=args.timeout)
+    tuned = ResilientSearch(
+        connect_es(host, pool_size=args.pool_size, request_timeout=args.timeout, max_retries=0),
+        CircuitBreaker(args.breaker_failures, args.breaker_reset_s), hedge=True, hedge_budget=args.hedge_budget,
+        pool_size=args.pool_size)
+    return plain, tuned
+
+
+async def bench(args) -> dict:
+    docs = make_corpus(args.docs, embedder=HashEmbedder(dims=DIMS))
+    fake = FakeElasticsearchHttp(FakeAsyncElasticsearch(docs, latency_ms=0), latency_ms=args.latency_ms,
+                                 slow_ratio=args.slow_ratio, slow_ms=args.slow_ms, hang_ms=args.timeout * 1000)
+    server = fake.serve(args.port)
+    tmp = tempfile.mkdtemp(prefix="es_fallback_")
+    report = {"docs": args.docs, "queries": args.queries, "concurrency": args.concurrency}
+    try:
+        fallback = None
+        if args.fallback:
+            write_local_index(os.path.join(tmp, "idx"), docs, DIMS)
+            fallback = LocalSearchBackend.load(os.path.join(tmp, "idx"))
+        bodies = make_bodies(docs, args.queries, args.seed)
+
+        plain, tuned = clients(args)
+        try:
+            # warm-up: mở kết nối + đủ mẫu latency cho hedge delay
+            await run(plain, bodies[:100], args.concurrency)
+            await run(tuned, bodies[:100], args.concurrency)
+            report["tail"] = {"plain": await run(plain, bodies, args.concurrency),
+                              "resilient": await run(tuned, bodies, args.concurrency)}
+
+            async def brownout():
+                await asyncio.sleep(0.2)
+                fake.brownout = True
+                await asyncio.sleep(args.brownout_s)
+                fake.brownout = False
+
+            n = min(len(bodies), int(args.brownout_qps * (args.brownout_s + 0.4)))
+            report["brownout"] = {
+                "plain": await run(plain, bodies[:n], args.concurrency, during=brownout, rate=args.brownout_qps),
+                "resilient": await run(tuned, bodies[:n], args.concurrency, fallback=fallback, during=brownout,
+                                       rate=args.brownout_qps),
+            }
+            report["resilient_stats"] = tuned.stats()
+        finally:
+            await plain.close()
+            await tuned.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+    report["server_requests"] = fake.requests
+    return report
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--port", type=int, default=9299)
+    ap.add_argument("--latency-ms", type=float, default=5.0)
+    ap.add_argument("--slow-ratio", type=float, default=0.03)
+    ap.add_argument("--slow-ms", type=float, default=300.0)
+    ap.add_argument("--timeout", type=float, default=2.0, help="request_timeout của client; server treo bằng đúng thời gian này khi brownout")
+    ap.add_argument("--brownout-s", type=float, default=4.0)
+    ap.add_argument("--brownout-qps", type=float, default=100.0, help="tốc độ gửi query (open-loop) trong pha brownout")
+    ap.add_argument("--pool-size", type=int, default=20)
+    ap.add_argument("--hedge-budget", type=float, default=0.1)
+    ap.add_argument("--breaker-failures", type=int, default=5)
+    ap.add_argument("--breaker-reset-s", type=float, default=1.0)
+    ap.add_argument("--fallback", action="store_true", help="trả kết quả từ index local khi ES không dùng được")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    report = asyncio.run(bench(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,385 @@
+"""Stand-in offline cho Elasticsearch, LLM và embedding model, dùng cho benchmark (không cần mạng)."""
+import re
+import json
+import time
+import asyncio
+import hashlib
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+
+SPECIES = [
+    ("Ophiophagus hannah", "Rắn hổ mang chúa", "Elapidae", "Venomous", "Vietnam, Laos, Thailand, India"),
+    ("Naja kaouthia", "Rắn hổ mang một mắt kính", "Elapidae", "Venomous", "Vietnam, Laos, Cambodia"),
+    ("Bungarus fasciatus", "Rắn cạp nong", "Elapidae", "Venomous", "Vietnam, Laos, Indonesia"),
+    ("Bungarus multicinctus", "Rắn cạp nia", "Elapidae", "Venomous", "Vietnam, China, Taiwan"),
+    ("Trimeresurus albolabris", "Rắn lục mép trắng", "Viperidae", "Venomous", "Vietnam, Thailand, China"),
+    ("Calloselasma rhodostoma", "Rắn chàm quạp", "Viperidae", "Venomous", "Vietnam, Cambodia, Malaysia"),
+    ("Python bivittatus", "Trăn đất", "Pythonidae", "Non-venomous", "Vietnam, Myanmar, China"),
+    ("Malayopython reticulatus", "Trăn gấm", "Pythonidae", "Non-venomous", "Vietnam, Indonesia, Philippines"),
+    ("Ptyas korros", "Rắn ráo thường", "Colubridae", "Non-venomous", "Vietnam, Laos, India"),
+    ("Enhydris enhydris", "Rắn bông súng", "Homalopsidae", "Non-venomous", "Vietnam, Thailand, Bangladesh"),
+]
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def fold(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+class HashEmbedder:
+    """Embedding xác định (hashing trick trên token đã bỏ dấu), chuẩn hoá L2. `latency_ms` giả lập thời gian encode."""
+
+    def __init__(self, dims: int = 1024, latency_ms: float = 0.0, per_item_ms: float = 0.0):
+        self.dims = dims
+        self.latency = latency_ms / 1000
+        self.per_item = per_item_ms / 1000
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dims, dtype=np.float32)
+        for token in re.findall(r"\w+", fold(text)):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vec[h % self.dims] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        if self.latency or self.per_item:
+            time.sleep(self.latency + self.per_item * len(items))
+        out = np.stack([self._vector(t) for t in items]) if items else np.zeros((0, self.dims), np.float32)
+        return out[0] if single else out
+
+
+def make_corpus(size: int = 200, embedder: Optional[HashEmbedder] = None) -> List[dict]:
+    """Corpus giả lập theo đúng schema index `snakes` của etl_snake.py."""
+    embedder = embedder or HashEmbedder()
+    docs = []
+    for i in range(size):
+        sci, vn, family, danger, countries = SPECIES[i % len(SPECIES)]
+        suffix = "" if i < len(SPECIES) else f" var{i // len(SPECIES)}"
+        biology = f"{vn} thuộc họ {family}, thân dài, vảy bóng, sống ở rừng và đồng ruộng. " * 4
+        venom = "Nọc độc thần kinh mạnh." if danger == "Venomous" else "Không độc."
+        context = f"Scientific Name: {sci}{suffix}\nVietnamese Name: {vn}\nFamily: {family}\nDanger Level: {danger}\n" \
+                  f"Distribution: {countries}\n--- BIOLOGY ---\n{biology}\n--- VENOM ---\n{venom}"
+        docs.append({
+            "_id": f"{sci}{suffix}".replace(" ", "_"),
+            "scientific_name": f"{sci}{suffix}",
+            "vietnamese_name": vn,
+            "common_names": vn,
+            "family": family,
+            "danger_level": danger,
+            "countries": countries,
+            "wiki_biology": biology,
+            "wiki_venom": venom,
+            "wiki_behavior": "",
+            "full_text_context": context,
+            "vector_embedding": embedder.encode(context),
+        })
+    return docs
+
+
+class FakeAsyncElasticsearch:
+    """Giả lập các API AsyncElasticsearch mà main.py dùng: search, msearch, mget, ping, close.
+
+    knn = cosine trên ma trận numpy + filter `term`/`match` đơn giản; `latency_ms` cộng vào mỗi request."""
+
+    def __init__(self, docs: List[dict], latency_ms: float = 5.0):
+        self.docs = docs
+        self.latency = latency_ms / 1000
+        self.matrix = np.stack([np.asarray(d["vector_embedding"], dtype=np.float32) for d in docs])
+        self.calls = 0
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _matches(doc: dict, clause: dict) -> bool:
+        kind, spec = next(iter(clause.items()))
+        field, value = next(iter(spec.items()))
+        if kind == "term":
+            return doc.get(field) == value
+        return fold(str(value)) in fold(str(doc.get(field, "")))
+
+    def _allowed(self, bool_filter: dict) -> np.ndarray:
+        must = bool_filter.get("must", [])
+        must_not = bool_filter.get("must_not", [])
+        return np.array([
+            all(self._matches(d, c) for c in must) and not any(self._matches(d, c) for c in must_not)
+            for d in self.docs
+        ])
+
+    def _run(self, body: dict) -> dict:
+        started = time.perf_counter()
+        size = body.get("size", 10)
+        knn = body["knn"]
+        q = np.asarray(knn["query_vector"], dtype=np.float32)
+        scores = self.matrix @ q / (np.linalg.norm(q) or 1.0)
+        scores[~self._allowed(knn.get("filter", {}).get("bool", {}))] = -np.inf
+        top = [int(i) for i in np.argsort(-scores)[:size] if np.isfinite(scores[i])]
+        source = body.get("_source")
+        hits = []
+        for i in top:
+            doc = self.docs[i]
+            src = {k: v for k, v in doc.items() if k not in ("_id", "vector_embedding") and (not source or k in source)}
+            hits.append({"_id": doc["_id"], "_score": float(scores[i]), "_source": src})
+        took = int((time.perf_counter() - started) * 1000)
+        return {"took": took, "hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    async def search(self, index: str = None, body: dict = None, **kwargs) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._run(body or kwargs)
+
+    async def msearch(self, searches: list = None, body: list = None, **kwargs) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        items = searches or body
+        return {"took": 0, "responses": [self._run(b) for b in items[1::2]]}
+
+    async def mget(self, index: str = None, ids: list = None, body: dict = None, **kwargs) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        ids = ids or (body or {}).get("ids", [])
+        by_id = {d["_id"]: d for d in self.docs}
+        out = []
+        for _id in ids:
+            doc = by_id.get(_id)
+            if doc is None:
+                out.append({"_id": _id, "found": False})
+            else:
+                src = {k: v for k, v in doc.items() if k not in ("_id", "vector_embedding")}
+                out.append({"_id": _id, "found": True, "_source": src})
+        return {"docs": out}
+
+
+def fake_llm(latency_ms: float = 300.0, tokens: int = 40, token_delay_ms: float = 5.0):
+    """Runnable thay ChatOpenAI: trả JSON cho prompt parse, đoạn văn cho prompt tóm tắt; hỗ trợ ainvoke/astream/abatch."""
+    from langchain_core.messages import AIMessageChunk
+    from langchain_core.runnables import RunnableGenerator
+
+    def reply(prompt_value) -> list:
+        text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        if "JSON" in text and "Query:" in text:
+            return [json.dumps({"intent_type": "detail", "limit": 5, "must_country": None,
+                                "must_not_country": None, "danger_level": None})]
+        return [word + " " for word in ["Rắn"] * tokens]
+
+    def generate(inputs):
+        for prompt_value in inputs:
+            time.sleep(latency_ms / 1000)
+            for piece in reply(prompt_value):
+                time.sleep(token_delay_ms / 1000)
+                yield AIMessageChunk(content=piece)
+
+    async def agenerate(inputs):
+        async for prompt_value in inputs:
+            await asyncio.sleep(latency_ms / 1000)
+            for piece in reply(prompt_value):
+                await asyncio.sleep(token_delay_ms / 1000)
+                yield AIMessageChunk(content=piece)
+
+    return RunnableGenerator(generate, agenerate)
+
+
+class FakeWikipedia:
+    """MediaWiki API giả cho crawler_wiki.py (action=query với prop=extracts|info, nhiều titles, missing).
+
+    Dùng in-process qua `transport()` (httpx.MockTransport) hoặc chạy server HTTP thật bằng `serve(port)`;
+    URL dạng `<base>/{lang}/w/api.php`. `max_rps` > 0 -> trả 429 + Retry-After khi vượt ngưỡng."""
+
+    def __init__(self, pages: dict, latency_ms: float = 50.0, max_rps: float = 0.0):
+        self.pages = pages  # {(lang, title): {"text": str, "revid": int}}
+        self.latency = latency_ms / 1000
+        self.max_rps = max_rps
+        self.requests = 0
+        self.throttled = 0
+        self._window = []
+
+    @classmethod
+    def from_species(cls, names: List[str], vi_ratio: float = 0.3, en_ratio: float = 0.6, seed: int = 0, **kwargs):
+        """Mỗi loài: có trang vi với xác suất vi_ratio, trang en với xác suất en_ratio (độc lập)."""
+        import random
+
+        rng = random.Random(seed)
+        pages = {}
+        for name in names:
+            for lang, ratio in (("vi", vi_ratio), ("en", en_ratio)):
+                if rng.random() < ratio:
+                    text = (f"{name} là một loài rắn.\n\n== Mô tả ==\nThân dài, vảy bóng. " * 3 +
+                            "\n\n=== Màu sắc ===\nNâu sẫm.\n\n== Phân bố ==\nĐông Nam Á.")
+                    pages[(lang, name)] = {"text": text, "revid": rng.randrange(10**6, 10**7)}
+        return cls(pages, **kwargs)
+
+    def edit(self, lang: str, title: str):
+        page = self.pages[(lang, title)]
+        page["revid"] += 1
+        page["text"] += "\n\n== Ghi chú ==\nĐã cập nhật."
+
+    def _throttle(self) -> bool:
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1.0]
+        if len(self._window) >= self.max_rps:
+            self.throttled += 1
+            return True
+        self._window.append(now)
+        return False
+
+    def respond(self, lang: str, params: dict):
+        """-> (status, headers, body dict)."""
+        self.requests += 1
+        if self._throttle():
+            return 429, {"Retry-After": "1"}, {"error": {"code": "ratelimited"}}
+        props = params.get("prop", "").split("|")
+        out = []
+        for title in params.get("titles", "").split("|"):
+            page = self.pages.get((lang, title))
+            if page is None:
+                out.append({"ns": 0, "title": title, "missing": True})
+                continue
+            item = {"ns": 0, "title": title, "pageid": abs(hash((lang, title))) % 10**8, "lastrevid": page["revid"]}
+            if "extracts" in props:
+                item["extract"] = page["text"]
+            if params.get("inprop") == "url":
+                item["fullurl"] = f"https://{lang}.wikipedia.org/wiki/{title.replace(' ', '_')}"
+            out.append(item)
+        return 200, {}, {"batchcomplete": True, "query": {"pages": out}}
+
+    async def handler(self, request):
+        import httpx
+
+        await asyncio.sleep(self.latency)
+        lang = request.url.path.strip("/").split("/")[0]
+        status, headers, body = self.respond(lang, dict(request.url.params))
+        return httpx.Response(status, headers=headers, json=body)
+
+    def transport(self):
+        import httpx
+
+        return httpx.MockTransport(self.handler)
+
+    def serve(self, port: int = 8765):
+        """Chạy server HTTP thật ở 127.0.0.1:port trong thread nền; trả về server (gọi .shutdown() để dừng)."""
+        import threading
+        from urllib.parse import parse_qsl, urlsplit
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(fake.latency)
+                url = urlsplit(self.path)
+                status, headers, body = fake.respond(url.path.strip("/").split("/")[0], dict(parse_qsl(url.query)))
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                for k, v in {**headers, "Content-Type": "application/json"}.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class FakeElasticsearchHttp:
+    """Server HTTP giả nói đúng giao thức REST của Elasticsearch (ping, _search, _msearch, _mget) cho AsyncElasticsearch
+    thật, dữ liệu lấy từ FakeAsyncElasticsearch. Tiêm độ trễ: `slow_ratio` request chậm thêm `slow_ms`;
+    `brownout = True` -> mọi request treo `hang_ms` rồi trả 503 (mô phỏng ES quá tải)."""
+
+    def __init__(self, engine: FakeAsyncElasticsearch, latency_ms: float = 5.0, slow_ratio: float = 0.0,
+                 slow_ms: float = 300.0, hang_ms: float = 2000.0, seed: int = 0):
+        import random
+
+        self.engine = engine
+        self.latency = latency_ms / 1000
+        self.slow_ratio = slow_ratio
+        self.slow = slow_ms / 1000
+        self.hang = hang_ms / 1000
+        self.brownout = False
+        self.requests = 0
+        self._rng = random.Random(seed)
+
+    def respond(self, method: str, path: str, raw: bytes):
+        """-> (status, body dict | None)."""
+        self.requests += 1
+        if self.brownout:
+            time.sleep(self.hang)
+            return 503, {"error": {"type": "unavailable"}, "status": 503}
+        time.sleep(self.latency + (self.slow if self._rng.random() < self.slow_ratio else 0.0))
+        parts = path.split("?")[0].strip("/").split("/")
+        if method == "HEAD" or parts == [""]:
+            return 200, {"version": {"number": "8.15.0"}, "tagline": "You Know, for Search"}
+        if parts[-1] == "_search":
+            return 200, self.engine._run(json.loads(raw))
+        if parts[-1] == "_msearch":
+            lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+            return 200, {"took": 0, "responses": [self.engine._run(b) for b in lines[1::2]]}
+        if parts[-1] == "_mget":
+            by_id = {d["_id"]: d for d in self.engine.docs}
+            docs = []
+            for _id in json.loads(raw).get("ids", []):
+                doc = by_id.get(_id)
+                docs.append({"_id": _id, "found": doc is not None, **({"_source": {
+                    k: v for k, v in doc.items() if k not in ("_id", "vector_embedding")}} if doc else {})})
+            return 200, {"docs": docs}
+        return 404, {"error": {"type": "not_found"}, "status": 404}
+
+    def serve(self, port: int = 9299):
+        """Chạy ở 127.0.0.1:port trong thread nền; trả về server (gọi .shutdown() để dừng)."""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, giống ES thật
+
+            def _handle(self, method: str):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, body = fake.respond(method, self.path, raw)
+                out = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(out)
+
+            def do_HEAD(self):
+                self._handle("HEAD")
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
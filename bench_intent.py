@@ -0,0 +1,116 @@
+"""Đo độ phủ fast path và latency parse của intent_rules.IntentRules so với regex cũ của HybridParser, trên corpus có nhãn.
+
+    python bench_intent.py
+    python bench_intent.py --corpus intent_corpus.jsonl --min-confidence 0.7 --show-fallbacks --json bench_intent.json
+
+Corpus: mỗi dòng {"q": câu hỏi, "intent": các field mong đợi}; field thiếu = mặc định (detail, limit 5 / listing 10, None).
+coverage = tỉ lệ câu không phải gọi LLM; accuracy = tỉ lệ đúng mọi field trong số câu đi fast path.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+
+from bench_fakes import percentile
+from intent_rules import IntentRules
+
+FIELDS = ("intent_type", "limit", "must_country", "must_not_country", "danger_level")
+
+
+class LegacyRules:
+    """HybridParser._fast_parse trước khi có intent_rules (regex trên text thô, không bỏ dấu)."""
+
+    def __init__(self):
+        self.re_vietnam = re.compile(r'\b(viet\s*nam|vn|nuoc\s*ta)\b', re.IGNORECASE)
+        self.re_listing = re.compile(r'\b(liet\s*ke|danh\s*sach|top|nhung\s*loai|cac\s*loai)\b', re.IGNORECASE)
+        self.re_venom = re.compile(r'\b(doc|noc|nguy\s*hiem|chet\s*nguoi)\b', re.IGNORECASE)
+        self.re_safe = re.compile(r'\b(lanh|khong\s*doc|vo\s*hai)\b', re.IGNORECASE)
+        self.re_negation = re.compile(r'\b(khong|chua|tranh|tru)\b', re.IGNORECASE)
+
+    def fast_parse(self, query: str, min_confidence: float = 0.0):
+        if self.re_negation.search(query):
+            return None
+        intent = {"intent_type": "detail", "limit": 5, "must_country": None, "must_not_country": None, "danger_level": None}
+        if self.re_listing.search(query):
+            intent["intent_type"] = "listing"
+            intent["limit"] = 10
+        if self.re_vietnam.search(query):
+            intent["must_country"] = "Vietnam"
+        if self.re_safe.search(query):
+            intent["danger_level"] = "Non-venomous"
+        elif self.re_venom.search(query):
+            intent["danger_level"] = "Venomous"
+        return intent
+
+
+class RulesFastPath:
+    """IntentRules như HybridParser._fast_parse dùng: confidence dưới ngưỡng -> None (gọi LLM)."""
+
+    def __init__(self):
+        self.rules = IntentRules()
+
+    def fast_parse(self, query: str, min_confidence: float):
+        intent, confidence, _ = self.rules.parse(query)
+        return intent if confidence >= min_confidence else None
+
+
+def expected(label: dict) -> dict:
+    listing = label.get("intent_type") == "listing"
+    return {"intent_type": "listing" if listing else "detail", "limit": 10 if listing else 5,
+            "must_country": None, "must_not_country": None, "danger_level": None, **label}
+
+
+def evaluate(parser, corpus: list, min_confidence: float, repeat: int) -> dict:
+    covered, correct, wrong, fallbacks, latencies = 0, 0, [], [], []
+    for row in corpus:
+        t = time.perf_counter()
+        for _ in range(repeat):
+            intent = parser.fast_parse(row["q"], min_confidence)
+        latencies.append((time.perf_counter() - t) / repeat * 1e6)
+        if intent is None:
+            fallbacks.append(row["q"])
+            continue
+        covered += 1
+        want = expected(row["intent"])
+        if all(intent.get(f) == want[f] for f in FIELDS):
+            correct += 1
+        else:
+            wrong.append({"q": row["q"], "got": {f: intent.get(f) for f in FIELDS if intent.get(f) != want[f]},
+                          "want": {f: want[f] for f in FIELDS if intent.get(f) != want[f]}})
+    return {
+        "coverage": round(covered / len(corpus), 3),
+        "accuracy_on_fast_path": round(correct / covered, 3) if covered else None,
+        "correct_overall": round(correct / len(corpus), 3),
+        "parse_us": {p: round(percentile(latencies, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "wrong": wrong,
+        "fallbacks": fallbacks,
+    }
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default="intent_corpus.jsonl")
+    ap.add_argument("--min-confidence", type=float, default=0.7)
+    ap.add_argument("--repeat", type=int, default=200, help="số lần parse mỗi câu khi đo latency")
+    ap.add_argument("--show-fallbacks", action="store_true")
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    report = {"queries": len(corpus), "min_confidence": args.min_confidence}
+    for name, parser in (("legacy", LegacyRules()), ("rules", RulesFastPath())):
+        r = evaluate(parser, corpus, args.min_confidence, args.repeat)
+        if not args.show_fallbacks:
+            r["fallbacks"] = len(r["fallbacks"])
+        report[name] = r
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,85 @@
+"""So sánh đường extract MySQL cũ (subquery tương quan + fetchall + DataFrame) với extractor stream (JOIN gộp sẵn + fetchmany).
+
+    python bench_mysql.py
+    python bench_mysql.py --batch-size 1000 --repeat 3 --json bench_mysql.json
+
+Mỗi lần đo chạy trong một process con riêng để peak RSS (ru_maxrss) không bị lẫn giữa hai đường.
+"""
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def run_once(mode: str, batch_size: int) -> dict:
+    from mysql_source import fetch_taxonomy_legacy, iter_taxonomy
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    first_row = None
+    if mode == "legacy":
+        import pandas as pd
+        df = pd.DataFrame(fetch_taxonomy_legacy())
+        df = df.sort_values("scientific_name", kind="stable")
+        rows = len(df)
+        first_row = time.perf_counter() - t
+    else:
+        rows = 0
+        for batch in iter_taxonomy(batch_size):
+            if first_row is None:
+                first_row = time.perf_counter() - t
+            rows += len(batch)
+    wall = time.perf_counter() - t
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "rows": rows,
+        "wall_s": round(wall, 3),
+        "rows_per_s": round(rows / wall, 1) if wall else 0.0,
+        "first_batch_s": round(first_row or 0.0, 3),
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def run_child(mode: str, batch_size: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", mode, "--batch-size", str(batch_size)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch-size", type=int, default=500, help="fetchmany size của extractor stream")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    ap.add_argument("--child", choices=["legacy", "stream"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_once(args.child, args.batch_size)))
+        return
+
+    results = []
+    for _ in range(args.repeat):
+        for mode in ("legacy", "stream"):
+            results.append(run_child(mode, args.batch_size))
+
+    print(f"\n{'mode':<8}{'rows':>9}{'wall s':>9}{'rows/s':>11}{'1st batch s':>13}{'peak RSS MB':>13}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['rows']:>9}{r['wall_s']:>9}{r['rows_per_s']:>11}{r['first_batch_s']:>13}{r['peak_rss_mb']:>13}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,145 @@
+"""So sánh latency LocalSearchBackend (search_backend.py) với Elasticsearch trên cùng dữ liệu và cùng body query.
+
+    python bench_search.py --fixture 5000                     # corpus giả, chỉ backend local
+    python bench_search.py --fixture 5000 --es                # + nạp corpus vào index `snakes_bench` của ES
+    python bench_search.py --local local_index --es --index snakes   # index thật do `etl_snake.py --export-local` xuất
+
+Query = câu hỏi theo mẫu + vector của một document cộng nhiễu (không cần load model), filter quốc gia / độc tính ngẫu nhiên.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import main
+from bench_fakes import HashEmbedder, make_corpus, percentile
+from search_backend import LocalSearchBackend, write_local_index
+
+COUNTRIES = ["Vietnam", "Laos", "Thailand", "China", "Indonesia", "India"]
+
+
+def make_queries(backend: LocalSearchBackend, n: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        i = int(rng.integers(len(backend.docs)))
+        doc = backend.docs[i]
+        vec = backend.vectors[i] / backend.norms[i] + rng.normal(0, 0.02, backend.vectors.shape[1]).astype(np.float32)
+        name = doc.get("vietnamese_name") or doc.get("scientific_name")
+        question = pick.choice([f"{name} sống ở đâu", f"{name} có độc không", f"kể về {doc.get('scientific_name')}",
+                                "rắn độc ở việt nam"])
+        intent = {"intent_type": "detail", "limit": pick.choice([3, 5, 10])}
+        r = pick.random()
+        if r < 0.25:
+            intent["must_country"] = pick.choice(COUNTRIES)
+        elif r < 0.35:
+            intent["must_not_country"] = pick.choice(COUNTRIES)
+        if pick.random() < 0.2:
+            intent["danger_level"] = pick.choice(["Venomous", "Non-venomous"])
+        queries.append(main.build_es_query(question, intent, vec.astype(np.float32)))
+    return queries
+
+
+async def run(client, index: str, queries: list, concurrency: int):
+    latencies, ids = [None] * len(queries), [None] * len(queries)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(n, body):
+        async with sem:
+            t = time.perf_counter()
+            res = await client.search(index=index, body=body)
+            latencies[n] = (time.perf_counter() - t) * 1000
+            ids[n] = [h["_id"] for h in res["hits"]["hits"]]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n, b) for n, b in enumerate(queries)))
+    wall = time.perf_counter() - started
+    return {
+        "qps": round(len(queries) / wall, 1),
+        "latency_ms": {p: round(percentile(latencies, q), 3) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+    }, ids
+
+
+def index_fixture_into_es(host: str, index: str, docs: list):
+    from elasticsearch import Elasticsearch, helpers
+    from etl_snake import INDEX_MAPPING
+
+    es = Elasticsearch(host, verify_certs=False, ssl_show_warn=False)
+    es.options(ignore_status=404).indices.delete(index=index)
+    es.indices.create(index=index, body=INDEX_MAPPING)
+    helpers.bulk(es, ({"_index": index, "_id": d["_id"],
+                       "_source": {**{k: v for k, v in d.items() if k != "_id"},
+                                   "vector_embedding": np.asarray(d["vector_embedding"]).tolist()}} for d in docs))
+    es.indices.refresh(index=index)
+    es.close()
+
+
+async def bench(args) -> dict:
+    report = {}
+    tmp = None
+    if args.fixture:
+        docs = make_corpus(args.fixture, embedder=HashEmbedder(dims=main.EMBEDDING_DIMS))
+        tmp = tempfile.mkdtemp(prefix="local_index_")
+        write_local_index(os.path.join(tmp, "idx"), docs, main.EMBEDDING_DIMS, meta={"index": args.index})
+        path = os.path.join(tmp, "idx")
+        if args.es:
+            index_fixture_into_es(args.es_host, args.index, docs)
+    else:
+        path = args.local
+
+    t = time.perf_counter()
+    local = LocalSearchBackend.load(path)
+    report["local_load_s"] = round(time.perf_counter() - t, 3)
+    report["local"] = local.stats()
+    queries = make_queries(local, args.queries, args.seed)
+
+    report["local_search"], local_ids = await run(local, args.index, queries, args.concurrency)
+    if args.es:
+        from elasticsearch import AsyncElasticsearch
+
+        es = AsyncElasticsearch(args.es_host, verify_certs=False, ssl_show_warn=False, request_timeout=30)
+        try:
+            await run(es, args.index, queries[: min(50, len(queries))], args.concurrency)  # warm-up
+            report["es_search"], es_ids = await run(es, args.index, queries, args.concurrency)
+        finally:
+            await es.close()
+        overlap = [len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(local_ids, es_ids) if b]
+        report["top_k_overlap_with_es"] = round(float(np.mean(overlap)), 3) if overlap else None
+    if tmp:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return report
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--fixture", type=int, help="số document giả")
+    src.add_argument("--local", help="thư mục index local đã xuất")
+    ap.add_argument("--es", action="store_true", help="đo cả Elasticsearch")
+    ap.add_argument("--es-host", default=os.getenv("ES_HOST", "http://localhost:9200"))
+    ap.add_argument("--index", default="snakes_bench")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    report = asyncio.run(bench(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,142 @@
+"""So sánh các storage profile của etl_snake.py (default / compact / bbq) trên corpus giả, cần một Elasticsearch local.
+
+    python bench_storage.py --docs 20000
+    python bench_storage.py --docs 5000 --profiles default compact --queries 500 --json bench_storage.json
+
+Mỗi profile: index riêng `snakes_bench_<profile>` -> force-merge -> kích thước (tổng + theo field qua _disk_usage),
+heap/segment, latency knn p50/p95/p99, recall@k so với top-k chính xác (numpy, float32), byte _source trả về mỗi hit.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+from main import LISTING_SOURCE
+from bench_fakes import make_corpus, percentile
+from etl_snake import EMBEDDING_DIMS, VECTOR_INDEX_OPTIONS, index_mapping, snippet_fields
+
+# _source mà ask_snake lấy với mapping cũ
+LEGACY_SOURCE = ["scientific_name", "vietnamese_name", "family", "danger_level", "countries", "wiki_biology", "wiki_venom"]
+
+
+def fixture(n: int, dims: int, seed: int):
+    """Corpus theo schema thật; vector = cụm Gauss đã chuẩn hoá (corpus giả lặp tên nên không dùng HashEmbedder)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 50), dims)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)] + rng.normal(scale=0.35, size=(n, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    docs = make_corpus(n, embedder=_NullEmbedder(dims))
+    for d, v in zip(docs, vectors):
+        d["vector_embedding"] = v
+        d.update(snippet_fields({"biology": d["wiki_biology"], "venom": d["wiki_venom"]}))
+    return docs, vectors
+
+
+class _NullEmbedder:
+    def __init__(self, dims: int):
+        self.dims = dims
+
+    def encode(self, text):
+        return np.zeros(self.dims, dtype=np.float32)
+
+
+def build(es: Elasticsearch, index: str, profile: str, docs: list) -> dict:
+    es.options(ignore_status=404).indices.delete(index=index)
+    es.indices.create(index=index, body={**index_mapping(profile),
+                                         "settings": {"index": {"number_of_replicas": 0, "refresh_interval": "-1"}}})
+    t = time.perf_counter()
+    helpers.bulk(es, ({"_index": index, "_id": d["_id"],
+                       "_source": {**{k: v for k, v in d.items() if k != "_id"},
+                                   "vector_embedding": d["vector_embedding"].tolist()}} for d in docs),
+                 chunk_size=500, request_timeout=600)
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=1800)
+    build_s = time.perf_counter() - t
+
+    stats = es.indices.stats(index=index, metric="store,segments")["indices"][index]["primaries"]
+    out = {
+        "build_s": round(build_s, 1),
+        "store_mb": round(stats["store"]["size_in_bytes"] / 1024 / 1024, 2),
+        "segments": stats["segments"]["count"],
+        "segments_memory_kb": round(stats["segments"].get("memory_in_bytes", 0) / 1024, 1),
+    }
+    try:
+        usage = es.indices.disk_usage(index=index, run_expensive_tasks=True)[index]["fields"]
+        out["field_mb"] = {f: round(v["total_in_bytes"] / 1024 / 1024, 2) for f, v in usage.items()
+                           if f in ("vector_embedding", "_source", "full_text_context", "wiki_biology")}
+    except Exception as e:  # _disk_usage là API technical preview
+        out["field_mb"] = f"unavailable: {e}"
+    return out
+
+
+def heap_used_mb(es: Elasticsearch) -> float:
+    nodes = es.nodes.stats(metric="jvm")["nodes"]
+    return round(sum(n["jvm"]["mem"]["heap_used_in_bytes"] for n in nodes.values()) / 1024 / 1024, 1)
+
+
+def query(es: Elasticsearch, index: str, ids: list, vectors: np.ndarray, queries: np.ndarray, k: int, source: list) -> dict:
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    latencies, recalls, hit_bytes = [], [], []
+    for n, q in enumerate(queries):
+        body = {"size": k, "_source": source,
+                "knn": {"field": "vector_embedding", "query_vector": q.tolist(), "k": k, "num_candidates": 100}}
+        t = time.perf_counter()
+        res = es.search(index=index, body=body)
+        latencies.append((time.perf_counter() - t) * 1000)
+        hits = res["hits"]["hits"]
+        got = {h["_id"] for h in hits}
+        recalls.append(len(got & {ids[i] for i in exact[n]}) / k)
+        hit_bytes.extend(len(json.dumps(h["_source"], ensure_ascii=False).encode()) for h in hits)
+    return {
+        "latency_ms": {p: round(percentile(latencies, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "source_bytes_per_hit": round(float(np.mean(hit_bytes)), 1) if hit_bytes else 0.0,
+    }
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--es-host", default=os.getenv("ES_HOST", "http://localhost:9200"))
+    ap.add_argument("--docs", type=int, default=10000)
+    ap.add_argument("--profiles", nargs="+", default=list(VECTOR_INDEX_OPTIONS), choices=list(VECTOR_INDEX_OPTIONS))
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--keep", action="store_true", help="giữ lại các index bench")
+    ap.add_argument("--json", help="ghi report JSON ra file")
+    args = ap.parse_args()
+
+    es = Elasticsearch(args.es_host, verify_certs=False, ssl_show_warn=False, request_timeout=60)
+    docs, vectors = fixture(args.docs, EMBEDDING_DIMS, args.seed)
+    ids = [d["_id"] for d in docs]
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(len(docs), size=args.queries)
+    queries = vectors[picks] + rng.normal(scale=0.05, size=(args.queries, EMBEDDING_DIMS)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    report = {"docs": args.docs, "dims": EMBEDDING_DIMS, "profiles": {}}
+    for profile in args.profiles:
+        index = f"snakes_bench_{profile}"
+        print(f"⏳ {profile}: indexing {args.docs} docs...")
+        r = build(es, index, profile, docs)
+        heap_before = heap_used_mb(es)
+        query(es, index, ids, vectors, queries[: min(50, len(queries))], args.k, LISTING_SOURCE)  # warm-up (load HNSW graph)
+        # default = mapping cũ -> đo với _source cũ (wiki_* đầy đủ) để so sánh byte/hit
+        r["search"] = query(es, index, ids, vectors, queries, args.k, LEGACY_SOURCE if profile == "default" else LISTING_SOURCE)
+        r["heap_used_mb"] = {"before_queries": heap_before, "after_queries": heap_used_mb(es)}
+        report["profiles"][profile] = r
+        if not args.keep:
+            es.indices.delete(index=index)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,420 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger("snake_rag")
+
+
+def cache_key(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def to_float32(vector) -> np.ndarray:
+    """Lưu embedding dạng float32 liền mạch (~4 KB / 1024 dims thay vì ~30 KB list float)."""
+    return np.ascontiguousarray(vector, dtype=np.float32)
+
+
+def estimate_size(value: Any) -> int:
+    """Ước lượng số byte của một entry (đủ chính xác cho việc giới hạn bộ nhớ)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+# --- CODEC (chỉ dùng cho backend chia sẻ, cần serialize ra bytes) ---
+class JsonCodec:
+    @staticmethod
+    def dumps(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode()
+
+    @staticmethod
+    def loads(raw: bytes):
+        return json.loads(raw)
+
+
+class VectorCodec:
+    @staticmethod
+    def dumps(value) -> bytes:
+        return to_float32(value).tobytes()
+
+    @staticmethod
+    def loads(raw: bytes):
+        return np.frombuffer(raw, dtype=np.float32)
+
+
+class CacheBackend:
+    """Interface chung: get/set/stats. LRUCache là bản in-process, SQLiteCache/RedisCache là bản chia sẻ giữa các worker."""
+
+    name = "base"
+
+    def get(self, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Cache LRU có giới hạn số entry, giới hạn byte và TTL tuỳ chọn."""
+
+    def __init__(self, name: str, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[2] is None or entry[2] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SQLiteCache(CacheBackend):
+    """Cache dạng file SQLite (WAL) dùng chung cho mọi worker trên cùng máy. Eviction: TTL + FIFO theo max_entries."""
+
+    TRIM_EVERY = 256
+
+    def __init__(self, name: str, path: str, codec, max_entries: int = 100000, ttl: Optional[float] = None):
+        self.name = name
+        self.codec = codec
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (ns TEXT, key TEXT, value BLOB, expires_at REAL, created_at REAL, "
+            "PRIMARY KEY (ns, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created ON cache (ns, created_at)")
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str, default=None):
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE ns = ? AND key = ?", (self.name, key)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"⚠️ SQLite cache '{self.name}' read error: {e}")
+            return default
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.codec.loads(row[0])
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            raw = self.codec.dumps(value)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (ns, key, value, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.name, key, raw, now + ttl if ttl else None, now),
+                )
+                self._writes += 1
+                if self._writes % self.TRIM_EVERY == 0:
+                    self._trim(now)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"⚠️ SQLite cache '{self.name}' write error: {e}")
+
+    def _trim(self, now: float):
+        self._conn.execute("DELETE FROM cache WHERE ns = ? AND expires_at IS NOT NULL AND expires_at <= ?", (self.name, now))
+        self._conn.execute(
+            "DELETE FROM cache WHERE ns = ? AND key IN ("
+            "SELECT key FROM cache WHERE ns = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.max_entries),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache WHERE ns = ?", (self.name,)).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class RedisCache(CacheBackend):
+    """Cache qua giao thức Redis. `client` chỉ cần get/set(ex=) nên test có thể truyền một stand-in local."""
+
+    def __init__(self, name: str, codec, url: Optional[str] = None, client=None, ttl: Optional[float] = None):
+        if client is None:
+            import redis  # optional dependency, chỉ cần khi CACHE_BACKEND=redis
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0", socket_timeout=0.2)
+        self.name = name
+        self.codec = codec
+        self.client = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"snake_rag:{self.name}:{key}"
+
+    def get(self, key: str, default=None):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ Redis cache '{self.name}' read error: {e}")
+            return default
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.codec.loads(raw)
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self.client.set(self._key(key), self.codec.dumps(value), ex=int(ttl) if ttl else None)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ Redis cache '{self.name}' write error: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class TieredCache(CacheBackend):
+    """LRU local phía trước + backend chia sẻ phía sau. Hit ở tầng chia sẻ được đẩy ngược vào local."""
+
+    def __init__(self, local: LRUCache, shared: CacheBackend):
+        self.name = local.name
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        self.shared.set(key, value, ttl)
+
+    def stats(self) -> dict:
+        return {"local": self.local.stats(), "shared": self.shared.stats()}
+
+
+def build_cache(name: str, codec, max_entries: int, max_bytes: int, ttl: Optional[float] = None) -> CacheBackend:
+    """Tạo cache theo CACHE_BACKEND: memory (mặc định) | sqlite | redis."""
+    local = LRUCache(name, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return local
+    try:
+        if backend == "sqlite":
+            shared = SQLiteCache(name, os.getenv("CACHE_SQLITE_PATH", "snake_cache.db"), codec,
+                                 max_entries=int(os.getenv("CACHE_SHARED_MAX_ENTRIES", "200000")), ttl=ttl)
+        elif backend == "redis":
+            shared = RedisCache(name, codec, url=os.getenv("REDIS_URL"), ttl=ttl)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND '{backend}'")
+    except Exception as e:
+        logger.error(f"❌ Shared cache '{name}' unavailable ({e}), falling back to in-process LRU")
+        return local
+    return TieredCache(local, shared)
+
+
+class SemanticCache:
+    """Cache câu trả lời theo embedding: trả về entry có cosine >= threshold và cùng bộ filter đã parse.
+
+    Index là ma trận float32 đã chuẩn hoá (capacity x dims) nên lookup chỉ là một phép nhân ma trận-vector.
+    """
+
+    def __init__(self, capacity: int = 2000, threshold: float = 0.95, ttl: Optional[float] = None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None
+        self._filter_ids = np.full(capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._expires = np.full(capacity, np.inf, dtype=np.float64)
+        self._values: list = [None] * capacity
+        self._filter_index: dict = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def filter_key(intent: dict) -> str:
+        keys = ("intent_type", "limit", "must_country", "must_not_country", "danger_level")
+        return json.dumps([intent.get(k) for k in keys])
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = to_float32(vector).ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def get(self, vector, intent: dict):
+        """Trả về (value, similarity) hoặc (None, best_similarity)."""
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            fid = self._filter_index.get(self.filter_key(intent))
+            if fid is None or self._vectors is None:
+                self.misses += 1
+                return None, 0.0
+            idx = np.flatnonzero((self._filter_ids == fid) & (self._expires > now))
+            if idx.size == 0:
+                self.misses += 1
+                return None, 0.0
+            sims = self._vectors[idx] @ q
+            best = int(np.argmax(sims))
+            sim = float(sims[best])
+            if sim < self.threshold:
+                self.misses += 1
+                return None, sim
+            slot = idx[best]
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot], sim
+
+    def set(self, vector, intent: dict, value):
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+            fkey = self.filter_key(intent)
+            fid = self._filter_index.setdefault(fkey, len(self._filter_index))
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                # Ưu tiên slot đã hết hạn, sau đó tới slot ít dùng gần đây nhất
+                expired = np.flatnonzero(self._expires <= now)
+                slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[slot] = q
+            self._filter_ids[slot] = fid
+            self._last_used[slot] = now
+            self._expires[slot] = now + self.ttl if self.ttl else np.inf
+            self._values[slot] = value
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
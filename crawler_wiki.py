@@ -1,34 +1,40 @@
-import pymongo
-import mysql.connector
-import wikipediaapi
-import time
+import re
 import os
+import time
+import asyncio
 import logging
+import argparse
+from typing import Dict, List, Optional
+
+import httpx
+import pymongo
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+from ratelimit import TokenBucket
+from mysql_source import get_mysql_connection
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
 # Cấu hình Mongo
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-mongo_client = pymongo.MongoClient(MONGO_URI)
-db_mongo = mongo_client["snake_raw_data"]
-col_wiki = db_mongo["wiki_articles"]
-
-# Cấu hình Wiki
-wiki_vi = wikipediaapi.Wikipedia(user_agent='SnakeBot/1.0', language='vi')
-wiki_en = wikipediaapi.Wikipedia(user_agent='SnakeBot/1.0', language='en')
-
-# --- HÀM KẾT NỐI MYSQL (CỦA BẠN) ---
-def get_mysql_connection():
-    return mysql.connector.connect(
-        host=os.getenv("MYSQL_HOST", "localhost"),
-        port=os.getenv("MYSQL_PORT", "3306"),
-        user=os.getenv("MYSQL_USER", "root"),
-        password=os.getenv("MYSQL_PASSWORD", ""),
-        database=os.getenv("MYSQL_DB", "snake_db")
-    )
+
+# Cấu hình Wiki: gọi thẳng MediaWiki API; WIKI_API có thể trỏ tới server giả (bench_crawler.py)
+WIKI_API = os.getenv("WIKI_API", "https://{lang}.wikipedia.org/w/api.php")
+USER_AGENT = os.getenv("WIKI_USER_AGENT", "SnakeBot/1.0")
+LANGS = ("vi", "en")  # thứ tự ưu tiên
+# Giới hạn toàn cục cho mọi request (cả vi lẫn en), không phải theo từng worker
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "5"))
+CRAWL_BURST = float(os.getenv("CRAWL_BURST", "5"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+# Bài cào trước quá số ngày này sẽ được kiểm tra revision, đổi thì cào lại
+REFRESH_DAYS = float(os.getenv("CRAWL_REFRESH_DAYS", "30"))
+BULK_SIZE = int(os.getenv("CRAWL_BULK_SIZE", "100"))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+REVISION_BATCH = 50  # MediaWiki cho tối đa 50 titles mỗi query
+
+_HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.M)
 
 def get_snake_names():
     """Lấy danh sách tên khoa học từ MySQL"""
@@ -40,10 +46,10 @@ def get_snake_names():
         # Lấy genus và species để ghép lại
         cursor.execute("SELECT DISTINCT genus, species FROM tax__subspecies")
         rows = cursor.fetchall()
-        
+
         for r in rows:
             names.append(f"{r[0]} {r[1]}")
-            
+
         conn.close()
         logging.info(f"Found {len(names)} species in DB.")
         return names
@@ -51,51 +57,220 @@ def get_snake_names():
         logging.error(f"❌ Error connecting to MySQL: {e}")
         return []
 
-def run_crawler():
-    snakes = get_snake_names()
-    if not snakes:
-        return
+def split_sections(text: str):
+    """Tách extract dạng plain text (exsectionformat=wiki) thành (summary, {tiêu đề mục cấp 2: nội dung})."""
+    matches = list(_HEADING.finditer(text))
+    summary = (text[:matches[0].start()] if matches else text).strip()
+    sections = {}
+    for i, m in enumerate(matches):
+        if len(m.group(1)) != 2:
+            continue
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections[m.group(2)] = text[m.end():end].strip()
+    return summary, sections
 
-    logging.info(f"🚀 Starting Wiki Crawler for {len(snakes)} species...")
+def build_doc(name: str, lang: str, page: dict) -> dict:
+    summary, sections = split_sections(page["text"])
+    return {
+        "scientific_name": name,
+        "found": True,
+        "language": lang,
+        "title": page["title"],
+        "revision_id": page["revision_id"],
+        "url": page["url"],
+        "summary": summary[0:2000],
+        "full_text": page["text"][0:5000], # Giới hạn 5000 ký tự raw
+        "sections": {title: text[0:1500] for title, text in sections.items()},
+        "processed": False, # Flag để AI xử lý sau
+        "last_scraped": time.time()
+    }
 
-    for name in tqdm(snakes):
-        # 1. Kiểm tra xem đã cào chưa (Tránh spam)
-        if col_wiki.find_one({"scientific_name": name}):
-            continue
+class WikiClient:
+    """MediaWiki API bất đồng bộ: mọi request đi qua một TokenBucket chung, retry 429/5xx (tôn trọng Retry-After)."""
+
+    def __init__(self, client: httpx.AsyncClient, limiter: TokenBucket, api: str = WIKI_API, max_retries: int = 4):
+        self.client = client
+        self.limiter = limiter
+        self.api = api
+        self.max_retries = max_retries
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    async def _get(self, lang: str, params: dict) -> dict:
+        params = {"action": "query", "format": "json", "formatversion": "2", "redirects": "1", **params}
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            self.requests += 1
+            try:
+                r = await self.client.get(self.api.format(lang=lang), params=params)
+                if r.status_code == 200:
+                    return r.json()
+                if r.status_code not in RETRY_STATUS:
+                    r.raise_for_status()
+                error = RuntimeError(f"HTTP {r.status_code} from {lang} wiki")
+                if r.status_code == 429:
+                    self.throttled += 1
+                    try:
+                        retry_after = float(r.headers.get("Retry-After", "0"))
+                    except ValueError:
+                        retry_after = 0.0
+                    # Chặn cả bucket, không chỉ request này
+                    self.limiter.penalize(retry_after or 1.0)
+            except httpx.TransportError as e:
+                error = e
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt))
+        raise error
+
+    async def page(self, lang: str, title: str) -> Optional[dict]:
+        data = await self._get(lang, {"prop": "extracts|info", "inprop": "url", "explaintext": "1",
+                                      "exsectionformat": "wiki", "titles": title})
+        pages = data.get("query", {}).get("pages", [])
+        if not pages or pages[0].get("missing") or pages[0].get("invalid"):
+            return None
+        p = pages[0]
+        return {"title": p["title"], "url": p.get("fullurl"), "revision_id": p.get("lastrevid"),
+                "text": p.get("extract") or ""}
 
-        # 2. Thử Wiki Tiếng Việt trước
-        page = wiki_vi.page(name)
-        lang = 'vi'
-        
-        # 3. Nếu không có, thử Tiếng Anh
-        if not page.exists():
-            page = wiki_en.page(name)
-            lang = 'en'
-
-        # 4. Lưu dữ liệu
-        if page.exists():
-            # Lấy text từng mục (sections)
-            sections_data = {s.title: s.text[0:1500] for s in page.sections}
-            
-            data = {
-                "scientific_name": name,
-                "language": lang,
-                "url": page.fullurl,
-                "summary": page.summary[0:2000],
-                "full_text": page.text[0:5000], # Giới hạn 5000 ký tự raw
-                "sections": sections_data,
-                "processed": False, # Flag để AI xử lý sau
-                "last_scraped": time.time()
-            }
-            col_wiki.insert_one(data)
+    async def revisions(self, lang: str, titles: List[str]) -> Dict[str, Optional[int]]:
+        """lastrevid hiện tại của nhiều trang (50 title / request); None = trang không còn."""
+        out = {}
+        for i in range(0, len(titles), REVISION_BATCH):
+            chunk = titles[i:i + REVISION_BATCH]
+            data = await self._get(lang, {"prop": "info", "titles": "|".join(chunk)})
+            query = data.get("query", {})
+            # title gửi đi -> title sau khi chuẩn hoá / redirect
+            alias = {t: t for t in chunk}
+            for key in ("normalized", "redirects"):
+                for m in query.get(key, []):
+                    for t, target in alias.items():
+                        if target == m["from"]:
+                            alias[t] = m["to"]
+            revs = {p["title"]: (None if p.get("missing") else p.get("lastrevid")) for p in query.get("pages", [])}
+            out.update({t: revs.get(target) for t, target in alias.items()})
+        return out
+
+    async def species(self, name: str):
+        """Tra vi và en song song, ưu tiên vi. Trả về (lang, page) hoặc (None, None)."""
+        pages = await asyncio.gather(*(self.page(lang, name) for lang in LANGS))
+        for lang, page in zip(LANGS, pages):
+            if page is not None:
+                return lang, page
+        return None, None
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "retries": self.retries, "throttled": self.throttled}
+
+class MongoBulkWriter:
+    """Gom UpdateOne rồi bulk_write (unordered) mỗi `size` thao tác, chạy ngoài event loop."""
+
+    def __init__(self, collection, size: int = BULK_SIZE):
+        self.collection = collection
+        self.size = size
+        self.ops = []
+        self.written = 0
+
+    async def add(self, name: str, fields: dict):
+        self.ops.append(pymongo.UpdateOne({"scientific_name": name}, {"$set": fields}, upsert=True))
+        if len(self.ops) >= self.size:
+            await self.flush()
+
+    async def flush(self):
+        ops, self.ops = self.ops, []
+        if ops:
+            await asyncio.to_thread(self.collection.bulk_write, ops, ordered=False)
+            self.written += len(ops)
+
+def load_existing(collection) -> Dict[str, dict]:
+    """Nạp trạng thái mọi bài đã cào bằng một query (thay vì find_one cho từng loài)."""
+    projection = {"_id": 0, "scientific_name": 1, "found": 1, "language": 1, "title": 1, "revision_id": 1, "last_scraped": 1}
+    return {doc["scientific_name"]: doc for doc in collection.find({}, projection)}
+
+async def crawl(names: List[str], existing: Dict[str, dict], writer, wiki: WikiClient,
+                concurrency: int = CRAWL_CONCURRENCY, refresh_days: float = REFRESH_DAYS) -> dict:
+    stats = {"new": 0, "found_vi": 0, "found_en": 0, "not_found": 0, "refreshed": 0, "unchanged": 0, "errors": 0}
+    cutoff = time.time() - refresh_days * 86400
+    todo = [n for n in names if n not in existing]
+    stale = [existing[n] for n in names if n in existing and (existing[n].get("last_scraped") or 0) < cutoff]
+
+    # 1. Bài cũ đã có revision: hỏi lastrevid theo lô, chỉ cào lại trang đã đổi
+    by_lang = {}
+    for doc in stale:
+        if doc.get("found", True) and doc.get("revision_id") and doc.get("title"):
+            by_lang.setdefault(doc["language"], []).append(doc)
         else:
-            # Ghi nhận là không tìm thấy
-            col_wiki.insert_one({"scientific_name": name, "found": False})
-        
-        # 5. Rate Limiting (Quan trọng)
-        time.sleep(1)
+            todo.append(doc["scientific_name"])  # chưa tìm thấy / bản ghi cũ không có revision -> cào lại
+    for lang, docs in by_lang.items():
+        try:
+            current = await wiki.revisions(lang, [d["title"] for d in docs])
+        except Exception as e:
+            logging.error(f"❌ Revision check ({lang}) failed: {e}")
+            stats["errors"] += len(docs)
+            continue
+        for d in docs:
+            if current.get(d["title"]) == d["revision_id"]:
+                stats["unchanged"] += 1
+                await writer.add(d["scientific_name"], {"last_scraped": time.time()})
+            else:
+                todo.append(d["scientific_name"])
+    refresh = set(existing) & set(todo)
+
+    logging.info(f"🚀 Crawling {len(todo)} species ({len(refresh)} refreshes, {stats['unchanged']} unchanged)...")
+    queue: asyncio.Queue = asyncio.Queue()
+    for name in todo:
+        queue.put_nowait(name)
+    progress = tqdm(total=len(todo))
+
+    async def worker():
+        while not queue.empty():
+            name = queue.get_nowait()
+            try:
+                lang, page = await wiki.species(name)
+            except Exception as e:
+                logging.warning(f"⚠️ {name}: {e}")
+                stats["errors"] += 1
+            else:
+                if page is not None:
+                    stats[f"found_{lang}"] += 1
+                    await writer.add(name, build_doc(name, lang, page))
+                else:
+                    # Ghi nhận là không tìm thấy (có last_scraped để lần sau thử lại khi quá hạn)
+                    stats["not_found"] += 1
+                    await writer.add(name, {"scientific_name": name, "found": False, "last_scraped": time.time()})
+                stats["refreshed" if name in refresh else "new"] += 1
+            progress.update(1)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await writer.flush()
+    progress.close()
+    return stats
+
+async def run_crawler(concurrency: int = CRAWL_CONCURRENCY, rate: float = CRAWL_RATE, refresh_days: float = REFRESH_DAYS):
+    snakes = get_snake_names()
+    if not snakes:
+        return
+
+    mongo_client = pymongo.MongoClient(MONGO_URI)
+    col_wiki = mongo_client["snake_raw_data"]["wiki_articles"]
+    col_wiki.create_index([("scientific_name", pymongo.ASCENDING)], name="scientific_name_1")
+    existing = load_existing(col_wiki)
 
-    logging.info("✅ Crawler Finished.")
+    started = time.perf_counter()
+    limiter = TokenBucket(rate, burst=CRAWL_BURST)
+    async with httpx.AsyncClient(headers={"User-Agent": USER_AGENT}, timeout=30,
+                                 limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+        wiki = WikiClient(client, limiter)
+        stats = await crawl(snakes, existing, MongoBulkWriter(col_wiki), wiki, concurrency, refresh_days)
+    wall = time.perf_counter() - started
+    logging.info(f"✅ Crawler Finished in {wall:.1f}s. {stats} | {wiki.stats()} | {limiter.stats()}")
 
 if __name__ == "__main__":
-    run_crawler()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Wikipedia crawler (async, rate-limited)")
+    ap.add_argument("--concurrency", type=int, default=CRAWL_CONCURRENCY)
+    ap.add_argument("--rate", type=float, default=CRAWL_RATE, help="request/giây, tính chung cho mọi worker")
+    ap.add_argument("--refresh-days", type=float, default=REFRESH_DAYS)
+    args = ap.parse_args()
+    asyncio.run(run_crawler(args.concurrency, args.rate, args.refresh_days))
@@ -0,0 +1,457 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger("snake_rag")
+
+
+class EmbedQueueFull(Exception):
+    pass
+
+
+class DirectEmbedder:
+    """Mỗi request một lần encode trong thread pool (hành vi cũ)."""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray]):
+        self.encode_fn = encode_fn
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def encode(self, text: str) -> np.ndarray:
+        return (await run_in_threadpool(self.encode_fn, [text]))[0]
+
+    async def encode_many(self, texts: List[str]) -> np.ndarray:
+        return await run_in_threadpool(self.encode_fn, texts)
+
+    def stats(self) -> dict:
+        return {"mode": "direct"}
+
+
+class EmbedBatcher:
+    """Gom các câu hỏi đến trong cùng một cửa sổ ngắn (hoặc tới max_batch) rồi encode bằng một lần gọi model.
+
+    `concurrency`: số batch encode cùng lúc (= số worker process của EmbedWorkerPool); batch sau được gom
+    trong lúc batch trước đang encode, chỉ chờ khi mọi worker đều bận."""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch: int = 32,
+                 window_ms: float = 5.0, max_queue: int = 256, concurrency: int = 1):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.max_queue = max_queue
+        self.concurrency = max(1, concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight = set()
+        # Metrics
+        self.peak_inflight = 0
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.rejected = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.encode_time_total = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._inflight) if t]
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
+            try:
+                await t
+            except asyncio.CancelledError:
+                pass
+        # Không để request nào treo khi shutdown
+        while self._queue and not self._queue.empty():
+            _, fut, _ = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Embedder stopped"))
+
+    async def encode(self, text: str) -> np.ndarray:
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, fut, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise EmbedQueueFull(f"Embedding queue full ({self.max_queue})")
+        return await fut
+
+    async def encode_many(self, texts: List[str]) -> np.ndarray:
+        # Batch đã có sẵn (VD: batch endpoint) -> encode thẳng, không qua hàng đợi
+        return await run_in_threadpool(self.encode_fn, texts)
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Chỉ gom batch mới khi còn worker rảnh; request đến trong lúc chờ vẫn nằm trong hàng đợi
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # Bỏ các request đã bị huỷ (client ngắt kết nối) trước khi tốn CPU
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._encode_batch(batch))
+            self._inflight.add(task)
+            self.peak_inflight = max(self.peak_inflight, len(self._inflight))
+            task.add_done_callback(self._inflight.discard)
+
+    async def _encode_batch(self, batch: list):
+        try:
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                delay = started - enqueued
+                self.queue_delay_total += delay
+                self.queue_delay_max = max(self.queue_delay_max, delay)
+            try:
+                vectors = await run_in_threadpool(self.encode_fn, [text for text, _, _ in batch])
+            except Exception as e:
+                logger.error(f"❌ Batch embedding error: {e}")
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            self.encode_time_total += time.perf_counter() - started
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for (_, fut, _), vec in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(vec)
+        except asyncio.CancelledError:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(RuntimeError("Embedder stopped"))
+            raise
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "mode": "batched",
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "concurrency": self.concurrency,
+            "inflight_batches": len(self._inflight),
+            "peak_inflight_batches": self.peak_inflight,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "rejected": self.rejected,
+            "avg_queue_delay_ms": round(self.queue_delay_total / self.items * 1000, 3) if self.items else 0.0,
+            "max_queue_delay_ms": round(self.queue_delay_max * 1000, 3),
+            "avg_encode_ms": round(self.encode_time_total / self.batches * 1000, 3) if self.batches else 0.0,
+        }
+
+
+# --- MODEL LOADING ---
+def load_sentence_transformer(name_or_path: str, backend: str = "torch", onnx_file: Optional[str] = None,
+                              device: Optional[str] = None):
+    """Load model từ hub hoặc bản lưu local; backend onnx/openvino (sentence-transformers>=3.2) khởi động nhanh hơn trên CPU."""
+    from sentence_transformers import SentenceTransformer
+
+    kwargs = {}
+    if device:
+        kwargs["device"] = device
+    if backend and backend != "torch":
+        kwargs["backend"] = backend
+        if onnx_file:
+            # VD: onnx/model_qint8_avx512_vnni.onnx (bản quantized)
+            kwargs["model_kwargs"] = {"file_name": onnx_file}
+    return SentenceTransformer(name_or_path, **kwargs)
+
+
+# --- WORKER PROCESS POOL ---
+def _embed_worker_main(model_name: str, backend: str, onnx_file: Optional[str], shm_name: str, capacity: int,
+                       dims: int, conn, num_threads: int):
+    """Tiến trình con: load model một lần, ghi vector vào shared memory, chỉ gửi số dòng qua pipe."""
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = load_sentence_transformer(model_name, backend=backend, onnx_file=onnx_file, device="cpu")
+    shm = shared_memory.SharedMemory(name=shm_name)
+    out = np.ndarray((capacity, dims), dtype=np.float32, buffer=shm.buf)
+    conn.send(("ready", model.get_sentence_embedding_dimension()))
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == "stop":
+                break
+            if msg[0] == "ping":
+                conn.send(("pong",))
+                continue
+            texts = msg[1]
+            try:
+                vectors = model.encode(texts, batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True)
+                out[:len(texts)] = vectors
+                conn.send(("ok", len(texts)))
+            except Exception as e:
+                conn.send(("error", repr(e)))
+    finally:
+        del out
+        shm.close()
+
+
+class EmbedWorkerError(Exception):
+    pass
+
+
+class _EmbedWorker:
+    def __init__(self, idx: int, pool: "EmbedWorkerPool"):
+        self.idx = idx
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.proc = None
+        self.conn = None
+        self.shm = None
+        self.out = None
+        self.calls = 0
+        # dead: process hỏng, chờ health loop khởi động lại (không nhận request); queued: đang nằm trong pool._idle
+        self.dead = False
+        self.queued = False
+
+    def spawn(self):
+        pool = self.pool
+        self.shm = shared_memory.SharedMemory(create=True, size=pool.capacity * pool.dims * 4)
+        self.out = np.ndarray((pool.capacity, pool.dims), dtype=np.float32, buffer=self.shm.buf)
+        parent_conn, child_conn = pool.ctx.Pipe()
+        self.proc = pool.ctx.Process(
+            target=_embed_worker_main,
+            args=(pool.model_name, pool.backend, pool.onnx_file, self.shm.name, pool.capacity, pool.dims, child_conn, pool.threads_per_worker),
+            daemon=True,
+            name=f"embed-worker-{self.idx}",
+        )
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def wait_ready(self, timeout: float):
+        if not self.conn.poll(timeout):
+            raise EmbedWorkerError(f"Worker {self.idx} not ready after {timeout}s")
+        msg = self.conn.recv()
+        if msg[0] != "ready" or msg[1] != self.pool.dims:
+            raise EmbedWorkerError(f"Worker {self.idx} bad handshake: {msg}")
+
+    def shutdown(self):
+        try:
+            if self.proc and self.proc.is_alive():
+                self.conn.send(("stop",))
+                self.proc.join(2)
+        except (OSError, EOFError):
+            pass
+        if self.proc and self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(1)
+        if self.conn:
+            self.conn.close()
+        if self.shm:
+            self.out = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def restart(self):
+        logger.warning(f"♻️ Restarting embedding worker {self.idx}")
+        self.shutdown()
+        self.spawn()
+        self.wait_ready(self.pool.startup_timeout)
+        self.pool.restarts += 1
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        try:
+            self.conn.send(("encode", texts))
+            if not self.conn.poll(self.pool.call_timeout):
+                raise EmbedWorkerError(f"Worker {self.idx} timed out")
+            msg = self.conn.recv()
+        except (EOFError, OSError, EmbedWorkerError) as e:
+            # Không khởi động lại ở đây (load model mất tới startup_timeout): đánh dấu hỏng, health loop lo
+            self.dead = True
+            if self.proc and self.proc.is_alive():
+                self.proc.kill()
+            raise EmbedWorkerError(f"Worker {self.idx} failed: {e}")
+        if msg[0] != "ok":
+            raise EmbedWorkerError(msg[1])
+        self.calls += 1
+        return self.out[:msg[1]].copy()
+
+    def healthy(self) -> bool:
+        if not self.proc.is_alive():
+            return False
+        try:
+            self.conn.send(("ping",))
+            return self.conn.poll(5) and self.conn.recv()[0] == "pong"
+        except (EOFError, OSError):
+            return False
+
+
+class EmbedWorkerPool:
+    """N tiến trình embedding, mỗi tiến trình giữ model một lần. `encode` là hàm sync, thread-safe,
+    dùng được làm encode_fn cho EmbedBatcher/DirectEmbedder.
+
+    Worker hỏng bị loại khỏi vòng phục vụ và được khởi động lại trong thread health; request chỉ chạy trên worker
+    còn sống (chunk gặp worker chết được thử lại một lần trên worker khác)."""
+
+    def __init__(self, model_name: str, num_workers: int, dims: int = 1024, capacity: int = 64,
+                 threads_per_worker: int = 0, startup_timeout: float = 300, call_timeout: float = 30,
+                 health_interval: float = 10, backend: str = "torch", onnx_file: Optional[str] = None):
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.dims = dims
+        self.capacity = capacity
+        self.threads_per_worker = threads_per_worker
+        self.startup_timeout = startup_timeout
+        self.call_timeout = call_timeout
+        self.health_interval = health_interval
+        self.ctx = mp.get_context("spawn")
+        self.workers = [_EmbedWorker(i, self) for i in range(num_workers)]
+        self._idle: "queue.Queue[_EmbedWorker]" = queue.Queue()
+        self._mu = threading.Lock()  # giữ `queued` khớp với _idle
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        # Chia batch lớn hơn `capacity` thành nhiều chunk, encode song song trên các worker rảnh
+        self._chunk_pool = ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="embed-chunk")
+        self.restarts = 0
+
+    def start(self):
+        # Spawn tất cả trước rồi mới chờ -> các worker load model song song
+        for w in self.workers:
+            w.spawn()
+        for w in self.workers:
+            w.wait_ready(self.startup_timeout)
+            self._release(w)
+        self._monitor = threading.Thread(target=self._health_loop, name="embed-health", daemon=True)
+        self._monitor.start()
+        logger.info(f"✅ Started {len(self.workers)} embedding workers")
+
+    def stop(self):
+        self._stop.set()
+        self._chunk_pool.shutdown(wait=False)
+        for w in self.workers:
+            with w.lock:
+                w.shutdown()
+
+    def _release(self, worker: _EmbedWorker):
+        with self._mu:
+            if not worker.dead and not worker.queued:
+                worker.queued = True
+                self._idle.put(worker)
+
+    def _take(self) -> _EmbedWorker:
+        deadline = time.monotonic() + self.call_timeout
+        while True:
+            try:
+                worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise EmbedWorkerError(f"No live embedding worker after {self.call_timeout}s")
+            with self._mu:
+                worker.queued = False
+                if not worker.dead:
+                    return worker
+            # worker chết khi đang nằm trong hàng đợi: bỏ qua, health loop đưa lại sau khi khởi động lại
+
+    def _encode_chunk(self, texts: List[str]) -> np.ndarray:
+        for attempt in range(2):
+            worker = self._take()
+            try:
+                with worker.lock:
+                    return worker.encode(texts)
+            except EmbedWorkerError:
+                if not worker.dead or attempt:
+                    raise
+                logger.warning(f"⚠️ Embedding worker {worker.idx} died, retrying chunk on another worker")
+            finally:
+                self._release(worker)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if len(texts) <= self.capacity:
+            return self._encode_chunk(texts)
+        chunks = [texts[i:i + self.capacity] for i in range(0, len(texts), self.capacity)]
+        results = list(self._chunk_pool.map(self._encode_chunk, chunks))
+        return np.concatenate(results)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for w in self.workers:
+                if self._stop.is_set():
+                    return
+                if not w.dead:
+                    # Chỉ ping worker đang rảnh, không chặn request
+                    if not w.lock.acquire(blocking=False):
+                        continue
+                    try:
+                        if not w.healthy():
+                            w.dead = True
+                    finally:
+                        w.lock.release()
+                if not w.dead:
+                    continue
+                # Không request nào dùng worker đã đánh dấu dead -> khởi động lại không cần giữ lock
+                try:
+                    w.restart()
+                except Exception as e:
+                    logger.error(f"❌ Embedding worker {w.idx} restart failed: {e}")
+                    continue
+                with self._mu:
+                    w.dead = False
+                self._release(w)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "alive": sum(1 for w in self.workers if w.proc and w.proc.is_alive()),
+            "dead": sum(1 for w in self.workers if w.dead),
+            "idle": self._idle.qsize(),
+            "restarts": self.restarts,
+            "calls": [w.calls for w in self.workers],
+        }
+
+
+if __name__ == "__main__":
+    # Lưu sẵn model ra local để lần khởi động sau không phải tải/convert lại:
+    #   python embedding.py ./models/bge-m3 [torch|onnx|openvino]
+    import sys
+
+    target = sys.argv[1]
+    backend = sys.argv[2] if len(sys.argv) > 2 else "torch"
+    load_sentence_transformer(os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3"), backend=backend).save(target)
+    print(f"✅ Saved model ({backend}) to {target}")
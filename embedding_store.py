@@ -0,0 +1,205 @@
+import os
+import re
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("snake_rag")
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name.strip("/")) or "model"
+
+
+# Key tạm giữ chỗ cho dòng đang được ghi (key thật là hash hex, không bao giờ trùng tiền tố này)
+_PENDING = "pending:"
+_REAL = f"key NOT GLOB '{_PENDING}*'"
+
+
+class EmbeddingStore:
+    """Kho embedding trên đĩa: ma trận float32 memmap (vectors.f32) + index SQLite key -> row.
+
+    Mỗi (model, namespace) một thư mục riêng dưới `root`, nên key chỉ cần là hash của text.
+    Ghi hai pha: (1) giữ chỗ các dòng bằng key tạm và xoá key bị thay thế, commit; (2) ghi vector vào memmap + flush,
+    rồi mới đổi key tạm thành key thật -> index không bao giờ trỏ tới dòng chưa ghi hoặc đang bị ghi đè.
+    Nhiều process có thể dùng chung (BEGIN IMMEDIATE cấp phát row, file memmap được map lại khi lớn lên).
+    `max_rows` > 0: giới hạn số vector, quá giới hạn thì dùng lại dòng của các key cũ nhất (theo thứ tự ghi);
+    get_many đọc lại index sau khi copy vector, dòng đã đổi chủ trong lúc đọc bị tính là miss."""
+
+    GROW_ROWS = 4096
+    CHUNK = 500  # giới hạn số tham số của SQLite trong `IN (...)`
+
+    def __init__(self, root: str, model_name: str, dims: int, namespace: str = "docs", max_rows: int = 0):
+        self.model_name = model_name
+        self.dims = dims
+        self.max_rows = max_rows
+        self.dir = os.path.join(root, _slug(model_name), namespace)
+        os.makedirs(self.dir, exist_ok=True)
+        self._path = os.path.join(self.dir, "vectors.f32")
+        if not os.path.exists(self._path):
+            open(self._path, "wb").close()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.dir, "index.sqlite"), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        self._check_meta()
+        self._mm: Optional[np.memmap] = None
+        self._capacity = 0
+        self._remap()
+        # Đếm sẵn để stats() (/metrics) không phải chờ lock / chạy SQLite trên event loop
+        self._entries = self._count()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _check_meta(self):
+        meta = dict(self._conn.execute("SELECT k, v FROM meta").fetchall())
+        if not meta:
+            self._conn.executemany("INSERT OR IGNORE INTO meta (k, v) VALUES (?, ?)",
+                                   [("model", self.model_name), ("dims", str(self.dims))])
+        elif int(meta.get("dims", self.dims)) != self.dims:
+            raise ValueError(f"Embedding store {self.dir} has dims={meta['dims']}, expected {self.dims}")
+
+    def _remap(self, min_rows: int = 0):
+        row_bytes = 4 * self.dims
+        capacity = os.path.getsize(self._path) // row_bytes
+        if capacity < min_rows:
+            capacity = max(min_rows, capacity * 2, self.GROW_ROWS)
+            if self.max_rows:
+                capacity = max(min_rows, min(capacity, self.max_rows))
+            with open(self._path, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        if self._mm is not None:
+            self._mm.flush()
+        self._mm = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, self.dims)) if capacity else None
+        self._capacity = capacity
+
+    def _rows_for(self, keys: List[str]) -> Dict[str, int]:
+        out = {}
+        for i in range(0, len(keys), self.CHUNK):
+            chunk = keys[i:i + self.CHUNK]
+            q = f"SELECT key, row FROM vectors WHERE key IN ({','.join('?' * len(chunk))})"
+            out.update(self._conn.execute(q, chunk).fetchall())
+        return out
+
+    def _count(self) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM vectors WHERE {_REAL}").fetchone()[0]
+
+    def _allocate(self, n: int) -> List[int]:
+        """Dòng trống cuối file trước, hết chỗ (max_rows) thì lấy lại dòng của các key ghi sớm nhất.
+        Dòng đang được process khác ghi (key tạm) không bao giờ bị lấy lại."""
+        start = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+        end = start + n if not self.max_rows else max(start, min(start + n, self.max_rows))
+        rows = list(range(start, end))
+        if len(rows) < n:
+            # rowid tăng theo thứ tự INSERT -> rowid nhỏ nhất là key cũ nhất
+            oldest = self._conn.execute(f"SELECT rowid, row FROM vectors WHERE {_REAL} ORDER BY rowid LIMIT ?",
+                                        (n - len(rows),)).fetchall()
+            self._conn.executemany("DELETE FROM vectors WHERE rowid = ?", [(rowid,) for rowid, _ in oldest])
+            rows += [row for _, row in oldest]
+            self.evicted += len(oldest)
+        return rows
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._rows_for(keys)
+            if rows and max(rows.values()) >= self._capacity:
+                self._remap()  # process khác đã ghi thêm
+            found = {k: np.array(self._mm[r]) for k, r in rows.items()}
+            if found:
+                # Writer chỉ ghi đè một dòng sau khi đã commit việc xoá key cũ của nó: key còn trỏ đúng dòng
+                # sau khi copy -> vector vừa copy chưa bị ghi đè
+                still = self._rows_for(list(found))
+                found = {k: v for k, v in found.items() if still.get(k) == rows[k]}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, keys: List[str], vectors) -> int:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims)
+        with self._lock:
+            # Pha 1: giữ chỗ + xoá key bị thay thế, commit trước khi chạm vào memmap
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                present = self._rows_for(list(keys))
+                new = {}
+                for key, vec in zip(keys, vectors):
+                    if key not in present and key not in new:
+                        new[key] = vec
+                if not new:
+                    self._conn.execute("COMMIT")
+                    return 0
+                rows = self._allocate(len(new))
+                if len(rows) < len(new):  # batch lớn hơn max_rows -> chỉ giữ phần cuối
+                    new = dict(list(new.items())[-len(rows):])
+                token = f"{_PENDING}{uuid.uuid4().hex}:"
+                pending = [f"{token}{n}" for n in range(len(rows))]
+                self._conn.executemany("INSERT INTO vectors (key, row) VALUES (?, ?)", list(zip(pending, rows)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Pha 2: ghi vector rồi mới gắn key thật; key đã được process khác ghi trong lúc đó -> bỏ dòng tạm
+            try:
+                if max(rows) >= self._capacity:
+                    self._remap(max(rows) + 1)
+                self._mm[rows] = np.stack(list(new.values()))
+                self._mm.flush()
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany("UPDATE OR IGNORE vectors SET key = ? WHERE key = ?", list(zip(new, pending)))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            finally:
+                self._conn.executemany("DELETE FROM vectors WHERE key = ?", [(p,) for p in pending])
+                self._entries = self._count()
+            return len(new)
+
+    def put(self, key: str, vector):
+        self.put_many([key], [vector])
+
+    def recent(self, limit: int) -> List[Tuple[str, np.ndarray]]:
+        """Các vector ghi gần nhất (dùng để warm-start cache trong RAM)."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, row FROM vectors WHERE {_REAL} ORDER BY rowid DESC LIMIT ?",
+                                      (limit,)).fetchall()
+            if rows and max(r for _, r in rows) >= self._capacity:
+                self._remap()
+            return [(k, np.array(self._mm[r])) for k, r in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._entries,
+            "max_rows": self.max_rows,
+            "evicted": self.evicted,
+            "capacity": self._capacity,
+            "file_mb": round(os.path.getsize(self._path) / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+                self._mm = None
+            self._conn.close()
@@ -0,0 +1,237 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger("snake_rag")
+
+
+class SearchUnavailable(Exception):
+    """ES không phục vụ được (breaker đang mở, lỗi kết nối / timeout / 5xx) -> caller chuyển sang fallback hoặc 503."""
+
+
+def is_server_failure(exc: BaseException) -> bool:
+    """Lỗi tính vào circuit breaker. 4xx (query sai) không có nghĩa là ES hỏng."""
+    status = getattr(getattr(exc, "meta", None), "status", None)
+    if status is None:
+        status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return True  # ConnectionError / ConnectionTimeout của elastic_transport, asyncio.TimeoutError, OSError...
+
+
+class CircuitBreaker:
+    """closed -> `failure_threshold` lỗi liên tiếp -> open (từ chối ngay) -> sau `reset_timeout` giây -> half_open
+    (cho tối đa `half_open_max` request thăm dò) -> thành công thì closed, lỗi thì open lại.
+
+    Chỉ dùng trong event loop (không cần lock)."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.opened = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.short_circuited += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_max:
+                self.short_circuited += 1
+                return False
+            self.probes += 1
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info("✅ Elasticsearch circuit closed")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning(f"🔌 Elasticsearch circuit open for {self.reset_timeout}s after {self.failures} failures")
+
+    def release(self):
+        """Probe half-open bị huỷ giữa chừng (client ngắt) -> trả lại suất thăm dò."""
+        if self.state == self.HALF_OPEN and self.probes:
+            self.probes -= 1
+
+    def stats(self) -> dict:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            state = self.HALF_OPEN
+        else:
+            state = self.state
+        return {"state": state, "consecutive_failures": self.failures, "opened": self.opened,
+                "short_circuited": self.short_circuited}
+
+
+class LatencyWindow:
+    """Cửa sổ trượt latency gần nhất; percentile tính lại mỗi `refresh` mẫu (không sort trên mọi request)."""
+
+    def __init__(self, size: int = 512, min_samples: int = 20, refresh: int = 32):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self._since = 0
+        self._cache = {}
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self._since += 1
+        if self._since >= self.refresh:
+            self._cache.clear()
+            self._since = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        if p not in self._cache:
+            values = sorted(self.samples)
+            self._cache[p] = values[min(len(values) - 1, int(p / 100 * len(values)))]
+        return self._cache[p]
+
+
+class ResilientSearch:
+    """Bọc client ES (AsyncElasticsearch hoặc bất kỳ object có search/msearch/mget async) cho đường query:
+
+    - circuit breaker: ES lỗi liên tục -> từ chối ngay bằng SearchUnavailable thay vì để mỗi request chờ hết timeout
+    - hedged request: request chưa xong sau p`hedge_percentile` latency gần đây (kẹp trong [hedge_min_ms, hedge_max_ms])
+      -> gửi thêm một bản sao, lấy kết quả về trước, huỷ bản còn lại. Số bản sao bị giới hạn bởi `hedge_budget`
+      (tỉ lệ trên tổng request) để không nhân đôi tải lúc ES đang chậm toàn cục.
+    Chỉ dùng cho thao tác đọc (idempotent)."""
+
+    def __init__(self, client, breaker: Optional[CircuitBreaker] = None, hedge: bool = True,
+                 hedge_percentile: float = 95, hedge_min_ms: float = 20, hedge_max_ms: float = 1000,
+                 hedge_budget: float = 0.1, pool_size: int = 0):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min = hedge_min_ms / 1000
+        self.hedge_max = hedge_max_ms / 1000
+        self.hedge_budget = hedge_budget
+        self.pool_size = pool_size
+        self.latency = {}
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.calls = 0
+        self.failures = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, op: str) -> Optional[float]:
+        window = self.latency.get(op)
+        p = window.percentile(self.hedge_percentile) if window else None
+        if p is None:
+            return None  # chưa đủ mẫu
+        return min(max(p, self.hedge_min), self.hedge_max)
+
+    async def _first_ok(self, primary: asyncio.Task, call: Callable, delay: Optional[float]):
+        tasks = {primary}
+        try:
+            if delay is not None and self.hedged < self.hedge_budget * self.calls:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    backup = asyncio.ensure_future(call())
+                    tasks.add(backup)
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not primary:
+                            self.hedge_wins += 1
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def _call(self, op: str, call: Callable):
+        if not self.breaker.allow():
+            raise SearchUnavailable("circuit open")
+        self.calls += 1
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+        started = time.perf_counter()
+        try:
+            delay = self.hedge_delay(op) if self.hedge else None
+            res = await self._first_ok(asyncio.ensure_future(call()), call, delay)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if not is_server_failure(e):
+                self.breaker.record_success()
+                raise
+            self.failures += 1
+            self.breaker.record_failure()
+            raise SearchUnavailable(f"{type(e).__name__}: {e}") from e
+        finally:
+            self.inflight -= 1
+        self.breaker.record_success()
+        self.latency.setdefault(op, LatencyWindow()).add(time.perf_counter() - started)
+        return res
+
+    async def search(self, index: str = None, body: dict = None, **kwargs) -> dict:
+        return await self._call("search", lambda: self.client.search(index=index, body=body, **kwargs))
+
+    async def msearch(self, searches: list = None, **kwargs) -> dict:
+        return await self._call("msearch", lambda: self.client.msearch(searches=searches, **kwargs))
+
+    async def mget(self, index: str = None, ids: list = None, **kwargs) -> dict:
+        return await self._call("mget", lambda: self.client.mget(index=index, ids=ids, **kwargs))
+
+    async def ping(self) -> bool:
+        return await self.client.ping()
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.breaker.stats(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "inflight": self.inflight,
+            "peak_inflight": self.peak_inflight,
+            "pool_size": self.pool_size,
+            "pool_utilization": round(self.inflight / self.pool_size, 3) if self.pool_size else 0.0,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": {op: round(d * 1000, 1) for op in self.latency
+                               if (d := self.hedge_delay(op)) is not None},
+        }
+
+
+def connect_es(host: str, pool_size: int = 10, request_timeout: float = 5.0, max_retries: int = 1,
+               http_compress: bool = False, **kwargs):
+    """AsyncElasticsearch (node aiohttp) với pool `pool_size` kết nối keep-alive / node, chỉ dùng option public.
+
+    Kết nối rảnh được aiohttp giữ 15 s (mặc định): traffic đều thì pool luôn ấm, lần mở lại hiếm hoi đã có hedging lo.
+    Không retry khi timeout (đã có hedging + breaker lo request chậm), chỉ retry lỗi kết nối `max_retries` lần.
+    `http_compress`: gzip body (query knn mang vector dài) - đáng bật khi ES ở xa / băng thông hẹp."""
+    from elasticsearch import AsyncElasticsearch
+
+    return AsyncElasticsearch(host, node_class="aiohttp", connections_per_node=pool_size,
+                              request_timeout=request_timeout, max_retries=max_retries, retry_on_timeout=False,
+                              http_compress=http_compress, **kwargs)
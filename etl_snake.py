@@ -1,14 +1,26 @@
 import os
+import copy
+import json
+import time
+import random
+import hashlib
 import logging
-import pandas as pd
-import torch
-import mysql.connector
+import queue
+import argparse
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import numpy as np
 import pymongo
 from elasticsearch import Elasticsearch, helpers
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+from embedding_store import EmbeddingStore
+from search_backend import write_local_index
+from species_names import build_name_dictionary, write_name_dictionary
+from mysql_source import count_taxonomy, iter_taxonomy
+
 # --- 1. CẤU HÌNH ---
 load_dotenv()
 logging.basicConfig(
@@ -20,93 +32,297 @@ ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 MODEL_NAME = 'BAAI/bge-m3'
 EMBEDDING_DIMS = 1024
+# "snakes" là alias; dữ liệu nằm ở các index phiên bản snakes_v<timestamp>, main.py vẫn query "snakes"
+INDEX_NAME = "snakes"
+KEEP_VERSIONS = int(os.getenv("ETL_KEEP_VERSIONS", "2"))
+ES_REPLICAS = int(os.getenv("ES_REPLICAS", "1"))
+MIN_DOC_RATIO = float(os.getenv("ETL_MIN_DOC_RATIO", "0.95"))
+BATCH_SIZE = 64
+# Pipeline: số batch tối đa nằm chờ giữa các stage (backpressure) và số thread cho parallel_bulk
+PIPELINE_DEPTH = int(os.getenv("ETL_PIPELINE_DEPTH", "4"))
+BULK_THREADS = int(os.getenv("ETL_BULK_THREADS", "4"))
+BULK_CHUNK = int(os.getenv("ETL_BULK_CHUNK", "200"))
+# Checkpoint để chạy lại từ batch bị dừng nếu ETL crash
+CHECKPOINT_FILE = os.getenv("ETL_CHECKPOINT", "etl_checkpoint.json")
+# Kho embedding trên đĩa, key = (model, content_hash); để trống để tắt
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", "embedding_store")
+# Nếu đặt: sau mỗi lần ETL xuất index cho search_backend.LocalSearchBackend (main.py: SEARCH_BACKEND=local)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "")
+# Từ điển tên loài (đã bỏ dấu) -> _id cho đường tra cứu trực tiếp của main.py; để trống để tắt
+NAME_DICT_PATH = os.getenv("NAME_DICT_PATH", "species_names.json")
+# Storage profile của index: default = float32 HNSW, vector + context nằm trong _source;
+# compact / bbq = vector lượng tử hoá int8 / BBQ, bỏ vector + context khỏi _source
+STORAGE_PROFILE = os.getenv("ES_STORAGE_PROFILE", "default")
+VECTOR_INDEX_OPTIONS = {"default": None, "compact": {"type": "int8_hnsw"}, "bbq": {"type": "bbq_hnsw"}}
+SOURCE_EXCLUDES = ["vector_embedding", "full_text_context"]
+SNIPPET_CHARS = 300  # main.py chỉ hiển thị 300 ký tự đầu trong danh sách
+
+# Kết nối AI: chỉ load khi có text chưa có trong embedding store
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
 
-# Kết nối AI
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-logging.info(f"Loading AI Model {MODEL_NAME} on {device}...")
-model = SentenceTransformer(MODEL_NAME, device=device)
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            logging.info(f"Loading AI Model {MODEL_NAME} on {device}...")
+            _model = SentenceTransformer(MODEL_NAME, device=device)
+    return _model
 
 # Kết nối DB
 es = Elasticsearch(ES_HOST, verify_certs=False, ssl_show_warn=False)
 mongo_client = pymongo.MongoClient(MONGO_URI)
 col_clean = mongo_client["snake_raw_data"]["wiki_cleaned"]
 
-def get_mysql_connection():
-    return mysql.connector.connect(
-        host=os.getenv("MYSQL_HOST", "localhost"),
-        port=os.getenv("MYSQL_PORT", "3306"),
-        user=os.getenv("MYSQL_USER", "root"),
-        password=os.getenv("MYSQL_PASSWORD", ""),
-        database=os.getenv("MYSQL_DB", "snake_db")
-    )
-
-def create_index():
-    index_name = "snakes"
-    if es.indices.exists(index=index_name):
-        es.indices.delete(index=index_name)
-    
-    mapping = {
-        "mappings": {
-            "properties": {
-                "scientific_name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                
-                # Sửa: Bỏ "boost": 2.0 (Elasticsearch 8.x không hỗ trợ boost tại đây)
-                "vietnamese_name": {"type": "text", "analyzer": "standard"}, 
-                
-                "common_names": {"type": "text", "analyzer": "standard"},
-                "family": {"type": "keyword"},
-                "danger_level": {"type": "keyword"},
-                "max_len": {"type": "float"},
-                "countries": {"type": "text"},
-                "wiki_biology": {"type": "text"},
-                "wiki_venom": {"type": "text"},
-                "wiki_behavior": {"type": "text"},
-                "full_text_context": {"type": "text"},
-                "vector_embedding": {
-                    "type": "dense_vector",
-                    "dims": EMBEDDING_DIMS,
-                    "index": True,
-                    "similarity": "cosine"
-                }
+INDEX_MAPPING = {
+    "mappings": {
+        "properties": {
+            "scientific_name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            
+            # Sửa: Bỏ "boost": 2.0 (Elasticsearch 8.x không hỗ trợ boost tại đây)
+            "vietnamese_name": {"type": "text", "analyzer": "standard"}, 
+            
+            "common_names": {"type": "text", "analyzer": "standard"},
+            "family": {"type": "keyword"},
+            "danger_level": {"type": "keyword"},
+            "max_len": {"type": "float"},
+            "countries": {"type": "text"},
+            "wiki_biology": {"type": "text"},
+            "wiki_venom": {"type": "text"},
+            "wiki_behavior": {"type": "text"},
+            "full_text_context": {"type": "text"},
+            # Đoạn trích ngắn cho response dạng danh sách, chỉ lưu để trả về
+            "biology_snippet": {"type": "text", "index": False},
+            "venom_snippet": {"type": "text", "index": False},
+            # Hash của full_text_context -> ETL incremental chỉ embed lại document thay đổi
+            "content_hash": {"type": "keyword"},
+            "vector_embedding": {
+                "type": "dense_vector",
+                "dims": EMBEDDING_DIMS,
+                "index": True,
+                "similarity": "cosine"
             }
         }
     }
-    es.indices.create(index=index_name, body=mapping)
-    logging.info(f"✅ Created Index '{index_name}'")
+}
 
-def fetch_data_from_mysql():
-    conn = get_mysql_connection()
-    cursor = conn.cursor(dictionary=True)
-    logging.info("📥 Fetching data from MySQL...")
-    
-    query = """
-    SELECT 
-        TRIM(CONCAT(t.genus, ' ', t.species, ' ', IFNULL(t.subspecies, ''))) AS scientific_name,
-        tf.family,
-        (SELECT GROUP_CONCAT(DISTINCT cname SEPARATOR ', ') FROM map__cname m WHERE m.genus = t.genus AND m.species = t.species) AS common_names,
-        (SELECT danger FROM map__danger d WHERE d.genus = t.genus AND d.species = t.species LIMIT 1) AS danger_level,
-        (SELECT MAX(tbl) FROM val__size s WHERE s.genus = t.genus AND s.species = t.species) AS max_len
-    FROM tax__subspecies t
-    LEFT JOIN tax__genus tg ON t.genus = tg.genus
-    LEFT JOIN tax__family tf ON tg.family = tf.family
-    """
-    
+def index_mapping(profile: str = None) -> dict:
+    profile = profile or STORAGE_PROFILE
+    if profile not in VECTOR_INDEX_OPTIONS:
+        raise ValueError(f"Unknown storage profile '{profile}' (choose from {', '.join(VECTOR_INDEX_OPTIONS)})")
+    mapping = copy.deepcopy(INDEX_MAPPING)
+    if VECTOR_INDEX_OPTIONS[profile]:
+        mapping["mappings"]["properties"]["vector_embedding"]["index_options"] = VECTOR_INDEX_OPTIONS[profile]
+        mapping["mappings"]["_source"] = {"excludes": SOURCE_EXCLUDES}
+    mapping["mappings"]["_meta"] = {"storage_profile": profile}
+    return mapping
+
+def create_index(profile: str = None) -> str:
+    """Tạo index phiên bản mới (tắt refresh + replica để bulk load nhanh). Alias chưa trỏ sang cho tới khi swap."""
+    index_name = f"{INDEX_NAME}_v{time.strftime('%Y%m%d%H%M%S')}"
+    body = {
+        **index_mapping(profile),
+        "settings": {"index": {"number_of_replicas": 0, "refresh_interval": "-1"}},
+    }
+    es.indices.create(index=index_name, body=body)
+    logging.info(f"✅ Created Index '{index_name}' (storage profile: {profile or STORAGE_PROFILE})")
+    return index_name
+
+def list_versions() -> list:
+    return sorted(es.indices.get(index=f"{INDEX_NAME}_v*").keys())
+
+def alias_targets() -> list:
+    if not es.indices.exists_alias(name=INDEX_NAME):
+        return []
+    return list(es.indices.get_alias(name=INDEX_NAME).keys())
+
+def ensure_index() -> str:
+    """Index đích cho chế độ incremental: index alias đang trỏ tới (tạo mới + gắn alias nếu chưa có)."""
+    targets = alias_targets()
+    if targets:
+        index_name = targets[0]
+    elif es.indices.exists(index=INDEX_NAME):
+        # Index cũ (trước khi dùng alias) -> ghi thẳng, lần --full sau sẽ chuyển sang alias
+        index_name = INDEX_NAME
+    else:
+        index_name = create_index()
+        finalize_index(index_name)
+        swap_alias(index_name)
+    es.indices.put_mapping(index=index_name, properties={"content_hash": {"type": "keyword"}})
+    return index_name
+
+def finalize_index(index_name: str):
+    """Khôi phục refresh/replica sau bulk load rồi force-merge về 1 segment."""
+    es.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": "1s", "number_of_replicas": ES_REPLICAS}})
+    es.indices.refresh(index=index_name)
+    es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+
+def sanity_check(index_name: str, expected: int, sample_names: list) -> bool:
+    """Profile compact/bbq không giữ vector trong _source -> vector thăm dò lấy từ embedding store theo content_hash."""
+    count = es.count(index=index_name)["count"]
+    if count < expected * MIN_DOC_RATIO:
+        logging.error(f"❌ Sanity check: {count} docs in '{index_name}', expected ~{expected}")
+        return False
+    store = EmbeddingStore(EMBED_STORE_DIR, MODEL_NAME, EMBEDDING_DIMS) if EMBED_STORE_DIR else None
+    try:
+        for name in sample_names:
+            res = es.search(index=index_name, size=1, query={"match": {"scientific_name": name}},
+                            _source=["vector_embedding", "content_hash"])
+            hits = res["hits"]["hits"]
+            if not hits:
+                logging.error(f"❌ Sanity check: no hit for '{name}'")
+                return False
+            source = hits[0]["_source"]
+            vec = source.get("vector_embedding")
+            if vec is None and store is not None:
+                vec = store.get(source.get("content_hash", ""))
+            if vec is None:
+                logging.warning(f"⚠️ Sanity check: no stored vector for '{name}', skipping knn self-lookup")
+                continue
+            # Vector của chính document phải tìm lại được chính nó
+            knn = {"field": "vector_embedding", "query_vector": [float(x) for x in vec], "k": 1, "num_candidates": 10}
+            if es.search(index=index_name, size=1, knn=knn, _source=False)["hits"]["hits"][0]["_id"] != hits[0]["_id"]:
+                logging.error(f"❌ Sanity check: knn self-lookup failed for '{name}'")
+                return False
+    finally:
+        if store is not None:
+            store.close()
+    logging.info(f"✅ Sanity check passed: {count} docs in '{index_name}'")
+    return True
+
+def swap_alias(index_name: str):
+    """Chuyển alias sang index mới trong một request update_aliases (atomic)."""
+    actions = [{"remove": {"index": old, "alias": INDEX_NAME}} for old in alias_targets() if old != index_name]
+    if es.indices.exists(index=INDEX_NAME) and not es.indices.exists_alias(name=INDEX_NAME):
+        # Index thật tên "snakes" từ phiên bản cũ phải bị gỡ cùng lúc thì alias mới tạo được
+        actions.append({"remove_index": {"index": INDEX_NAME}})
+    actions.append({"add": {"index": index_name, "alias": INDEX_NAME}})
+    es.indices.update_aliases(actions=actions)
+    logging.info(f"🔀 Alias '{INDEX_NAME}' -> '{index_name}'")
+
+def cleanup_old_versions(keep: int = KEEP_VERSIONS):
+    """Giữ `keep` phiên bản gần nhất (kể cả bản đang active) để rollback nhanh."""
+    active = set(alias_targets())
+    old = [v for v in list_versions() if v not in active]
+    for name in old[:max(0, len(old) - (keep - len(active)))]:
+        es.indices.delete(index=name)
+        logging.info(f"🗑️ Deleted old index '{name}'")
+
+def export_local_index(out_dir: str) -> int:
+    """Dump index mà alias đang trỏ tới (kể cả vector) ra thư mục cho LocalSearchBackend.
+    Profile compact/bbq không giữ vector trong _source -> lấy lại từ embedding store theo content_hash."""
+    es.indices.refresh(index=INDEX_NAME)
+    store = EmbeddingStore(EMBED_STORE_DIR, MODEL_NAME, EMBEDDING_DIMS) if EMBED_STORE_DIR else None
+
+    def with_vector(hit: dict) -> dict:
+        doc = {"_id": hit["_id"], **hit["_source"]}
+        if "vector_embedding" not in doc:
+            vec = store.get(doc.get("content_hash", "")) if store is not None else None
+            if vec is None:
+                raise ValueError(f"No vector for '{hit['_id']}' in _source or embedding store")
+            doc["vector_embedding"] = vec
+        return doc
+
+    hits = helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}}, size=500)
+    count = write_local_index(out_dir, (with_vector(h) for h in hits), EMBEDDING_DIMS,
+                              meta={"index": INDEX_NAME, "source": alias_targets(), "model": MODEL_NAME})
+    if store is not None:
+        store.close()
+    logging.info(f"📦 Exported {count} docs to local search index '{out_dir}'")
+    return count
+
+def export_name_dictionary(path: str) -> int:
+    es.indices.refresh(index=INDEX_NAME)
+    hits = helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}},
+                        _source=["scientific_name", "vietnamese_name", "common_names"], size=1000)
+    names = build_name_dictionary({"_id": h["_id"], **h["_source"]} for h in hits)
+    write_name_dictionary(path, names, meta={"index": INDEX_NAME, "source": alias_targets()})
+    logging.info(f"📖 Wrote {len(names)} species names to '{path}'")
+    return len(names)
+
+def rollback():
+    versions = list_versions()
+    active = alias_targets()
+    older = [v for v in versions if active and v < active[0]]
+    if not older:
+        logging.error("❌ No previous index version to roll back to.")
+        return
+    swap_alias(older[-1])
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def doc_id(scientific_name: str) -> str:
+    return scientific_name.replace(" ", "_")
+
+def split_changed(batch: list, ai_by_name: dict, existing: dict):
+    """Dựng context cho batch, bỏ document có content_hash trùng bản đang index -> (rows, contexts, số unchanged).
+    Cả dữ liệu MySQL lẫn wiki_cleaned đều nằm trong context nên hash đổi khi một trong hai đổi."""
+    rows, contexts = [], []
+    for row in batch:
+        txt, ai_data, dist, vn_name = construct_context(row, ai_by_name.get(row['scientific_name'], {}))
+        h = content_hash(txt)
+        if existing.get(doc_id(row['scientific_name'])) == h:
+            continue
+        rows.append(row)
+        contexts.append({"text": txt, "ai_data": ai_data, "distribution": dist, "vn_name": vn_name, "hash": h})
+    return rows, contexts, len(batch) - len(rows)
+
+def fetch_existing_hashes() -> dict:
+    """_id -> content_hash của các document đang có trong index."""
+    hashes = {}
+    for hit in helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}},
+                            _source=["content_hash", "biology_snippet"]):
+        src = hit["_source"]
+        # Document index trước khi có snippet -> coi như đã đổi để được ghi lại một lần
+        hashes[hit["_id"]] = src.get("content_hash") if "biology_snippet" in src else None
+    logging.info(f"🔎 Found {len(hashes)} existing documents in '{INDEX_NAME}'.")
+    return hashes
+
+def load_checkpoint() -> dict:
+    if not os.path.exists(CHECKPOINT_FILE):
+        return {}
+    with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(state: dict):
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+def ensure_mongo_indexes():
+    # Join theo scientific_name -> cần index, nếu không mỗi $in là một collection scan
+    col_clean.create_index([("scientific_name", pymongo.ASCENDING)], name="scientific_name_1")
+
+def fetch_ai_data(names: list) -> dict:
+    """Lấy ai_data của cả batch bằng một query $in (thay vì find_one cho từng dòng)."""
+    cursor = col_clean.find({"scientific_name": {"$in": names}}, {"_id": 0, "scientific_name": 1, "ai_data": 1})
+    return {doc["scientific_name"]: doc.get("ai_data") or {} for doc in cursor}
+
+@contextmanager
+def timed(timings: dict, stage: str, lock: threading.Lock = None):
+    """Cộng thời gian chạy vào timings[stage]; `lock` khi gọi từ thread của pipeline."""
+    t = time.perf_counter()
     try:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows) if rows else pd.DataFrame()
-        logging.info(f"📊 Loaded {len(df)} records from MySQL.")
-        return df
-    except Exception as e:
-        logging.error(f"❌ MySQL Error: {e}")
-        return pd.DataFrame()
+        yield
     finally:
-        cursor.close()
-        conn.close()
+        elapsed = time.perf_counter() - t
+        if lock is None:
+            timings[stage] += elapsed
+        else:
+            with lock:
+                timings[stage] += elapsed
 
-def construct_context(row):
-    mongo_doc = col_clean.find_one({"scientific_name": row['scientific_name']})
-    ai_data = mongo_doc.get("ai_data", {}) if mongo_doc else {}
+def construct_context(row, ai_data: dict):
     
     vn_name = ai_data.get('vietnamese_name', '')
     
@@ -132,69 +348,358 @@ def construct_context(row):
     )
     return text, ai_data, distribution, vn_name
 
-def run_etl():
-    create_index()
-    df = fetch_data_from_mysql()
+# --- PIPELINE: extract (MySQL rows + Mongo + context) -> embed -> bulk index, chạy song song ---
+_DONE = object()
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = 0
+        self.busy = 0.0
+
+    def report(self, wall: float) -> str:
+        rate = self.docs / self.busy if self.busy else 0.0
+        return f"{self.name}: {self.docs} docs, busy {self.busy:.1f}s ({rate:.1f} docs/s), util {self.busy / wall:.0%}"
+
+class AdaptiveBatchSize:
+    """Số document mỗi lần model.encode: tăng gấp đôi khi throughput còn tăng, lùi về mức tốt nhất khi không
+    tăng nữa, giảm một nửa khi hết bộ nhớ."""
+
+    def __init__(self, start: int, min_size: int = 8, max_size: int = 512):
+        self.size = start
+        self.min_size = min_size
+        self.max_size = max_size
+        self.best_rate = None
+        self.best_size = start
+        self.settled = False
+
+    def record(self, docs: int, seconds: float):
+        if self.settled or docs < self.size or seconds <= 0:
+            return
+        rate = docs / seconds
+        if self.best_rate is None or rate > self.best_rate * 1.05:
+            self.best_rate, self.best_size = rate, self.size
+            if self.size < self.max_size:
+                self.size = min(self.size * 2, self.max_size)
+            else:
+                self.settled = True
+        else:
+            self.size = self.best_size
+            self.settled = True
+            logging.info(f"📐 Embedding batch size settled at {self.size}")
+
+    def shrink(self):
+        self.size = max(self.min_size, self.size // 2)
+        self.best_size = min(self.best_size, self.size)
+        self.settled = True
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def encode_with_store(texts: list, keys: list, batch_size: int, store=None, store_only: bool = False):
+    """Lấy vector có sẵn trong store, chỉ encode phần còn thiếu rồi ghi lại vào store.
+    Trả về (vectors, số text đã encode); store_only=True -> text thiếu nhận None thay vì load model."""
+    found = store.get_many(keys) if store is not None else {}
+    vectors = [found.get(k) for k in keys]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing and not store_only:
+        encoded = get_model().encode([texts[i] for i in missing], batch_size=min(batch_size, len(missing)),
+                                     show_progress_bar=False)
+        if store is not None:
+            store.put_many([keys[i] for i in missing], encoded)
+        for n, i in enumerate(missing):
+            vectors[i] = np.asarray(encoded[n], dtype=np.float32)
+        return vectors, len(missing)
+    return vectors, 0
+
+def snippet_fields(ai_data: dict) -> dict:
+    return {
+        "biology_snippet": str(ai_data.get("biology") or "")[:SNIPPET_CHARS],
+        "venom_snippet": str(ai_data.get("venom") or "")[:SNIPPET_CHARS],
+    }
+
+def build_action(target: str, row: dict, ctx: dict, vector) -> dict:
+    ai_data = ctx["ai_data"]
+    return {
+        "_index": target,
+        "_id": doc_id(row['scientific_name']),
+        "_source": {
+            "scientific_name": row['scientific_name'],
+            "vietnamese_name": ctx["vn_name"], # Lưu tên Việt
+            "common_names": row['common_names'],
+            "family": row['family'],
+            "danger_level": row['danger_level'],
+            "max_len": row.get('max_len'),
+            "countries": ctx["distribution"],
+            "wiki_biology": ai_data.get("biology"),
+            "wiki_venom": ai_data.get("venom"),
+            "wiki_behavior": ai_data.get("behavior"),
+            "full_text_context": ctx["text"],
+            "content_hash": ctx["hash"],
+            **snippet_fields(ai_data),
+            "vector_embedding": vector.tolist()
+        }
+    }
+
+def run_etl(full: bool = False, resume: bool = True, batch_size: int = BATCH_SIZE, use_store: bool = True,
+            store_only: bool = False):
+    """full=True: dựng index phiên bản mới rồi swap alias. Mặc định: incremental, chỉ embed + index lại document có content_hash thay đổi.
+    store_only=True: chỉ dùng vector trong embedding store, không load model (document thiếu vector bị tính là failed)."""
+    mode = "full" if full else "incremental"
+    timings = defaultdict(float)
+    with timed(timings, "mysql"):
+        total = count_taxonomy()
     
-    if df.empty:
+    if not total:
         logging.warning("⚠️ No data found in MySQL. Exiting.")
         return
 
-    logging.info("🚀 Starting ETL Process...")
-    batch_size = 64
-    
-    for i in tqdm(range(0, len(df), batch_size)):
-        batch = df.iloc[i : i+batch_size].copy()
-        
-        contexts = []
-        mongo_data_list = []
-        dist_list = []
-        vn_names_list = []
-        
-        for _, row in batch.iterrows():
-            txt, ai_data, dist, vn_name = construct_context(row)
-            contexts.append(txt)
-            mongo_data_list.append(ai_data)
-            dist_list.append(dist)
-            vn_names_list.append(vn_name)
-            
+    checkpoint = load_checkpoint() if resume else {}
+    start_batch = 0
+    if checkpoint.get("mode") == mode and checkpoint.get("total") == total and checkpoint.get("batch_size") == batch_size \
+            and checkpoint.get("index") and es.indices.exists(index=checkpoint["index"]):
+        start_batch = checkpoint.get("next_batch", 0)
+        logging.info(f"↩️ Resuming {mode} ETL from batch {start_batch}")
+
+    if full:
+        # Dựng vào index phiên bản mới; alias "snakes" vẫn phục vụ bản cũ trong suốt quá trình
+        target = checkpoint["index"] if start_batch else create_index()
+        existing = {}
+    else:
+        target = ensure_index()
+        existing = fetch_existing_hashes()
+    ensure_mongo_indexes()
+
+    logging.info(f"🚀 Starting ETL Process ({mode})...")
+    stats = {"indexed": 0, "unchanged": 0, "failed": 0, "deleted": 0, "encoded": 0}
+    store = EmbeddingStore(EMBED_STORE_DIR, MODEL_NAME, EMBEDDING_DIMS) if use_store and EMBED_STORE_DIR else None
+    stages = {name: StageStats(name) for name in ("extract", "embed", "index")}
+    embedded_q: queue.Queue = queue.Queue(maxsize=PIPELINE_DEPTH)
+    extracted_q: queue.Queue = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stop = threading.Event()
+    stats_lock = threading.Lock()
+    errors = []
+    progress = tqdm(total=total, initial=min(start_batch * batch_size, total))
+    seen_names = []
+    adaptive = AdaptiveBatchSize(batch_size)
+
+    def extract():
+        st = stages["extract"]
+        # MySQL được stream theo batch (cursor không buffer), thứ tự ổn định -> số batch dùng làm checkpoint
+        batches = iter_taxonomy(batch_size)
+        batch_no = 0
+        while not stop.is_set():
+            t = time.perf_counter()
+            batch = next(batches, None)
+            with stats_lock:
+                timings["mysql"] += time.perf_counter() - t
+            if batch is None:
+                break
+            names = [row['scientific_name'] for row in batch]
+            seen_names.extend(names)
+            if batch_no < start_batch:
+                batch_no += 1
+                continue
+            with timed(timings, "mongo", stats_lock):
+                ai_by_name = fetch_ai_data(names)
+            rows, contexts, unchanged = split_changed(batch, ai_by_name, existing)
+            if unchanged:
+                with stats_lock:
+                    stats["unchanged"] += unchanged
+            st.docs += len(batch)
+            st.busy += time.perf_counter() - t
+            _put(extracted_q, {"batch_no": batch_no, "size": len(batch), "rows": rows, "contexts": contexts}, stop)
+            batch_no += 1
+        batches.close()
+
+    def embed():
+        st = stages["embed"]
+        pending = []
+        finished = False
+        while not finished:
+            item = _get(extracted_q, stop)
+            if item is _DONE:
+                finished = True
+            else:
+                pending.append(item)
+            # Gom nhiều batch extract cho tới khi đủ kích thước encode hiện tại
+            if pending and (finished or sum(len(b["contexts"]) for b in pending) >= adaptive.size):
+                texts = [c["text"] for b in pending for c in b["contexts"]]
+                t = time.perf_counter()
+                vectors = [None] * len(texts)
+                if texts:
+                    try:
+                        vectors, encoded = encode_with_store(texts, [c["hash"] for b in pending for c in b["contexts"]],
+                                                             adaptive.size, store, store_only)
+                        with stats_lock:
+                            stats["encoded"] += encoded
+                        if encoded:
+                            adaptive.record(encoded, time.perf_counter() - t)
+                    except RuntimeError as e:
+                        # OOM -> giảm batch; các document này được chạy lại ở lần ETL sau (hash chưa được lưu)
+                        logging.error(f"Embedding error: {e}")
+                        adaptive.shrink()
+                    except Exception as e:
+                        logging.error(f"Embedding error: {e}")
+                offset = 0
+                for b in pending:
+                    b["actions"] = []
+                    for row, ctx in zip(b["rows"], b["contexts"]):
+                        if vectors[offset] is None:
+                            with stats_lock:
+                                stats["failed"] += 1
+                        else:
+                            b["actions"].append(build_action(target, row, ctx, vectors[offset]))
+                        offset += 1
+                st.docs += len(texts)
+                st.busy += time.perf_counter() - t
+                for b in pending:
+                    _put(embedded_q, b, stop)
+                pending = []
+
+    def index():
+        st = stages["index"]
+        # Một parallel_bulk cho cả lần chạy: các chunk BULK_CHUNK của nhiều batch được gửi song song trên
+        # BULK_THREADS thread. Kết quả trả về đúng thứ tự action -> đếm ngược từng batch để checkpoint
+        open_batches = deque()  # [batch_no, size, số action chưa có kết quả]
+        waited = 0.0
+
+        def actions():
+            nonlocal waited
+            while True:
+                t = time.perf_counter()
+                b = _get(embedded_q, stop)
+                waited += time.perf_counter() - t
+                if b is _DONE:
+                    return
+                open_batches.append([b["batch_no"], b["size"], len(b["actions"])])
+                st.docs += len(b["actions"])
+                yield from b["actions"]
+
+        def complete_batches():
+            while open_batches and open_batches[0][2] == 0:
+                batch_no, size, _ = open_batches.popleft()
+                save_checkpoint({"mode": mode, "index": target, "total": total, "batch_size": batch_size,
+                                 "next_batch": batch_no + 1, "updated_at": time.time()})
+                progress.update(size)
+
+        t = time.perf_counter()
+        for ok, info in helpers.parallel_bulk(es, actions(), thread_count=BULK_THREADS, chunk_size=BULK_CHUNK,
+                                              raise_on_error=False):
+            with stats_lock:
+                stats["indexed" if ok else "failed"] += 1
+            if not ok:
+                logging.warning(f"⚠️ Bulk item failed: {info}")
+            complete_batches()  # batch không có action nào (toàn document không đổi) đứng trước
+            open_batches[0][2] -= 1
+            complete_batches()
+        complete_batches()
+        st.busy += time.perf_counter() - t - waited
+
+    def run_stage(fn, out_q):
         try:
-            embeddings = model.encode(contexts, show_progress_bar=False)
+            fn()
         except Exception as e:
-            logging.error(f"Embedding error: {e}")
-            continue
-        
-        actions = []
-        for idx, row in enumerate(batch.to_dict('records')):
-            ai_data = mongo_data_list[idx]
-            
-            action = {
-                "_index": "snakes",
-                "_id": row['scientific_name'].replace(" ", "_"),
-                "_source": {
-                    "scientific_name": row['scientific_name'],
-                    "vietnamese_name": vn_names_list[idx], # Lưu tên Việt
-                    "common_names": row['common_names'],
-                    "family": row['family'],
-                    "danger_level": row['danger_level'],
-                    "max_len": row.get('max_len'),
-                    "countries": dist_list[idx],
-                    "wiki_biology": ai_data.get("biology"),
-                    "wiki_venom": ai_data.get("venom"),
-                    "wiki_behavior": ai_data.get("behavior"),
-                    "full_text_context": contexts[idx],
-                    "vector_embedding": embeddings[idx].tolist()
-                }
-            }
-            actions.append(action)
-            
-        if actions:
-            helpers.bulk(es, actions)
+            logging.error(f"❌ ETL stage {fn.__name__} failed: {e}")
+            errors.append(e)
+            stop.set()
+        finally:
+            if out_q is not None:
+                # Không dùng _put: sentinel phải tới được stage sau kể cả khi đang dừng
+                try:
+                    out_q.put(_DONE, timeout=5)
+                except queue.Full:
+                    stop.set()
 
-    logging.info("🎉 ETL Process Completed Successfully!")
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_stage, args=(extract, extracted_q), name="etl-extract"),
+        threading.Thread(target=run_stage, args=(embed, embedded_q), name="etl-embed"),
+        threading.Thread(target=run_stage, args=(index, None), name="etl-index"),
+    ]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    progress.close()
+    wall = time.perf_counter() - started
+    for st in stages.values():
+        logging.info(f"📈 {st.report(wall)}")
+    bottleneck = max(stages.values(), key=lambda st: st.busy)
+    logging.info(f"🐢 Bottleneck stage: {bottleneck.name} ({bottleneck.busy / wall:.0%} busy)")
+    if store is not None:
+        logging.info(f"💾 Embedding store: {store.stats()}")
+        store.close()
+    if errors:
+        logging.error("❌ ETL stopped early; rerun to resume from the last checkpoint.")
+        return
+
+    # Xoá document không còn trong MySQL
+    if not full:
+        stale = set(existing) - {doc_id(name) for name in seen_names}
+        if stale:
+            helpers.bulk(es, ({"_op_type": "delete", "_index": target, "_id": _id} for _id in stale),
+                         raise_on_error=False)
+            stats["deleted"] = len(stale)
+
+    if full:
+        finalize_index(target)
+        samples = random.Random(0).sample(seen_names, min(3, len(seen_names)))
+        if not sanity_check(target, len(seen_names) - stats["failed"], samples):
+            logging.error(f"❌ Keeping alias on the previous index; '{target}' left for inspection.")
+            return
+        swap_alias(target)
+        cleanup_old_versions()
+
+    clear_checkpoint()
+    if LOCAL_INDEX_DIR:
+        export_local_index(LOCAL_INDEX_DIR)
+    if NAME_DICT_PATH:
+        export_name_dictionary(NAME_DICT_PATH)
+    logging.info(f"🎉 ETL Process Completed Successfully! {stats}")
+    # mysql / mongo: phần I/O trong extract; embed / index: thời gian bận của stage (StageStats)
+    timings.update({name: stages[name].busy for name in ("embed", "index")})
+    logging.info("⏱️ Time by stage: " + ", ".join(f"{k}={v:.1f}s" for k, v in timings.items()))
 
 if __name__ == "__main__":
-    if es.ping():
-        run_etl()
+    ap = argparse.ArgumentParser(description="MySQL + Mongo -> Elasticsearch ETL")
+    ap.add_argument("--full", action="store_true", help="dựng index phiên bản mới (re-embed tất cả) rồi swap alias")
+    ap.add_argument("--no-resume", action="store_true", help="bỏ qua checkpoint, chạy lại từ đầu")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--pipeline-depth", type=int, default=PIPELINE_DEPTH, help="số batch tối đa chờ giữa các stage")
+    ap.add_argument("--bulk-threads", type=int, default=BULK_THREADS, help="số thread của parallel_bulk")
+    ap.add_argument("--no-store", action="store_true", help="không đọc/ghi embedding store")
+    ap.add_argument("--store-only", action="store_true", help="dựng index chỉ từ embedding store, không load model")
+    ap.add_argument("--export-local", metavar="DIR", help="chỉ xuất index hiện tại cho search backend local")
+    ap.add_argument("--storage-profile", choices=list(VECTOR_INDEX_OPTIONS), default=STORAGE_PROFILE,
+                    help="mapping cho index mới (đổi profile cần chạy --full)")
+    ap.add_argument("--export-names", metavar="PATH", help="chỉ xuất từ điển tên loài -> _id cho main.py")
+    ap.add_argument("--rollback", action="store_true", help="trỏ alias về phiên bản index trước đó")
+    args = ap.parse_args()
+    PIPELINE_DEPTH, BULK_THREADS = args.pipeline_depth, args.bulk_threads
+    STORAGE_PROFILE = args.storage_profile
+
+    if not es.ping():
+        logging.error("❌ Cannot connect to Elasticsearch.")
+    elif args.rollback:
+        rollback()
+    elif args.export_local:
+        export_local_index(args.export_local)
+    elif args.export_names:
+        export_name_dictionary(args.export_names)
     else:
-        logging.error("❌ Cannot connect to Elasticsearch.")
\ No newline at end of file
+        run_etl(full=args.full, resume=not args.no_resume, batch_size=args.batch_size,
+                use_store=not args.no_store, store_only=args.store_only)
\ No newline at end of file
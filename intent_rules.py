@@ -0,0 +1,180 @@
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+from search_backend import fold_text
+
+# Gazetteer: alias đã bỏ dấu -> tên quốc gia chuẩn tiếng Anh (giống field `countries` và prompt của LLM parser)
+COUNTRIES = {
+    "Vietnam": ["viet nam", "vietnam", "vn", "nuoc ta", "trong nuoc", "tay nguyen", "ha noi", "sai gon", "tphcm",
+                "ho chi minh"],
+    "Laos": ["lao", "laos", "ai lao"],
+    "Cambodia": ["campuchia", "cam pu chia", "cambodia", "cao mien"],
+    "Thailand": ["thai lan", "thailand"],
+    "China": ["trung quoc", "china"],
+    "Myanmar": ["myanmar", "mien dien", "burma"],
+    "Malaysia": ["malaysia", "ma lai", "malaixia"],
+    "Indonesia": ["indonesia", "in do ne xi a", "indo"],
+    "Philippines": ["philippines", "philippin", "phi lip pin", "phi luat tan"],
+    "Singapore": ["singapore", "xin ga po", "sing ga po"],
+    "India": ["an do", "india"],
+    "Sri Lanka": ["sri lanka", "xri lan ca"],
+    "Bangladesh": ["bangladesh", "banglades"],
+    "Nepal": ["nepal", "ne pan"],
+    "Pakistan": ["pakistan"],
+    "Japan": ["nhat ban", "japan"],
+    "Taiwan": ["dai loan", "taiwan"],
+    "South Korea": ["han quoc", "korea"],
+    "Australia": ["uc", "australia"],
+    "Papua New Guinea": ["papua new guinea", "papua", "pa pua niu ghi ne"],
+    "United States": ["hoa ky", "nuoc my", "my", "usa", "america"],
+    "Mexico": ["mexico", "me xi co", "mehico"],
+    "Brazil": ["brazil", "brasil", "braxin"],
+    "Egypt": ["ai cap", "egypt"],
+    "South Africa": ["nam phi", "south africa"],
+    "Madagascar": ["madagascar"],
+}
+# Địa danh Việt Nam bắt đầu bằng alias của nước khác ("Mỹ Tho" không phải nước Mỹ, "Lào Cai" không phải nước Lào)
+COUNTRIES["Vietnam"] += ["my tho", "my duc", "my hao", "my loc", "my xuyen", "my son", "my khe", "lao cai"]
+# "miền nam", "bắc bộ"... chỉ là Việt Nam khi câu không nêu nước nào khác ("miền nam Trung Quốc" là Trung Quốc)
+GENERIC_VIETNAM = ["mien bac", "mien trung", "mien nam", "mien tay", "bac bo", "trung bo", "nam bo"]
+# Alias ngắn trùng chữ thường khi đã bỏ dấu ("ăn đồ", "lao vào", "ức", "mỹ danh", "mà lại"...): chỉ nhận khi câu gốc
+# viết đúng dấu / đúng hoa-thường như ở đây, hoặc đứng ngay sau một từ chỉ nơi chốn. None = chỉ nhận sau từ nơi chốn
+AMBIGUOUS = {"uc": "úc", "lao": "lào", "an do": "ấn độ", "ma lai": "mã lai", "vn": "VN", "my": None, "indo": None}
+_PLACE_CUES = {"o", "tai", "tu", "nuoc", "ben", "xu", "sang", "tru", "ngoai"}
+# Châu lục / khu vực: không filter được bằng một quốc gia, chỉ để chặn alias con ("nam my" không phải "my")
+REGIONS = ["dong nam a", "chau a", "chau au", "chau phi", "chau my", "nam my", "bac my", "trung my", "chau uc", "nam a"]
+
+
+def _alternation(words) -> str:
+    # Dài trước để "ngoai tru" thắng "ngoai", "viet nam" thắng "nam"
+    return "|".join(re.escape(w) for w in sorted(set(words), key=len, reverse=True))
+
+
+_ALIASES = {fold_text(a): country for country, aliases in COUNTRIES.items() for a in aliases}
+_ALIASES.update({r: "Vietnam" for r in GENERIC_VIETNAM})
+_ALIASES.update({r: None for r in REGIONS})
+_ALIAS_TOKENS = {t for a in _ALIASES for t in a.split()}
+
+# Mọi pattern chạy trên câu đã fold + tách token, nối bằng một dấu cách; "|" đánh dấu ranh giới mệnh đề
+_RE_COUNTRY = re.compile(rf"\b({_alternation(_ALIASES)})\b")
+# Phủ định có phạm vi địa lý: cue + (các quốc gia nối bằng "và", "hoặc", ",") ngay sau
+_TRU = r"(?<!cu )tru(?! an)"  # "cư trú", "trú ẩn" không phải "trừ"
+_RE_NEG_LOC = re.compile(rf"\b(ngoai tru|loai tru|{_TRU}|khong tinh|bo qua|ngoai|khong phai (?:o|tai)|"
+                         r"khong (?:co )?(?:song |phan bo |xuat hien )?(?:o|tai)|khong thuoc)\b")
+_LIST_GLUE = {"va", "hoac", "voi", "cung", "ca", "nuoc", "o", "tai", "|"}
+_RE_SAFE = re.compile(r"\b(khong (?:co )?(?:noc )?doc|khong phai (?:la )?(?:ran |loai |con )?doc|khong nguy hiem|"
+                      r"vo hai|lanh tinh|(?<!mau )lanh|non venomous|harmless)\b")
+_RE_VENOM = re.compile(r"\b(noc doc|doc|noc|nguy hiem|chet nguoi|can chet|venomous)\b")
+# "X có độc không?" hỏi về một loài, không phải filter độc tính
+_RE_DANGER_QUESTION = re.compile(r"\bco (?:phai )?(?:la )?(?:ran |loai |con )?(?:noc doc|doc|noc|nguy hiem|chet nguoi)\b"
+                                 r"(?=(?: \w+)* (?:khong|ko|k)(?: \||$))")
+_RE_LISTING = re.compile(r"\b(liet ke|danh sach|top|ke ten|nhung loai|cac loai|nhung con|cac con|nhung ran|cac ran|"
+                         r"bao nhieu loai|may loai|(?:loai|ran|con)(?: (?!o\b|tai\b|noi\b)\w+){0,2} nao)\b")
+_RE_LIMIT = re.compile(r"\b(?:top|liet ke|ke ten|ke) (\d{1,2})\b|\b(\d{1,2}) (?:loai|con|ran)\b")
+# "chưa", "đừng", "chẳng" bỏ dấu trùng "chứa", "dùng", "chàng"... nên không tính
+_RE_NEGATION = re.compile(rf"\b(khong|ko|tranh|ngoai tru|{_TRU})\b")
+# Trợ từ nghi vấn cuối mệnh đề ("... không?", "... chưa?") không phải phủ định
+_RE_QUESTION_TAIL = re.compile(r"\b(khong|ko|chua|k)(?= \||$)")
+# "ở <địa danh lạ>" -> có thể là quốc gia ngoài gazetteer, để LLM chuẩn hoá
+_RE_LOCATION = re.compile(r"\b(?:o|tai|den tu) (\w+)")
+_LOCATION_STOP = {"dau", "nha", "nuoc", "vung", "rung", "khu", "mien", "nui", "song", "bien", "dong", "ho", "trong",
+                  "ngoai", "day", "do", "sao", "nhung", "cac", "moi", "vuon", "ruong", "nong", "thanh", "chau", "tren",
+                  "duoi", "gan", "quanh", "noi", "viet", "|"}
+
+# Intent chỉ giữ được một quốc gia mỗi chiều -> câu nêu nhiều nước luôn để LLM parse
+PENALTY = {"negation": 0.5, "unknown_location": 0.4, "danger_conflict": 0.4, "extra_countries": 0.4}
+
+
+def normalize(query: str, fold: bool = True) -> str:
+    """`fold=False`: giữ dấu và hoa-thường, vị trí ký tự khớp với bản đã fold (câu tiếng Việt thông thường)."""
+    text = fold_text(query) if fold else unicodedata.normalize("NFC", str(query))
+    text = re.sub(r"[,;.?!]+", " | ", text)
+    return " ".join(re.findall(r"\w+|\|", text))
+
+
+def _confirmed(alias: str, text: str, original: Optional[str], start: int, end: int) -> bool:
+    if alias not in AMBIGUOUS:
+        return True
+    before = text[:start].split()
+    if before and before[-1] in _PLACE_CUES:
+        return True
+    spelling = AMBIGUOUS[alias]
+    if spelling is None or original is None:
+        return False
+    span = original[start:end]
+    return span == spelling if spelling != spelling.lower() else span.lower() == spelling
+
+
+def _covered(start: int, end: int, spans: List[Tuple[int, int]]) -> bool:
+    return any(s <= start and end <= e for s, e in spans)
+
+
+class IntentRules:
+    """Parser luật cho câu hỏi tìm rắn: fold dấu một lần, pattern biên dịch sẵn, trả về (intent, confidence, reasons).
+
+    confidence = 1 - tổng penalty theo `reasons`; HybridParser chỉ gọi LLM khi confidence dưới ngưỡng."""
+
+    def parse(self, query: str) -> Tuple[dict, float, List[str]]:
+        text = normalize(query)
+        original = normalize(query, fold=False)
+        if len(original) != len(text):
+            original = None  # không căn được vị trí -> alias mơ hồ chỉ nhận sau từ nơi chốn
+        intent = {"intent_type": "detail", "limit": 5, "must_country": None, "must_not_country": None, "danger_level": None}
+        reasons = []
+        consumed = [(m.start(), m.end()) for m in _RE_QUESTION_TAIL.finditer(text)]
+
+        if _RE_LISTING.search(text):
+            intent["intent_type"] = "listing"
+            intent["limit"] = 10
+        m = _RE_LIMIT.search(text)
+        if m:
+            intent["limit"] = max(1, min(int(m.group(1) or m.group(2)), 50))
+
+        # Quốc gia + phạm vi phủ định
+        positive, negative = [], []
+        for m in _RE_COUNTRY.finditer(text):
+            if not _confirmed(m.group(1), text, original, m.start(1), m.end(1)):
+                continue
+            clause_start = text.rfind("|", 0, m.start()) + 1
+            cues = list(_RE_NEG_LOC.finditer(text, clause_start, m.start()))
+            negated = False
+            if cues:
+                gap = text[cues[-1].end():m.start()].split()
+                negated = all(t in _LIST_GLUE or t in _ALIAS_TOKENS for t in gap)
+                if negated:
+                    consumed.append((cues[-1].start(), cues[-1].end()))
+            (negative if negated else positive).append((_ALIASES[m.group(1)], m.group(1) in GENERIC_VIETNAM))
+        if any(c and not generic for c, generic in positive + negative):
+            positive = [(c, generic) for c, generic in positive if not generic]
+            negative = [(c, generic) for c, generic in negative if not generic]
+        positive = [c for c in dict.fromkeys(c for c, _ in positive) if c]
+        negative = [c for c in dict.fromkeys(c for c, _ in negative) if c]
+        intent["must_country"] = positive[0] if positive else None
+        intent["must_not_country"] = negative[0] if negative else None
+        if len(positive) > 1 or len(negative) > 1:
+            reasons.append("extra_countries")
+        for m in _RE_LOCATION.finditer(text):
+            word = m.group(1)
+            if word not in _LOCATION_STOP and not _RE_COUNTRY.match(text, m.start(1)):  # sau "ở" là alias đã xác nhận
+                reasons.append("unknown_location")
+                break
+
+        # Độc tính
+        safe = list(_RE_SAFE.finditer(text))
+        consumed += [(m.start(), m.end()) for m in safe]
+        asked = [(m.start(), m.end()) for m in _RE_DANGER_QUESTION.finditer(text)]
+        venom = [m for m in _RE_VENOM.finditer(text) if not _covered(m.start(), m.end(), consumed + asked)]
+        if safe and venom:
+            reasons.append("danger_conflict")
+        elif safe:
+            intent["danger_level"] = "Non-venomous"
+        elif venom:
+            intent["danger_level"] = "Venomous"
+
+        # Phủ định còn lại (chưa thuộc phạm vi nào ở trên) -> rule không hiểu được câu
+        if any(not _covered(m.start(), m.end(), consumed) for m in _RE_NEGATION.finditer(text)):
+            reasons.append("negation")
+
+        confidence = round(max(0.0, 1.0 - sum(PENALTY[r] for r in reasons)), 2)
+        return intent, confidence, reasons
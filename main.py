@@ -1,27 +1,34 @@
 import os
 import time
+_PROCESS_START = time.perf_counter()
 import logging
 import secrets
-import re
 import asyncio
-import hashlib
-from typing import Optional, Dict
+import json
+import importlib
+from typing import Optional, Dict, List
 
 # --- [FIXED] DÒNG NÀY RẤT QUAN TRỌNG ---
-from contextlib import asynccontextmanager 
+from contextlib import asynccontextmanager, contextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Request, Security
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security.api_key import APIKeyHeader
-from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_fixed
 
-from elasticsearch import AsyncElasticsearch
-from sentence_transformers import SentenceTransformer
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+# elasticsearch / sentence_transformers / langchain được import lười trong load_resources()
+# để uvicorn bind port ngay, không phải chờ vài giây import
+from embedding import DirectEmbedder, EmbedBatcher, EmbedQueueFull, EmbedWorkerPool, load_sentence_transformer
+from metrics import (ADMISSION_SHED, ES_DEGRADED, ES_TOOK_SECONDS, ES_WALL_SECONDS, PARSER_FALLBACK, PARSER_PATH, REGISTRY, TRACE_RESPONSES, Trace,
+                     register_admission_metrics, register_cache_metrics, register_es_metrics, token_usage_callback)
+from admission import KeyLimiter, Overloaded, client_address, gate_from_env, parse_networks
+from es_client import CircuitBreaker, ResilientSearch, SearchUnavailable, connect_es
+from embedding_store import EmbeddingStore
+from species_names import SpeciesMatcher
+from intent_rules import IntentRules
+from cache_store import JsonCodec, SemanticCache, VectorCodec, build_cache, cache_key, to_float32
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
@@ -32,13 +39,120 @@ ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = "google/gemini-2.5-flash-lite"
 EMBEDDING_MODEL = "BAAI/bge-m3"
+# Khởi động nhanh: bản model lưu local (python embedding.py <dir> [backend]) + backend onnx/openvino
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH") or EMBEDDING_MODEL
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE")
+# LAZY_STARTUP=1: nhận kết nối ngay, load model ở background; /readyz báo khi sẵn sàng
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "0") == "1"
 API_KEY_VAL = os.getenv("APP_API_KEY", "secret-snake-key")
 
+# Micro-batching embedding cho các request đồng thời
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "1") == "1"
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_QUEUE_MAX = int(os.getenv("EMBED_QUEUE_MAX", "256"))
+
+# EMBED_WORKERS > 0: chạy model trong các tiến trình riêng (shared memory), API process không encode
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+EMBED_WORKER_THREADS = int(os.getenv("EMBED_WORKER_THREADS", "0"))
+EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", "1024"))
+
+# SEARCH_BACKEND=local: tìm kiếm trong process (search_backend.py) trên index do `etl_snake.py --export-local` xuất ra
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "es")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+# Client ES cho đường query (es_client.py): pool + keep-alive, hedged request, circuit breaker
+ES_POOL_SIZE = int(os.getenv("ES_POOL_SIZE", "20"))
+ES_HTTP_COMPRESS = os.getenv("ES_HTTP_COMPRESS", "0") == "1"
+ES_TIMEOUT = float(os.getenv("ES_TIMEOUT", "5"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "1"))
+ES_HEDGE = os.getenv("ES_HEDGE", "1") == "1"
+ES_HEDGE_PERCENTILE = float(os.getenv("ES_HEDGE_PERCENTILE", "95"))
+ES_HEDGE_MIN_MS = float(os.getenv("ES_HEDGE_MIN_MS", "20"))
+ES_HEDGE_MAX_MS = float(os.getenv("ES_HEDGE_MAX_MS", "1000"))
+ES_HEDGE_BUDGET = float(os.getenv("ES_HEDGE_BUDGET", "0.1"))
+ES_BREAKER_FAILURES = int(os.getenv("ES_BREAKER_FAILURES", "5"))
+ES_BREAKER_RESET_S = float(os.getenv("ES_BREAKER_RESET_S", "10"))
+# Index local (etl_snake.py --export-local) dùng khi breaker mở; rỗng = trả 503 ngay
+ES_FALLBACK_DIR = os.getenv("ES_FALLBACK_DIR", "")
+
 # --- CACHE ---
-PARSE_CACHE = {} 
-EMBED_CACHE = {}
+# Giới hạn theo số entry + byte, LRU eviction, TTL tuỳ chọn (0 = không hết hạn)
+# CACHE_BACKEND=sqlite|redis để chia sẻ cache giữa các uvicorn worker
+PARSE_CACHE = build_cache(
+    "parse", JsonCodec,
+    max_entries=int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "20000")),
+    max_bytes=int(os.getenv("PARSE_CACHE_MAX_MB", "16")) * 1024 * 1024,
+    ttl=float(os.getenv("PARSE_CACHE_TTL", "0")) or None,
+)
+EMBED_CACHE = build_cache(
+    "embed", VectorCodec,
+    max_entries=int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "20000")),
+    max_bytes=int(os.getenv("EMBED_CACHE_MAX_MB", "128")) * 1024 * 1024,
+    ttl=float(os.getenv("EMBED_CACHE_TTL", "0")) or None,
+)
+# Kho embedding trên đĩa (embedding_store.py): vector câu hỏi sống qua restart, warm-start EMBED_CACHE lúc khởi động
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", "")
+EMBED_STORE_WARM = int(os.getenv("EMBED_STORE_WARM", "5000"))
+# Câu hỏi của người dùng không có hạn -> giữ tối đa EMBED_STORE_MAX_ROWS vector mới nhất (0 = không giới hạn)
+EMBED_STORE_MAX_ROWS = int(os.getenv("EMBED_STORE_MAX_ROWS", "100000"))
+EMBED_STORE = EmbeddingStore(EMBED_STORE_DIR, EMBEDDING_MODEL_PATH, EMBEDDING_DIMS, namespace="queries",
+                             max_rows=EMBED_STORE_MAX_ROWS) if EMBED_STORE_DIR else None
+ANSWER_CACHE = build_cache(
+    "answer", JsonCodec,
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_MB", "32")) * 1024 * 1024,
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")) or None,
+)
+# Cache ngữ nghĩa: câu hỏi diễn đạt khác nhưng vector gần nhau + cùng filter -> dùng lại câu trả lời
+SEMANTIC_CACHE = SemanticCache(
+    capacity=int(os.getenv("SEMANTIC_CACHE_CAPACITY", "2000")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")) or None,
+)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+# Tra tên loài (species_names.json do `etl_snake.py` xuất): câu hỏi chứa đúng một tên loài -> mget thẳng, bỏ qua embed/knn/LLM parse.
+# Tóm tắt theo loài không phụ thuộc câu hỏi, khoá theo content_hash nên tự mất hiệu lực khi ETL cập nhật document
+NAME_DICT_PATH = os.getenv("NAME_DICT_PATH", "species_names.json")
+SPECIES_FAST_PATH = os.getenv("SPECIES_FAST_PATH", "1") == "1"
+SPECIES_SUMMARY_PREWARM = os.getenv("SPECIES_SUMMARY_PREWARM", "0") == "1"
+SPECIES_SUMMARY_CACHE = build_cache(
+    "species_summary", JsonCodec,
+    max_entries=int(os.getenv("SPECIES_SUMMARY_MAX_ENTRIES", "20000")),
+    max_bytes=int(os.getenv("SPECIES_SUMMARY_MAX_MB", "64")) * 1024 * 1024,
+    ttl=float(os.getenv("SPECIES_SUMMARY_TTL", "0")) or None,
+)
+register_cache_metrics({"parse": PARSE_CACHE, "embed": EMBED_CACHE, "answer": ANSWER_CACHE, "semantic": SEMANTIC_CACHE,
+                        "species_summary": SPECIES_SUMMARY_CACHE,
+                        **({"embed_store": EMBED_STORE} if EMBED_STORE is not None else {})})
+
+# --- ADMISSION CONTROL ---
+# Quota theo API key (request không có key: theo IP, quota thấp hơn) + giới hạn đồng thời từng stage có hàng đợi giới hạn
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Chạy sau reverse proxy / load balancer: khai báo IP/CIDR của proxy (VD: "10.0.0.0/8,127.0.0.1") để quota anonymous
+# tính theo client trong X-Forwarded-For. Không khai báo -> mọi user anonymous sau proxy dùng chung một bucket
+TRUSTED_PROXIES = parse_networks(os.getenv("TRUSTED_PROXIES", ""))
+KEY_LIMITER = KeyLimiter(float(os.getenv("ADMISSION_KEY_RATE", "5")), float(os.getenv("ADMISSION_KEY_BURST", "20")))
+ANON_LIMITER = KeyLimiter(float(os.getenv("ADMISSION_ANON_RATE", "1")), float(os.getenv("ADMISSION_ANON_BURST", "5")))
+# Batch tốn một token / câu; phần vượt burst được chờ trả dần theo rate. Mặc định đủ lâu để batch lớn nhất
+# (BATCH_MAX_QUESTIONS) vừa cả quota anonymous -> 413 chỉ xảy ra khi cấu hình tay nhỏ hơn
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_QUOTA_MAX_WAIT = float(os.getenv("BATCH_QUOTA_MAX_WAIT_S", "0")) or max(
+    0.0, *((BATCH_MAX_QUESTIONS - lim.burst) / lim.rate for lim in (KEY_LIMITER, ANON_LIMITER)))
+GATES = {
+    "embed": gate_from_env("embed", limit=64, max_queue=256, max_wait_ms=2000),
+    "es": gate_from_env("es", limit=64, max_queue=256, max_wait_ms=1000),
+    # summarizer quá tải -> không 503 mà trả câu trả lời template (degraded)
+    "summarize": gate_from_env("summarize", limit=16, max_queue=32, max_wait_ms=500),
+}
+# Công tắc vận hành: bỏ hẳn summarizer (VD: hết quota OpenRouter)
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "0") == "1"
+register_admission_metrics(GATES, {"api_key": KEY_LIMITER, "anonymous": ANON_LIMITER})
 
 # --- 1. HYBRID PARSER ---
+# Dưới ngưỡng này (intent_rules.IntentRules) mới gọi LLM parser
+PARSER_MIN_CONFIDENCE = float(os.getenv("PARSER_MIN_CONFIDENCE", "0.7"))
+
 class SearchFilters(BaseModel):
     must_country: Optional[str] = None
     must_not_country: Optional[str] = None
@@ -48,6 +162,9 @@ class SearchFilters(BaseModel):
 
 class HybridParser:
     def __init__(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import JsonOutputParser
+
         self.llm_parser = JsonOutputParser(pydantic_object=SearchFilters)
         self.llm_chain = (
             ChatPromptTemplate.from_template("""
@@ -62,124 +179,386 @@ class HybridParser:
             """) 
             | llm 
             | self.llm_parser
-        )
+        ).with_config(callbacks=[token_usage_callback("parser")])
         
-        self.re_vietnam = re.compile(r'\b(viet\s*nam|vn|nuoc\s*ta)\b', re.IGNORECASE)
-        self.re_listing = re.compile(r'\b(liet\s*ke|danh\s*sach|top|nhung\s*loai|cac\s*loai)\b', re.IGNORECASE)
-        self.re_venom = re.compile(r'\b(doc|noc|nguy\s*hiem|chet\s*nguoi)\b', re.IGNORECASE)
-        self.re_safe = re.compile(r'\b(lanh|khong\s*doc|vo\s*hai)\b', re.IGNORECASE)
-        self.re_negation = re.compile(r'\b(khong|chua|tranh|tru)\b', re.IGNORECASE)
+        self.rules = IntentRules()
+
+    def _fast_parse(self, query: str) -> Optional[dict]:
+        # Fast Path (luật, đã bỏ dấu); None -> cần LLM
+        intent, confidence, reasons = self.rules.parse(query)
+        if confidence >= PARSER_MIN_CONFIDENCE:
+            return intent
+        for reason in reasons:
+            PARSER_FALLBACK.inc(reason)
+        logger.info(f"🐢 Parser fallback to LLM (confidence {confidence}, {', '.join(reasons)}): {query!r}")
+        return None
 
     async def parse(self, query: str) -> dict:
-        q_hash = hashlib.md5(query.encode()).hexdigest()
-        if q_hash in PARSE_CACHE: return PARSE_CACHE[q_hash]
-
-        # Fast Path (Regex)
-        if not self.re_negation.search(query):
-            intent = {"intent_type": "detail", "limit": 5, "must_country": None, "must_not_country": None, "danger_level": None}
-            if self.re_listing.search(query):
-                intent["intent_type"] = "listing"
-                intent["limit"] = 10
-            if self.re_vietnam.search(query):
-                intent["must_country"] = "Vietnam"
-            if self.re_safe.search(query):
-                intent["danger_level"] = "Non-venomous"
-            elif self.re_venom.search(query):
-                intent["danger_level"] = "Venomous"
-            
-            PARSE_CACHE[q_hash] = intent
+        q_hash = cache_key(query)
+        cached = PARSE_CACHE.get(q_hash)
+        if cached is not None:
+            PARSER_PATH.inc("cache")
+            return cached
+
+        intent = self._fast_parse(query)
+        if intent is not None:
+            PARSER_PATH.inc("fast")
+            PARSE_CACHE.set(q_hash, intent)
             return intent
 
         # Slow Path (LLM)
         try:
             res = await self.llm_chain.ainvoke({"query": query, "format_instructions": self.llm_parser.get_format_instructions()})
-            PARSE_CACHE[q_hash] = res
+            PARSER_PATH.inc("llm")
+            PARSE_CACHE.set(q_hash, res)
             return res
         except:
+            PARSER_PATH.inc("llm_error")
             return {"intent_type": "detail", "limit": 5}
 
+    async def parse_many(self, queries: list, max_concurrency: int = 8) -> list:
+        """Parse cả batch: cache + regex cho tất cả trước, phần còn lại gom vào một lần llm_chain.abatch."""
+        results = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            q_hash = cache_key(query)
+            intent = PARSE_CACHE.get(q_hash)
+            if intent is not None:
+                PARSER_PATH.inc("cache")
+            else:
+                intent = self._fast_parse(query)
+                if intent is not None:
+                    PARSER_PATH.inc("fast")
+                    PARSE_CACHE.set(q_hash, intent)
+            if intent is None:
+                pending.append(i)
+            results[i] = intent
+
+        if pending:
+            fmt = self.llm_parser.get_format_instructions()
+            outputs = await self.llm_chain.abatch(
+                [{"query": queries[i], "format_instructions": fmt} for i in pending],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True,
+            )
+            for i, res in zip(pending, outputs):
+                if isinstance(res, Exception):
+                    PARSER_PATH.inc("llm_error")
+                    results[i] = {"intent_type": "detail", "limit": 5}
+                else:
+                    PARSER_PATH.inc("llm")
+                    PARSE_CACHE.set(cache_key(queries[i]), res)
+                    results[i] = res
+        return results
+
 # --- 2. SETUP ---
 resources = {}
+register_es_metrics(lambda: resources["es"].stats() if isinstance(resources.get("es"), ResilientSearch) else {})
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 async def verify_api_key(key: str = Security(api_key_header)):
     if key and secrets.compare_digest(key, API_KEY_VAL): return key
     return "dev_mode"
 
+def shed(e: Overloaded) -> HTTPException:
+    ADMISSION_SHED.inc(e.stage, e.reason)
+    headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after > 0 else None
+    return HTTPException(status_code=e.status, detail=str(e), headers=headers)
+
+def check_quota(request: Request, key: str, cost: float = 1.0, max_wait: float = 0.0) -> float:
+    """Trả về số giây phải chờ quota (chỉ khác 0 khi `max_wait` > 0)."""
+    if not ADMISSION_ENABLED:
+        return 0.0
+    try:
+        if key == "dev_mode":
+            peer = request.client.host if request.client else "unknown"
+            return ANON_LIMITER.check(client_address(peer, request.headers.get("x-forwarded-for"), TRUSTED_PROXIES),
+                                      cost, max_wait)
+        return KEY_LIMITER.check(key, cost, max_wait)
+    except Overloaded as e:
+        raise shed(e)
+
+async def admit(request: Request, key: str = Depends(verify_api_key)):
+    """Hết quota -> 429 ngay, trước khi tốn embed / ES / LLM."""
+    check_quota(request, key)
+
+@asynccontextmanager
+async def stage_slot(stage: str):
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    async with GATES[stage].slot():
+        yield
+
+@asynccontextmanager
+async def summarizer_slot():
+    """Raise Overloaded khi DEGRADED_MODE hoặc summarizer quá tải; caller trả fallback_answer thay vì chờ LLM."""
+    if DEGRADED_MODE:
+        raise Overloaded("summarize", "degraded_mode")
+    async with stage_slot("summarize"):
+        yield
+
+STARTUP = {"ready": False, "error": None, "phases": {}}
+
+async def require_ready():
+    if not STARTUP["ready"]:
+        raise HTTPException(status_code=503, detail="Service is starting")
+
+@contextmanager
+def startup_phase(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP["phases"][name] = round(time.perf_counter() - t, 3)
+
+def _import_heavy():
+    if SEARCH_BACKEND == "es":
+        importlib.import_module("elasticsearch")
+    for mod in ("langchain_openai", "langchain_core.prompts", "langchain_core.output_parsers"):
+        importlib.import_module(mod)
+    if EMBED_WORKERS == 0:
+        importlib.import_module("sentence_transformers")
+
+def _load_embed_model():
+    if EMBED_WORKERS > 0:
+        logger.info(f"⏳ Starting {EMBED_WORKERS} embedding worker processes...")
+        pool = EmbedWorkerPool(EMBEDDING_MODEL_PATH, EMBED_WORKERS, dims=EMBEDDING_DIMS,
+                               capacity=max(EMBED_BATCH_MAX, 1), threads_per_worker=EMBED_WORKER_THREADS,
+                               backend=EMBEDDING_BACKEND, onnx_file=EMBEDDING_ONNX_FILE)
+        pool.start()
+        return pool, pool.encode
+
+    logger.info(f"⏳ Loading Embed Model ({EMBEDDING_MODEL_PATH}, {EMBEDDING_BACKEND})...")
+    embed_model = load_sentence_transformer(EMBEDDING_MODEL_PATH, backend=EMBEDDING_BACKEND,
+                                            onnx_file=EMBEDDING_ONNX_FILE)
+
+    def encode_batch(texts):
+        return embed_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+    return embed_model, encode_batch
+
+async def _connect_es():
+    if SEARCH_BACKEND == "local":
+        from search_backend import LocalSearchBackend
+
+        with startup_phase("es_connect"):
+            resources["es"] = await asyncio.to_thread(LocalSearchBackend.load, LOCAL_INDEX_DIR)
+        return
+
+    with startup_phase("es_connect"):
+        raw = connect_es(ES_HOST, pool_size=ES_POOL_SIZE, request_timeout=ES_TIMEOUT, max_retries=ES_MAX_RETRIES,
+                         http_compress=ES_HTTP_COMPRESS, verify_certs=False, ssl_show_warn=False)
+        es = ResilientSearch(raw, CircuitBreaker(ES_BREAKER_FAILURES, ES_BREAKER_RESET_S), hedge=ES_HEDGE,
+                             hedge_percentile=ES_HEDGE_PERCENTILE, hedge_min_ms=ES_HEDGE_MIN_MS,
+                             hedge_max_ms=ES_HEDGE_MAX_MS, hedge_budget=ES_HEDGE_BUDGET, pool_size=ES_POOL_SIZE)
+        resources["es"] = es
+        if ES_FALLBACK_DIR:
+            from search_backend import LocalSearchBackend
+
+            resources["es_fallback"] = await asyncio.to_thread(LocalSearchBackend.load, ES_FALLBACK_DIR)
+        if not await es.ping():
+            logger.warning(f"⚠️ Elasticsearch at {ES_HOST} not reachable yet")
+
+def _init_llm(llm=None):
+    """`llm` cho phép thay ChatOpenAI bằng bản giả (bench_api.py)."""
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
+    with startup_phase("llm_init"):
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(
+                openai_api_key=OPENROUTER_API_KEY,
+                base_url="https://openrouter.ai/api/v1",
+                model=OPENROUTER_MODEL,
+                temperature=0.3,
+                stream_usage=True
+            )
+        
+        # Prompt Tóm tắt thông minh
+        summarizer_prompt = ChatPromptTemplate.from_template("""
+        Bạn là chuyên gia bò sát học. Dựa vào dữ liệu sau về loài rắn:
+        {context}
+        
+        Câu hỏi của người dùng: "{question}"
+        
+        NHIỆM VỤ:
+        - Hãy viết một câu trả lời tự nhiên, hấp dẫn (khoảng 3-4 câu).
+        - Kết hợp thông tin về hình dáng, nơi sống và độ độc.
+        - Nếu dữ liệu phân bố (country) bị thiếu, đừng nhắc đến nó.
+        - Nếu rắn có độc, hãy cảnh báo.
+        """)
+
+        resources["parser"] = HybridParser(llm)
+        resources["summarizer"] = (summarizer_prompt | llm | StrOutputParser()).with_config(
+            callbacks=[token_usage_callback("summarizer")])
+
+async def _start_embedder():
+    with startup_phase("model_load"):
+        embed_model, encode_batch = await asyncio.to_thread(_load_embed_model)
+        if EMBED_BATCH_ENABLED:
+            # Model trong process: một batch một lúc (torch đã dùng hết core); worker pool: mỗi worker một batch
+            embedder = EmbedBatcher(encode_batch, max_batch=EMBED_BATCH_MAX, window_ms=EMBED_BATCH_WINDOW_MS,
+                                    max_queue=EMBED_QUEUE_MAX, concurrency=max(EMBED_WORKERS, 1))
+        else:
+            embedder = DirectEmbedder(encode_batch)
+        await embedder.start()
+        resources["embed"] = embed_model
+        resources["embedder"] = embedder
+
+def _warm_embed_cache():
+    with startup_phase("embed_warm"):
+        warmed = EMBED_STORE.recent(EMBED_STORE_WARM)
+        for key, vec in reversed(warmed):  # cũ trước, mới sau -> bản mới nhất nằm cuối LRU
+            EMBED_CACHE.set(key, vec)
+        logger.info(f"♨️ Warmed embed cache with {len(warmed)} vectors from {EMBED_STORE.dir}")
+
+def _load_species_matcher():
+    with startup_phase("species_names"):
+        if not os.path.exists(NAME_DICT_PATH):
+            logger.warning(f"⚠️ {NAME_DICT_PATH} not found, species fast path disabled (run etl_snake.py to export it)")
+            return
+        resources["species"] = SpeciesMatcher.load(NAME_DICT_PATH)
+        logger.info(f"📖 Loaded {len(resources['species'])} species names from {NAME_DICT_PATH}")
+
+def _persist_vectors(keys: list, vectors: list):
+    try:
+        EMBED_STORE.put_many(keys, vectors)
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding store write failed: {e}")
+
+async def load_resources():
+    """Load theo phase (imports -> LLM init -> ES connect song song với model load), ghi thời gian từng phase."""
+    try:
+        with startup_phase("imports"):
+            await asyncio.to_thread(_import_heavy)
+        _init_llm()
+        warm = [asyncio.to_thread(_warm_embed_cache)] if EMBED_STORE is not None else []
+        if SPECIES_FAST_PATH:
+            warm.append(asyncio.to_thread(_load_species_matcher))
+        await asyncio.gather(_connect_es(), _start_embedder(), *warm)
+        STARTUP["phases"]["time_to_ready"] = round(time.perf_counter() - _PROCESS_START, 3)
+        STARTUP["ready"] = True
+        logger.info(f"✅ Ready! {STARTUP['phases']}")
+        if SPECIES_SUMMARY_PREWARM and "species" in resources:
+            resources["prewarm"] = asyncio.create_task(prewarm_species_summaries())
+    except Exception as e:
+        STARTUP["error"] = repr(e)
+        logger.error(f"❌ Startup failed: {e}")
+        raise
+
+async def release_resources():
+    if "prewarm" in resources:
+        resources["prewarm"].cancel()
+    if "embedder" in resources:
+        await resources["embedder"].stop()
+    if isinstance(resources.get("embed"), EmbedWorkerPool):
+        await asyncio.to_thread(resources["embed"].stop)
+    if "es" in resources:
+        await resources["es"].close()
+    resources.clear()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # ES Client
-    es = AsyncElasticsearch(ES_HOST, verify_certs=False, ssl_show_warn=False, request_timeout=5)
-    
-    logger.info("⏳ Loading Embed Model...")
-    embed_model = SentenceTransformer(EMBEDDING_MODEL)
-    
-    llm = ChatOpenAI(
-        openai_api_key=OPENROUTER_API_KEY,
-        base_url="https://openrouter.ai/api/v1",
-        model=OPENROUTER_MODEL,
-        temperature=0.3
-    )
-    
-    # Prompt Tóm tắt thông minh
-    summarizer_prompt = ChatPromptTemplate.from_template("""
-    Bạn là chuyên gia bò sát học. Dựa vào dữ liệu sau về loài rắn:
-    {context}
-    
-    Câu hỏi của người dùng: "{question}"
-    
-    NHIỆM VỤ:
-    - Hãy viết một câu trả lời tự nhiên, hấp dẫn (khoảng 3-4 câu).
-    - Kết hợp thông tin về hình dáng, nơi sống và độ độc.
-    - Nếu dữ liệu phân bố (country) bị thiếu, đừng nhắc đến nó.
-    - Nếu rắn có độc, hãy cảnh báo.
-    """)
-    
-    resources["es"] = es
-    resources["embed"] = embed_model
-    resources["parser"] = HybridParser(llm)
-    resources["summarizer"] = summarizer_prompt | llm | StrOutputParser()
-    
-    logger.info("✅ Ready!")
+    loader = None
+    if LAZY_STARTUP:
+        loader = asyncio.create_task(load_resources())
+    else:
+        await load_resources()
     yield
-    await es.close()
-    resources.clear()
+    if loader and not loader.done():
+        loader.cancel()
+    await release_resources()
 
 app = FastAPI(title="Snake RAG Smart", lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     question: str = Field(..., min_length=2, max_length=500)
 
-@app.post("/api/ask-snake", dependencies=[Depends(verify_api_key)])
-async def ask_snake(req: QueryRequest):
-    start = time.time()
-    
-    # 1. Parse
-    intent = await resources["parser"].parse(req.question)
-    
-    # 2. Embed
-    q_hash = hashlib.md5(req.question.encode()).hexdigest()
-    if q_hash in EMBED_CACHE:
-        query_vector = EMBED_CACHE[q_hash]
-    else:
-        query_vector = await run_in_threadpool(resources["embed"].encode, req.question)
-        query_vector = query_vector.tolist()
-        EMBED_CACHE[q_hash] = query_vector
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
 
-    # 3. Query ES
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# --- 3. PIPELINE (dùng chung cho /api/ask-snake và bản streaming) ---
+NOT_FOUND_ANSWER = "Xin lỗi, tôi không tìm thấy thông tin về loài rắn này trong cơ sở dữ liệu."
+
+async def embed_question(question: str):
+    q_hash = cache_key(question)
+    query_vector = EMBED_CACHE.get(q_hash)
+    if query_vector is None and EMBED_STORE is not None:
+        # SQLite + memmap, có thể chờ lock của put_many -> không chạy trên event loop
+        query_vector = await asyncio.to_thread(EMBED_STORE.get, q_hash)
+        if query_vector is not None:
+            EMBED_CACHE.set(q_hash, query_vector)
+    if query_vector is None:
+        try:
+            async with stage_slot("embed"):
+                query_vector = to_float32(await resources["embedder"].encode(question))
+        except EmbedQueueFull:
+            raise HTTPException(status_code=503, detail="Embedding queue is full, retry later")
+        except Overloaded as e:
+            raise shed(e)
+        EMBED_CACHE.set(q_hash, query_vector)
+        if EMBED_STORE is not None:
+            # Ghi đĩa ngoài event loop, không chờ
+            asyncio.get_running_loop().run_in_executor(None, _persist_vectors, [q_hash], [query_vector])
+    return query_vector
+
+async def es_call(op: str, **kwargs) -> dict:
+    """Gọi ES qua ResilientSearch; ES không dùng được -> index local (nếu có, kết quả gắn `degraded`) hoặc 503."""
+    t = time.perf_counter()
+    try:
+        async with stage_slot("es"):
+            res = await getattr(resources["es"], op)(**kwargs)
+    except Overloaded as e:
+        raise shed(e)
+    except SearchUnavailable as e:
+        fallback = resources.get("es_fallback")
+        if fallback is None:
+            ES_DEGRADED.inc(op, "none")
+            raise HTTPException(status_code=503, detail=f"Search temporarily unavailable ({e})",
+                                headers={"Retry-After": str(max(1, int(ES_BREAKER_RESET_S)))})
+        ES_DEGRADED.inc(op, "local_index")
+        res = {**await getattr(fallback, op)(**kwargs), "degraded": "local_index"}
+    ES_WALL_SECONDS.observe(time.perf_counter() - t, op)
+    if "took" in res:
+        ES_TOOK_SECONDS.observe(res["took"] / 1000, op)
+    return res
+
+async def es_search(body: dict) -> dict:
+    return await es_call("search", index="snakes", body=body)
+
+async def es_msearch(searches: list) -> dict:
+    return await es_call("msearch", searches=searches)
+
+async def es_mget(ids: list, source: list) -> dict:
+    return await es_call("mget", index="snakes", ids=ids, _source=source)
+
+LISTING_SOURCE = ["scientific_name", "vietnamese_name", "family", "danger_level", "countries", "biology_snippet", "venom_snippet"]
+DETAIL_SOURCE = LISTING_SOURCE + ["wiki_biology", "wiki_venom"]
+SPECIES_SOURCE = DETAIL_SOURCE + ["content_hash"]
+SPECIES_SUMMARY_QUESTION = "Giới thiệu ngắn gọn về loài rắn này."
+
+def build_es_query(question: str, intent: dict, query_vector) -> dict:
     must, must_not = [], []
     if intent.get("must_country"): must.append({"match": {"countries": intent["must_country"]}})
     if intent.get("must_not_country"): must_not.append({"match": {"countries": intent["must_not_country"]}})
     if intent.get("danger_level"): must.append({"term": {"danger_level": intent["danger_level"]}})
     
     limit = min(intent.get("limit", 5), 50)
+    # Listing trả lời bằng template -> chỉ cần đoạn trích ngắn, không kéo cả wiki_biology/wiki_venom về
+    source = LISTING_SOURCE if intent.get("intent_type") == "listing" else DETAIL_SOURCE
     
-    es_query = {
+    return {
         "size": limit,
-        "_source": ["scientific_name", "vietnamese_name", "family", "danger_level", "countries", "wiki_biology", "wiki_venom"],
+        "_source": source,
         "knn": {
             "field": "vector_embedding",
-            "query_vector": query_vector,
+            "query_vector": query_vector.tolist(),
             "k": limit,
             "num_candidates": 100,
             "filter": {"bool": {"must": must, "must_not": must_not}}
@@ -187,21 +566,15 @@ async def ask_snake(req: QueryRequest):
         "query": {
             "bool": {
                 "should": [
-                    {"multi_match": {"query": req.question, "fields": ["vietnamese_name^4", "scientific_name^2", "common_names"], "type": "phrase"}},
-                    {"multi_match": {"query": req.question, "fields": ["vietnamese_name", "scientific_name"], "type": "best_fields"}}
+                    {"multi_match": {"query": question, "fields": ["vietnamese_name^4", "scientific_name^2", "common_names"], "type": "phrase"}},
+                    {"multi_match": {"query": question, "fields": ["vietnamese_name", "scientific_name"], "type": "best_fields"}}
                 ],
                 "filter": {"bool": {"must": must, "must_not": must_not}}
             }
         }
     }
 
-    try:
-        res = await resources["es"].search(index="snakes", body=es_query)
-        hits = res['hits']['hits']
-    except Exception as e:
-        return {"error": str(e)}
-
-    # 4. Process Data & Context
+def process_hits(hits: list):
     data = []
     context_text = ""
     
@@ -214,7 +587,7 @@ async def ask_snake(req: QueryRequest):
             "sci_name": src.get("scientific_name"),
             "danger": src.get("danger_level"),
             "country": src.get("countries"),
-            "details": str(src.get("wiki_biology", ""))[:300] + "..."
+            "details": str(src.get("biology_snippet") or src.get("wiki_biology", ""))[:300] + "..."
         }
         data.append(item)
         
@@ -224,34 +597,477 @@ async def ask_snake(req: QueryRequest):
             - Họ: {src.get('family')}
             - Độc tính: {src.get('danger_level')}
             - Phân bố: {src.get('countries')}
-            - Đặc điểm: {src.get('wiki_biology', '')}
-            - Nọc độc: {src.get('wiki_venom', '')}
+            - Đặc điểm: {src.get('wiki_biology') or src.get('biology_snippet', '')}
+            - Nọc độc: {src.get('wiki_venom') or src.get('venom_snippet', '')}
             ----------------
             """
+    return data, context_text
 
-    # 5. Smart Response Logic
+def template_answer(intent: dict, hits: list) -> Optional[str]:
+    """Câu trả lời không cần LLM; None nghĩa là phải gọi summarizer."""
     if not hits:
-        answer = "Xin lỗi, tôi không tìm thấy thông tin về loài rắn này trong cơ sở dữ liệu."
-    
-    elif intent["intent_type"] == "listing" and len(hits) > 1:
-        answer = f"Tìm thấy {len(hits)} loài rắn phù hợp với yêu cầu của bạn. Xem chi tiết trong danh sách bên dưới."
-        
-    else:
+        return NOT_FOUND_ANSWER
+    if intent.get("intent_type") == "listing" and len(hits) > 1:
+        return f"Tìm thấy {len(hits)} loài rắn phù hợp với yêu cầu của bạn. Xem chi tiết trong danh sách bên dưới."
+    return None
+
+def fallback_answer(data: list) -> str:
+    top = data[0]
+    return f"Kết quả: {top['name']} ({top['sci_name']}). {top['details']}"
+
+def species_summary_key(hit: dict) -> str:
+    return f"{hit['_id']}:{hit['_source'].get('content_hash', '')}"
+
+async def species_lookup(question: str, intent: dict, trace: Trace) -> Optional[dict]:
+    """Fast path tra tên loài; None -> đi pipeline bình thường (không match, nhiều loài hoặc câu listing).
+    `intent`: kết quả HybridParser.parse của chính câu hỏi (không parse lại)."""
+    if intent.get("intent_type") != "detail":
+        return None
+    matcher = resources.get("species")
+    if matcher is None:
+        return None
+    matches = matcher.find(question)
+    if len({m["doc_id"] for m in matches}) != 1:
+        return None
+
+    with trace.stage("mget"):
+        res = await es_mget([matches[0]["doc_id"]], SPECIES_SOURCE)
+    hits = [{"_id": d["_id"], "_source": d["_source"]} for d in res["docs"] if d.get("found")]
+    if not hits:
+        return None  # dictionary cũ hơn index
+    PARSER_PATH.inc("species")
+    data, context_text = process_hits(hits)
+
+    key = species_summary_key(hits[0])
+    answer = SPECIES_SUMMARY_CACHE.get(key)
+    degraded = False
+    if answer is None:
+        try:
+            with trace.stage("summarize"):
+                async with summarizer_slot():
+                    answer = await resources["summarizer"].ainvoke({"context": context_text, "question": SPECIES_SUMMARY_QUESTION})
+            SPECIES_SUMMARY_CACHE.set(key, answer)
+        except Exception as e:
+            if isinstance(e, Overloaded):
+                ADMISSION_SHED.inc(e.stage, e.reason)
+            answer = fallback_answer(data)
+            degraded = True
+    return {"answer": answer, "data": data, "degraded": degraded,
+            "meta": {"intent": {**intent, "species": matches[0]["name"]}}}
+
+async def prewarm_species_summaries(chunk: int = 50):
+    """Chạy nền sau khi ready: tóm tắt trước mọi loài trong dictionary chưa có trong SPECIES_SUMMARY_CACHE."""
+    ids = resources["species"].doc_ids
+    done = 0
+    try:
+        for n in range(0, len(ids), chunk):
+            res = await es_mget(ids[n:n + chunk], SPECIES_SOURCE)
+            hits = [{"_id": d["_id"], "_source": d["_source"]} for d in res["docs"] if d.get("found")]
+            hits = [h for h in hits if SPECIES_SUMMARY_CACHE.get(species_summary_key(h)) is None]
+            if not hits:
+                continue
+            while DEGRADED_MODE or GATES["summarize"].saturated():  # nhường summarizer cho traffic thật
+                await asyncio.sleep(1)
+            outputs = await resources["summarizer"].abatch(
+                [{"context": process_hits([h])[1], "question": SPECIES_SUMMARY_QUESTION} for h in hits],
+                config={"max_concurrency": BATCH_LLM_CONCURRENCY},
+                return_exceptions=True,
+            )
+            for h, out in zip(hits, outputs):
+                if not isinstance(out, Exception):
+                    SPECIES_SUMMARY_CACHE.set(species_summary_key(h), out)
+                    done += 1
+        logger.info(f"♨️ Prewarmed {done} species summaries")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ Species summary prewarm stopped after {done}: {e}")
+
+def with_trace(meta: dict, trace: Trace) -> dict:
+    if not TRACE_RESPONSES:
+        return meta
+    return {**meta, "trace": trace.as_meta()}
+
+def remember_answer(a_hash: str, query_vector, intent: dict, response: dict):
+    ANSWER_CACHE.set(a_hash, response)
+    if SEMANTIC_CACHE_ENABLED:
+        SEMANTIC_CACHE.set(query_vector, intent, response)
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: process còn sống và event loop còn phản hồi
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    body = {"ready": STARTUP["ready"], "phases": STARTUP["phases"], "error": STARTUP["error"]}
+    return JSONResponse(body, status_code=200 if STARTUP["ready"] else 503)
+
+@app.post("/api/ask-snake", dependencies=[Depends(verify_api_key), Depends(require_ready), Depends(admit)])
+async def ask_snake(req: QueryRequest):
+    start = time.time()
+    trace = Trace("ask")
+
+    # 0. Answer cache (dùng chung giữa các worker nếu bật backend chia sẻ)
+    a_hash = cache_key(req.question)
+    cached = ANSWER_CACHE.get(a_hash)
+    if cached is not None:
+        trace.finish("answer_cache")
+        return {**cached, "meta": with_trace({**cached["meta"], "cached": True, "latency": f"{time.time() - start:.3f}s"}, trace)}
+
+    # 1. Parse (luật trước, LLM khi luật không chắc)
+    with trace.stage("parse"):
+        intent = await resources["parser"].parse(req.question)
+
+    # 1b. Câu hỏi nêu đúng một tên loài -> mget theo _id + tóm tắt đã cache, không embed / knn
+    try:
+        found = await species_lookup(req.question, intent, trace)
+    except Exception as e:
+        logger.warning(f"⚠️ Species fast path failed, falling back to search: {e}")
+        found = None
+    if found is not None:
+        degraded = found.pop("degraded")
+        found["meta"]["latency"] = f"{time.time() - start:.3f}s"
+        if not degraded:
+            ANSWER_CACHE.set(a_hash, found)
+        trace.finish("species_degraded" if degraded else "species")
+        return {**found, "meta": with_trace(found["meta"], trace)}
+
+    # 2. Embed
+    with trace.stage("embed"):
+        query_vector = await embed_question(req.question)
+
+    # 2b. Semantic cache (bỏ qua ES + LLM nếu có câu hỏi gần giống đã trả lời)
+    if SEMANTIC_CACHE_ENABLED:
+        cached, similarity = SEMANTIC_CACHE.get(query_vector, intent)
+        if cached is not None:
+            response = {**cached, "meta": {**cached["meta"], "intent": intent, "semantic_hit": round(similarity, 4),
+                                           "latency": f"{time.time() - start:.3f}s"}}
+            ANSWER_CACHE.set(a_hash, response)
+            trace.finish("semantic_cache")
+            return {**response, "meta": with_trace(response["meta"], trace)}
+
+    # 3. Query ES
+    es_query = build_es_query(req.question, intent, query_vector)
+
+    try:
+        with trace.stage("search"):
+            res = await es_search(es_query)
+        hits = res['hits']['hits']
+    except HTTPException:
+        trace.finish("es_unavailable")
+        raise
+    except Exception as e:
+        trace.finish("es_error")
+        return {"error": str(e)}
+
+    # 4. Process Data & Context
+    data, context_text = process_hits(hits)
+
+    # 5. Smart Response Logic
+    degraded = False
+    overloaded = False
+    answer = template_answer(intent, hits)
+    if answer is None:
         # Dùng AI Summarizer
         try:
-            answer = await resources["summarizer"].ainvoke({
-                "context": context_text,
-                "question": req.question
-            })
+            with trace.stage("summarize"):
+                async with summarizer_slot():
+                    answer = await resources["summarizer"].ainvoke({
+                        "context": context_text,
+                        "question": req.question
+                    })
+        except Overloaded as e:
+            ADMISSION_SHED.inc(e.stage, e.reason)
+            answer = fallback_answer(data)
+            degraded = overloaded = True
         except Exception as e:
-            top = data[0]
-            answer = f"Kết quả: {top['name']} ({top['sci_name']}). {top['details']}"
+            answer = fallback_answer(data)
+            degraded = True
 
-    return {
+    response = {
         "answer": answer,
         "data": data,
         "meta": {"intent": intent, "latency": f"{time.time() - start:.3f}s"}
     }
+    if overloaded:
+        response["meta"]["degraded"] = "summarizer_overloaded"
+    if res.get("degraded"):
+        response["meta"]["degraded"] = res["degraded"]
+        degraded = True
+    # Không cache câu trả lời fallback khi LLM lỗi / kết quả từ index local
+    if not degraded:
+        remember_answer(a_hash, query_vector, intent, response)
+    trace.finish("degraded" if degraded else "ok")
+    return {**response, "meta": with_trace(response["meta"], trace)}
+
+def sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/api/ask-snake/stream", dependencies=[Depends(verify_api_key), Depends(require_ready), Depends(admit)])
+async def ask_snake_stream(req: QueryRequest):
+    """Server-sent events: `data` (hits + intent) ngay khi có kết quả ES, sau đó `token` theo từng chunk
+    của summarizer, cuối cùng `meta` với thời gian từng stage."""
+    trace = Trace("stream")
+
+    def meta_frame(**extra) -> dict:
+        return {**extra, "trace_id": trace.id,
+                "timings": {f"{k}_ms": round(v * 1000, 2) for k, v in trace.stages.items()}}
+
+    a_hash = cache_key(req.question)
+    cached = ANSWER_CACHE.get(a_hash)
+    if cached is not None:
+        async def replay():
+            yield sse("data", {"data": cached["data"], "intent": cached["meta"]["intent"]})
+            yield sse("token", {"text": cached["answer"]})
+            trace.finish("answer_cache")
+            yield sse("meta", meta_frame(cached=True))
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    # Parse / embed / search chạy trước khi mở stream để lỗi vẫn trả đúng status code
+    with trace.stage("parse"):
+        intent = await resources["parser"].parse(req.question)
+
+    with trace.stage("embed"):
+        query_vector = await embed_question(req.question)
+
+    semantic = SEMANTIC_CACHE.get(query_vector, intent) if SEMANTIC_CACHE_ENABLED else (None, 0.0)
+    if semantic[0] is not None:
+        cached, similarity = semantic
+
+        async def replay_semantic():
+            yield sse("data", {"data": cached["data"], "intent": intent})
+            yield sse("token", {"text": cached["answer"]})
+            trace.finish("semantic_cache")
+            yield sse("meta", meta_frame(semantic_hit=round(similarity, 4)))
+        return StreamingResponse(replay_semantic(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    try:
+        with trace.stage("search"):
+            res = await es_search(build_es_query(req.question, intent, query_vector))
+        hits = res['hits']['hits']
+    except HTTPException:
+        trace.finish("es_unavailable")
+        raise
+    except Exception as e:
+        trace.finish("es_error")
+        return {"error": str(e)}
+
+    data, context_text = process_hits(hits)
+
+    async def events():
+        yield sse("data", {"data": data, "intent": intent})
+
+        degraded = bool(res.get("degraded"))
+        answer = template_answer(intent, hits)
+        if answer is not None:
+            yield sse("token", {"text": answer})
+        else:
+            chunks = []
+            t0 = time.perf_counter()
+            try:
+                async with summarizer_slot():
+                    async for chunk in resources["summarizer"].astream({"context": context_text, "question": req.question}):
+                        if not chunks:
+                            trace.record("ttft", trace.elapsed())
+                        chunks.append(chunk)
+                        yield sse("token", {"text": chunk})
+            except Exception as e:
+                if isinstance(e, Overloaded):
+                    ADMISSION_SHED.inc(e.stage, e.reason)
+                degraded = True
+                logger.warning(f"⚠️ Summarizer stream failed: {e}")
+                if not chunks:
+                    yield sse("token", {"text": fallback_answer(data)})
+                else:
+                    yield sse("error", {"detail": "summarizer interrupted"})
+            answer = "".join(chunks)
+            trace.record("summarize", time.perf_counter() - t0)
+
+        total = trace.finish("degraded" if degraded else "ok")
+        yield sse("meta", meta_frame(intent=intent, degraded=degraded))
+
+        if not degraded:
+            remember_answer(a_hash, query_vector, intent, {
+                "answer": answer,
+                "data": data,
+                "meta": {"intent": intent, "latency": f"{total:.3f}s"}
+            })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/api/ask-snake/batch", dependencies=[Depends(verify_api_key), Depends(require_ready)])
+async def ask_snake_batch(req: BatchQueryRequest, request: Request, key: str = Depends(verify_api_key)):
+    """Chạy cả pipeline cho nhiều câu hỏi: parse theo batch, một lần encode, một lần msearch,
+    summarizer song song có giới hạn. Kết quả giữ đúng thứ tự, lỗi từng câu không làm hỏng cả batch."""
+    wait = check_quota(request, key, cost=len(req.questions), max_wait=BATCH_QUOTA_MAX_WAIT)
+    if wait:
+        await asyncio.sleep(wait)
+    start = time.time()
+    trace = Trace("batch")
+    questions = req.questions
+    results: List[Optional[dict]] = [None] * len(questions)
+
+    # 0. Validate + answer cache
+    todo = []
+    for i, q in enumerate(questions):
+        if not 2 <= len(q) <= 500:
+            results[i] = {"question": q, "error": "question length must be between 2 and 500"}
+            continue
+        cached = ANSWER_CACHE.get(cache_key(q))
+        if cached is not None:
+            results[i] = {"question": q, **cached, "meta": {**cached["meta"], "cached": True}}
+        else:
+            todo.append(i)
+
+    if todo:
+        # 1. Parse
+        with trace.stage("parse"):
+            intents = dict(zip(todo, await resources["parser"].parse_many([questions[i] for i in todo], BATCH_LLM_CONCURRENCY)))
+
+        # 2. Embed: lấy từ cache, phần thiếu encode một lần
+        vectors = {}
+        missing = []
+        for i in todo:
+            vec = EMBED_CACHE.get(cache_key(questions[i]))
+            if vec is None:
+                missing.append(i)
+            else:
+                vectors[i] = vec
+        if missing and EMBED_STORE is not None:
+            stored = await asyncio.to_thread(EMBED_STORE.get_many, [cache_key(questions[i]) for i in missing])
+            for i in missing:
+                vec = stored.get(cache_key(questions[i]))
+                if vec is not None:
+                    vectors[i] = vec
+                    EMBED_CACHE.set(cache_key(questions[i]), vec)
+            missing = [i for i in missing if i not in vectors]
+        if missing:
+            try:
+                with trace.stage("embed"):
+                    async with stage_slot("embed"):
+                        encoded = await resources["embedder"].encode_many([questions[i] for i in missing])
+            except Exception as e:
+                logger.error(f"❌ Batch embedding error: {e}")
+                encoded = None
+            for n, i in enumerate(missing):
+                if encoded is None:
+                    results[i] = {"question": questions[i], "error": "embedding failed"}
+                    continue
+                vectors[i] = to_float32(encoded[n])
+                EMBED_CACHE.set(cache_key(questions[i]), vectors[i])
+            if encoded is not None and EMBED_STORE is not None:
+                asyncio.get_running_loop().run_in_executor(
+                    None, _persist_vectors, [cache_key(questions[i]) for i in missing], [vectors[i] for i in missing])
+
+        # 2b. Semantic cache
+        to_search = []
+        for i in todo:
+            if results[i] is not None:
+                continue
+            if SEMANTIC_CACHE_ENABLED:
+                cached, similarity = SEMANTIC_CACHE.get(vectors[i], intents[i])
+                if cached is not None:
+                    results[i] = {"question": questions[i], **cached,
+                                  "meta": {**cached["meta"], "intent": intents[i], "semantic_hit": round(similarity, 4)}}
+                    continue
+            to_search.append(i)
+
+        # 3. Một request msearch cho tất cả câu hỏi
+        responses = []
+        search_degraded = None
+        if to_search:
+            searches = []
+            for i in to_search:
+                searches.append({"index": "snakes"})
+                searches.append(build_es_query(questions[i], intents[i], vectors[i]))
+            try:
+                with trace.stage("search"):
+                    res = await es_msearch(searches)
+                responses = res["responses"]
+                search_degraded = res.get("degraded")
+            except HTTPException as e:
+                responses = [{"error": e.detail}] * len(to_search)
+            except Exception as e:
+                responses = [{"error": str(e)}] * len(to_search)
+
+        # 4. Process + template answers; gom các câu cần summarizer
+        prepared = {}
+        need_llm = []
+        for i, res in zip(to_search, responses):
+            if "error" in res:
+                results[i] = {"question": questions[i], "error": str(res["error"])}
+                continue
+            hits = res["hits"]["hits"]
+            data, context_text = process_hits(hits)
+            prepared[i] = (data, template_answer(intents[i], hits))
+            if prepared[i][1] is None:
+                need_llm.append((i, context_text))
+
+        # 5. Summarizer song song có giới hạn (BATCH_LLM_CONCURRENCY); mỗi lời gọi LLM chiếm một suất của gate
+        # summarizer như request đơn -> câu bị từ chối (quá tải / degraded) nhận câu trả lời template
+        answers = {}
+        if need_llm:
+            llm_sem = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+            async def summarize(i: int, ctx: str):
+                async with llm_sem:
+                    try:
+                        async with summarizer_slot():
+                            return await resources["summarizer"].ainvoke({"context": ctx, "question": questions[i]})
+                    except Overloaded as e:
+                        ADMISSION_SHED.inc(e.stage, e.reason)
+                        return e
+                    except Exception as e:
+                        return e
+
+            with trace.stage("summarize"):
+                outputs = await asyncio.gather(*(summarize(i, ctx) for i, ctx in need_llm))
+            answers = {i: out for (i, _), out in zip(need_llm, outputs)}
+
+        for i, (data, answer) in prepared.items():
+            degraded = False
+            if answer is None:
+                answer = answers.get(i)
+                if isinstance(answer, Exception) or answer is None:
+                    answer = fallback_answer(data)
+                    degraded = True
+            response = {"answer": answer, "data": data, "meta": {"intent": intents[i]}}
+            if search_degraded:
+                response["meta"]["degraded"] = search_degraded
+                degraded = True
+            if not degraded:
+                remember_answer(cache_key(questions[i]), vectors[i], intents[i], response)
+            results[i] = {"question": questions[i], **response}
+
+    trace.finish()
+    return {
+        "results": results,
+        "meta": with_trace({"count": len(questions), "latency": f"{time.time() - start:.3f}s",
+                            **({"quota_wait": f"{wait:.3f}s"} if wait else {})}, trace)
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache-stats", dependencies=[Depends(verify_api_key)])
+async def cache_stats():
+    return {
+        "parse": PARSE_CACHE.stats(),
+        "embed": EMBED_CACHE.stats(),
+        "answer": ANSWER_CACHE.stats(),
+        "semantic": SEMANTIC_CACHE.stats(),
+        "species_summary": SPECIES_SUMMARY_CACHE.stats(),
+        "species_names": len(resources["species"]) if "species" in resources else 0,
+        "es_client": resources["es"].stats() if isinstance(resources.get("es"), ResilientSearch) else {},
+        "admission": {"enabled": ADMISSION_ENABLED, "degraded_mode": DEGRADED_MODE,
+                      "stages": {name: gate.stats() for name, gate in GATES.items()},
+                      "api_key": KEY_LIMITER.stats(), "anonymous": ANON_LIMITER.stats()},
+        "embed_store": EMBED_STORE.stats() if EMBED_STORE is not None else {},
+        "embedder": resources["embedder"].stats() if "embedder" in resources else {},
+        "embed_workers": resources["embed"].stats() if isinstance(resources.get("embed"), EmbedWorkerPool) else {},
+    }
 
 if __name__ == "__main__":
     import uvicorn
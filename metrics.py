@@ -0,0 +1,262 @@
+import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# METRICS_ENABLED=0 -> inc/observe trả về ngay, gần như không tốn gì trên hot path
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# TRACE_RESPONSES=1 -> thêm trace_id + thời gian từng stage vào `meta` của response
+TRACE_RESPONSES = os.getenv("TRACE_RESPONSES", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, v in sorted(self._values.items()):
+            yield f"{self.name}{_fmt_labels(self.labels, values)} {v}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        if not ENABLED:
+            return
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, series in sorted(self._series.items()):
+            for bound, n in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, values, le)} {n}"
+            inf = 'le="+Inf"'
+            yield f"{self.name}_bucket{_fmt_labels(self.labels, values, inf)} {series[-1]}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, values)} {series[-2]}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, values)} {series[-1]}"
+
+
+class GaugeCallback:
+    """Gauge đọc giá trị lúc scrape (VD: stats() của cache), không tốn gì trên hot path."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], fn: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.fn = fn
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for values, v in self.fn():
+            yield f"{self.name}{_fmt_labels(self.labels, values)} {v}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        m = Counter(name, help, labels)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labels, buckets)
+        self._metrics.append(m)
+        return m
+
+    def gauge_callback(self, name: str, help: str, labels: Tuple[str, ...], fn) -> GaugeCallback:
+        m = GaugeCallback(name, help, labels, fn)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            try:
+                lines.extend(m.render())
+            except Exception as e:  # một collector lỗi không được làm hỏng cả /metrics
+                lines.append(f"# collector {m.name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("snake_requests_total", "Requests by route and outcome", ("route", "outcome"))
+STAGE_SECONDS = REGISTRY.histogram("snake_stage_seconds", "Wall time per pipeline stage", ("route", "stage"))
+PARSER_PATH = REGISTRY.counter("snake_parser_path_total", "HybridParser path taken", ("path",))
+PARSER_FALLBACK = REGISTRY.counter("snake_parser_fallback_total", "Rule parser fallbacks to LLM by reason", ("reason",))
+ES_TOOK_SECONDS = REGISTRY.histogram("snake_es_took_seconds", "Elasticsearch server-side 'took'", ("op",))
+ES_WALL_SECONDS = REGISTRY.histogram("snake_es_wall_seconds", "Elasticsearch client wall time", ("op",))
+ADMISSION_SHED = REGISTRY.counter("snake_admission_shed_total", "Requests shed or degraded by admission control",
+                                  ("stage", "reason"))
+ES_DEGRADED = REGISTRY.counter("snake_es_degraded_total", "Queries served without Elasticsearch", ("op", "source"))
+LLM_TOKENS = REGISTRY.counter("snake_llm_tokens_total", "LLM tokens by chain and kind", ("chain", "kind"))
+LLM_CALLS = REGISTRY.counter("snake_llm_calls_total", "LLM calls by chain and outcome", ("chain", "outcome"))
+
+
+def register_cache_metrics(caches: Dict[str, object]):
+    """Xuất hits/misses/evictions/hit_ratio của các cache (LRU, shared, tiered, semantic)."""
+
+    def tiers(stats: dict):
+        if "local" in stats and "shared" in stats:
+            return [("local", stats["local"]), ("shared", stats["shared"])]
+        return [("local", stats)]
+
+    def collect(field: str):
+        def fn():
+            for name, cache in caches.items():
+                for tier, stats in tiers(cache.stats()):
+                    if field in stats:
+                        yield (name, tier), stats[field]
+        return fn
+
+    for field in ("hits", "misses", "evictions", "entries", "hit_ratio"):
+        REGISTRY.gauge_callback(f"snake_cache_{field}", f"Cache {field}", ("cache", "tier"), collect(field))
+
+
+def register_es_metrics(stats: Callable[[], dict]):
+    """Xuất trạng thái es_client.ResilientSearch; `stats` trả {} khi chưa kết nối (hoặc backend local)."""
+
+    def field(name: str):
+        def fn():
+            s = stats()
+            if name in s:
+                yield (), s[name]
+        return fn
+
+    def breaker_state():
+        state = stats().get("state")
+        if state:
+            for s in ("closed", "half_open", "open"):
+                yield (s,), int(s == state)
+
+    REGISTRY.gauge_callback("snake_es_breaker_state", "Elasticsearch circuit breaker state (1 = current)", ("state",),
+                            breaker_state)
+    for name, help in (("inflight", "In-flight Elasticsearch requests"),
+                       ("pool_utilization", "In-flight requests / connection pool size"),
+                       ("opened", "Times the circuit breaker opened"),
+                       ("short_circuited", "Requests rejected by the open circuit"),
+                       ("failures", "Elasticsearch requests failed (connection / timeout / 5xx)"),
+                       ("hedged", "Hedged duplicate requests sent"),
+                       ("hedge_wins", "Hedged requests that answered first")):
+        REGISTRY.gauge_callback(f"snake_es_{name}", help, (), field(name))
+
+
+def register_admission_metrics(gates: Dict[str, object], limiters: Dict[str, object]):
+    """Xuất inflight / queued / limit của từng StageGate và số key đang theo dõi của từng KeyLimiter (admission.py)."""
+
+    def gate_field(field: str):
+        def fn():
+            for name, gate in gates.items():
+                yield (name,), getattr(gate, field)
+        return fn
+
+    for field, help in (("inflight", "Requests running in stage"), ("queued", "Requests waiting for stage slot"),
+                        ("limit", "Stage concurrency limit")):
+        REGISTRY.gauge_callback(f"snake_admission_{field}", help, ("stage",), gate_field(field))
+    REGISTRY.gauge_callback("snake_admission_tracked_keys", "Clients with an active token bucket", ("limiter",),
+                            lambda: (((name,), len(l.buckets)) for name, l in limiters.items()))
+
+
+def token_usage_callback(chain: str, totals: Optional[dict] = None):
+    """Callback LangChain đếm token (prompt/completion) theo từng chain; `totals` (nếu có) được cộng dồn thêm."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageCallback(BaseCallbackHandler):
+        def on_llm_end(self, response, **kwargs):
+            LLM_CALLS.inc(chain, "ok")
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if not usage:
+                # Streaming / bản mới: usage nằm trong usage_metadata của message
+                for gens in response.generations:
+                    for gen in gens:
+                        meta = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                        usage = {"prompt_tokens": meta.get("input_tokens", 0),
+                                 "completion_tokens": meta.get("output_tokens", 0)}
+            prompt, completion = usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+            LLM_TOKENS.inc(chain, "prompt", amount=prompt)
+            LLM_TOKENS.inc(chain, "completion", amount=completion)
+            if totals is not None:
+                totals["prompt"] = totals.get("prompt", 0) + prompt
+                totals["completion"] = totals.get("completion", 0) + completion
+
+        def on_llm_error(self, error, **kwargs):
+            LLM_CALLS.inc(chain, "error")
+
+    return TokenUsageCallback()
+
+
+class Trace:
+    """Đo thời gian từng stage của một request; finish() đẩy vào histogram."""
+
+    def __init__(self, route: str, trace_id: Optional[str] = None):
+        self.route = route
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def finish(self, outcome: str = "ok"):
+        total = self.elapsed()
+        self.stages["total"] = total
+        REQUESTS.inc(self.route, outcome)
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, self.route, name)
+        return total
+
+    def as_meta(self) -> dict:
+        return {"trace_id": self.id, "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()}}
@@ -0,0 +1,103 @@
+import os
+import logging
+from typing import Iterator, List
+
+import mysql.connector
+
+# Mỗi loài một dòng. Tên thường / mức nguy hiểm / kích thước được gộp sẵn một lần bằng GROUP BY rồi JOIN,
+# thay vì 3 subquery tương quan chạy lại cho từng dòng của tax__subspecies.
+# ORDER BY theo khoá gốc để thứ tự batch ổn định giữa các lần chạy (checkpoint dựa vào số batch).
+TAXONOMY_QUERY = """
+SELECT
+    TRIM(CONCAT(t.genus, ' ', t.species, ' ', IFNULL(t.subspecies, ''))) AS scientific_name,
+    tf.family,
+    cn.common_names,
+    dg.danger_level,
+    sz.max_len
+FROM tax__subspecies t
+LEFT JOIN tax__genus tg ON t.genus = tg.genus
+LEFT JOIN tax__family tf ON tg.family = tf.family
+LEFT JOIN (
+    SELECT genus, species, GROUP_CONCAT(DISTINCT cname SEPARATOR ', ') AS common_names
+    FROM map__cname GROUP BY genus, species
+) cn ON cn.genus = t.genus AND cn.species = t.species
+LEFT JOIN (
+    SELECT genus, species, MIN(danger) AS danger_level
+    FROM map__danger GROUP BY genus, species
+) dg ON dg.genus = t.genus AND dg.species = t.species
+LEFT JOIN (
+    SELECT genus, species, MAX(tbl) AS max_len
+    FROM val__size GROUP BY genus, species
+) sz ON sz.genus = t.genus AND sz.species = t.species
+ORDER BY t.genus, t.species, t.subspecies
+"""
+
+# Query cũ (subquery tương quan), chỉ giữ lại để bench_mysql.py so sánh
+LEGACY_TAXONOMY_QUERY = """
+SELECT
+    TRIM(CONCAT(t.genus, ' ', t.species, ' ', IFNULL(t.subspecies, ''))) AS scientific_name,
+    tf.family,
+    (SELECT GROUP_CONCAT(DISTINCT cname SEPARATOR ', ') FROM map__cname m WHERE m.genus = t.genus AND m.species = t.species) AS common_names,
+    (SELECT danger FROM map__danger d WHERE d.genus = t.genus AND d.species = t.species LIMIT 1) AS danger_level,
+    (SELECT MAX(tbl) FROM val__size s WHERE s.genus = t.genus AND s.species = t.species) AS max_len
+FROM tax__subspecies t
+LEFT JOIN tax__genus tg ON t.genus = tg.genus
+LEFT JOIN tax__family tf ON tg.family = tf.family
+"""
+
+def get_mysql_connection():
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        port=os.getenv("MYSQL_PORT", "3306"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=os.getenv("MYSQL_DB", "snake_db")
+    )
+
+def _normalize(row: dict) -> dict:
+    # DECIMAL -> float để JSON/ES và content_hash không phụ thuộc kiểu của driver
+    if row.get("max_len") is not None:
+        row["max_len"] = float(row["max_len"])
+    return row
+
+def count_taxonomy() -> int:
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM tax__subspecies")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+def iter_taxonomy(batch_size: int = 500, query: str = TAXONOMY_QUERY) -> Iterator[List[dict]]:
+    """Stream các dòng taxonomy theo batch bằng cursor không buffer (server gửi dần, client chỉ giữ một batch)."""
+    conn = get_mysql_connection()
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [_normalize(r) for r in rows]
+    finally:
+        # Generator bị bỏ dở: phải đọc hết kết quả còn lại thì mới đóng được cursor unbuffered
+        try:
+            conn.consume_results()
+        except Exception:
+            pass
+        cursor.close()
+        conn.close()
+
+def fetch_taxonomy_legacy() -> List[dict]:
+    """Đường cũ: fetchall toàn bộ kết quả vào bộ nhớ."""
+    conn = get_mysql_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(LEGACY_TAXONOMY_QUERY)
+        rows = cursor.fetchall()
+        logging.info(f"📊 Loaded {len(rows)} records from MySQL.")
+        return rows
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,17 +1,35 @@
 import os
+import json
+import time
+import hashlib
+import asyncio
+import argparse
 import pymongo
 from tqdm import tqdm
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential_jitter
 from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from dotenv import load_dotenv
 
+from cache_store import JsonCodec, SQLiteCache
+from metrics import token_usage_callback
+from ratelimit import TokenBucket
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 MODEL_NAME = "google/gemini-2.5-flash-lite" 
+# Số lời gọi LLM chạy đồng thời, giới hạn request/giây (toàn cục), số lần thử, số document mỗi bulk_write
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "8"))
+AI_RATE = float(os.getenv("AI_RATE", "4"))
+AI_MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", "4"))
+AI_BULK_SIZE = int(os.getenv("AI_BULK_SIZE", "50"))
+# Cache kết quả trích xuất theo (model, phiên bản prompt, hash văn bản đầu vào); để trống để tắt
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "llm_extract_cache.sqlite")
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "200000"))
 
 client = pymongo.MongoClient(MONGO_URI)
 db = client["snake_raw_data"]
@@ -48,38 +66,137 @@ JSON OUTPUT:
 
 chain = prompt | llm | parser
 
-def run_ai_processing():
-    # Lấy các bài chưa xử lý AI (hoặc bạn có thể xóa col_clean đi chạy lại từ đầu)
-    query = {"processed": False, "found": {"$ne": False}}
-    total = col_raw.count_documents(query)
-    cursor = col_raw.find(query)
-    
-    print(f"🤖 Bắt đầu trích xuất tên Tiếng Việt cho {total} loài...")
-
-    for doc in tqdm(cursor, total=total):
-        try:
-            raw_text = f"Summary: {doc.get('summary', '')}\n"
-            # Thêm title vào text để AI dễ bắt tên
-            raw_text += f"Title from URL: {doc.get('url', '')}\n" 
-            
-            cleaned_data = chain.invoke({
-                "text": raw_text[:6000],
-                "format_instructions": parser.get_format_instructions()
-            })
-
-            col_clean.update_one(
-                {"scientific_name": doc['scientific_name']},
-                {"$set": {
-                    "scientific_name": doc['scientific_name'],
-                    "ai_data": cleaned_data,
-                    "original_url": doc.get('url')
-                }},
-                upsert=True
+# Phiên bản prompt tự suy ra từ template + schema: sửa một trong hai là mọi key cache cũ không còn khớp
+PROMPT_VERSION = hashlib.sha1(
+    (prompt.messages[0].prompt.template + json.dumps(SnakeDataClean.model_json_schema(), sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
+
+def extraction_key(text: str) -> str:
+    return f"{MODEL_NAME}|{PROMPT_VERSION}|{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+def build_text(doc: dict) -> str:
+    raw_text = f"Summary: {doc.get('summary', '')}\n"
+    # Thêm title vào text để AI dễ bắt tên
+    raw_text += f"Title from URL: {doc.get('url', '')}\n" 
+    return raw_text[:6000]
+
+class BulkWriter:
+    """Gom kết quả rồi ghi bằng bulk_write: wiki_cleaned trước, cờ processed sau
+    (crash giữa chừng thì document chỉ bị xử lý lại, upsert nên không trùng)."""
+
+    def __init__(self, size: int = AI_BULK_SIZE):
+        self.size = size
+        self.clean_ops = []
+        self.raw_ops = []
+        self.written = 0
+
+    async def add(self, doc: dict, cleaned_data: dict):
+        self.clean_ops.append(pymongo.UpdateOne(
+            {"scientific_name": doc['scientific_name']},
+            {"$set": {
+                "scientific_name": doc['scientific_name'],
+                "ai_data": cleaned_data,
+                "original_url": doc.get('url')
+            }},
+            upsert=True
+        ))
+        self.raw_ops.append(pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": {"processed": True}}))
+        if len(self.clean_ops) >= self.size:
+            await self.flush()
+
+    async def flush(self):
+        clean_ops, raw_ops = self.clean_ops, self.raw_ops
+        self.clean_ops, self.raw_ops = [], []
+        if clean_ops:
+            await asyncio.to_thread(col_clean.bulk_write, clean_ops, ordered=False)
+            await asyncio.to_thread(col_raw.bulk_write, raw_ops, ordered=False)
+            self.written += len(clean_ops)
+
+async def extract(text: str, limiter: TokenBucket, usage: dict) -> dict:
+    """`usage` nhận số token của riêng lời gọi này (kể cả các lần retry)."""
+    callbacks = [token_usage_callback("extract", usage)]
+    async for attempt in AsyncRetrying(stop=stop_after_attempt(AI_MAX_ATTEMPTS),
+                                       wait=wait_exponential_jitter(initial=1, max=30), reraise=True):
+        with attempt:
+            await limiter.acquire()
+            return await chain.ainvoke(
+                {"text": text, "format_instructions": parser.get_format_instructions()},
+                config={"callbacks": callbacks},
             )
-            col_raw.update_one({"_id": doc["_id"]}, {"$set": {"processed": True}})
 
-        except Exception as e:
-            print(f"⚠️ Lỗi: {doc['scientific_name']} - {e}")
+async def process_async(concurrency: int = AI_CONCURRENCY, rate: float = AI_RATE, limit: int = 0,
+                        use_cache: bool = True) -> dict:
+    # Lấy các bài chưa xử lý AI (hoặc bạn có thể xóa col_clean đi chạy lại từ đầu).
+    # Bài đã ghi xong có processed=True nên chạy lại là tự resume.
+    query = {"processed": False, "found": {"$ne": False}}
+    projection = {"_id": 1, "scientific_name": 1, "summary": 1, "url": 1}
+    docs = await asyncio.to_thread(lambda: list(col_raw.find(query, projection).limit(limit)))
+
+    print(f"🤖 Bắt đầu trích xuất tên Tiếng Việt cho {len(docs)} loài (concurrency={concurrency}, rate={rate}/s)...")
+    tokens = {"prompt": 0, "completion": 0}
+    cache = SQLiteCache("extract", AI_CACHE_PATH, JsonCodec, max_entries=AI_CACHE_MAX_ENTRIES) \
+        if use_cache and AI_CACHE_PATH else None
+    saved_tokens = 0
+    limiter = TokenBucket(rate, burst=concurrency)
+    writer = BulkWriter()
+    stats = {"ok": 0, "failed": 0}
+    queue: asyncio.Queue = asyncio.Queue()
+    for doc in docs:
+        queue.put_nowait(doc)
+    progress = tqdm(total=len(docs))
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal saved_tokens
+        while not queue.empty():
+            doc = queue.get_nowait()
+            try:
+                text = build_text(doc)
+                key = extraction_key(text)
+                cached = cache.get(key) if cache is not None else None
+                if cached is not None:
+                    # Văn bản không đổi kể từ lần trích xuất trước -> không gọi LLM
+                    cleaned_data = cached["data"]
+                    saved_tokens += cached["tokens"]
+                else:
+                    usage = {}
+                    cleaned_data = await extract(text, limiter, usage)
+                    tokens["prompt"] += usage.get("prompt", 0)
+                    tokens["completion"] += usage.get("completion", 0)
+                    if cache is not None:
+                        cache.set(key, {"data": cleaned_data, "tokens": usage.get("prompt", 0) + usage.get("completion", 0)})
+                await writer.add(doc, cleaned_data)
+                stats["ok"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"⚠️ Lỗi: {doc['scientific_name']} - {e}")
+            progress.update(1)
+            elapsed = time.perf_counter() - started
+            progress.set_postfix(docs_s=f"{stats['ok'] / elapsed:.2f}", tokens=tokens["prompt"] + tokens["completion"])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await writer.flush()
+    progress.close()
+
+    wall = time.perf_counter() - started
+    report = {**stats, "wall_s": round(wall, 1), "docs_per_s": round(stats["ok"] / wall, 2) if wall else 0.0,
+              "prompt_tokens": tokens["prompt"], "completion_tokens": tokens["completion"],
+              "rate_wait_s": round(limiter.waited, 1), "prompt_version": PROMPT_VERSION}
+    if cache is not None:
+        cache_stats = cache.stats()
+        report.update({"cache_hits": cache_stats["hits"], "cache_misses": cache_stats["misses"],
+                       "saved_tokens": saved_tokens})
+    print(f"✅ Xong: {report}")
+    return report
+
+def run_ai_processing(concurrency: int = AI_CONCURRENCY, rate: float = AI_RATE, limit: int = 0, use_cache: bool = True):
+    return asyncio.run(process_async(concurrency, rate, limit, use_cache))
 
 if __name__ == "__main__":
-    run_ai_processing()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Trích xuất ai_data từ wiki_articles bằng LLM")
+    ap.add_argument("--concurrency", type=int, default=AI_CONCURRENCY)
+    ap.add_argument("--rate", type=float, default=AI_RATE, help="lời gọi LLM / giây")
+    ap.add_argument("--limit", type=int, default=0, help="chỉ xử lý N bài (0 = tất cả)")
+    ap.add_argument("--no-cache", action="store_true", help="luôn gọi LLM, không đọc/ghi cache trích xuất")
+    args = ap.parse_args()
+    run_ai_processing(args.concurrency, args.rate, args.limit, use_cache=not args.no_cache)
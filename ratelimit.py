@@ -0,0 +1,80 @@
+import time
+import asyncio
+import threading
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket: `rate` token/giây, tối đa `burst` token tích luỹ.
+
+    acquire() (async) chờ tới khi đủ token; try_acquire() không chờ, trả False nếu hết (dùng để trả 429 ngay).
+    Dùng được chung cho nhiều coroutine/thread (lock thường, vùng khoá rất ngắn)."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+        self.rejected = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        """Trừ token (có thể âm = đặt chỗ trước) và trả về số giây phải chờ."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            self.rejected += 1
+            return False
+
+    async def acquire(self, tokens: float = 1.0):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def reserve(self, tokens: float, max_wait: float) -> Optional[float]:
+        """Đặt trước `tokens` (có thể vượt burst) nếu phải chờ không quá `max_wait` giây -> số giây phải chờ;
+        quá lâu -> None, không trừ token. Caller tự sleep (VD: batch lớn trả dần theo `rate`)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if wait > max_wait:
+                self.rejected += 1
+                return None
+            self._tokens -= tokens
+            self.waited += wait
+            return wait
+
+    def retry_after(self, tokens: float = 1.0) -> float:
+        """Số giây tới khi đủ `tokens` (cho header Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Server trả 429 / Retry-After: chặn toàn bộ bucket thêm `seconds` giây."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {"rate": self.rate, "burst": self.burst, "tokens": round(self._tokens, 2),
+                    "waited_s": round(self.waited, 3), "rejected": self.rejected}
@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import math
+import time
+import shutil
+import asyncio
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("snake_rag")
+
+# Trên ngưỡng này mới dựng IVF (k-means thô), dưới ngưỡng quét toàn bộ ma trận đã đủ nhanh
+LOCAL_IVF_MIN = int(os.getenv("LOCAL_IVF_MIN", "100000"))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+
+_TOKEN = re.compile(r"\w+")
+
+
+def fold_text(text: str) -> str:
+    """Chữ thường + bỏ dấu tiếng Việt ("Rắn hổ mang" -> "ran ho mang")."""
+    text = unicodedata.normalize("NFD", str(text).lower()).replace("đ", "d")
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def tokenize(text) -> List[str]:
+    return _TOKEN.findall(fold_text(text)) if text else []
+
+
+def write_local_index(out_dir: str, docs: Iterable[dict], dims: int, meta: Optional[dict] = None) -> int:
+    """Ghi index cho LocalSearchBackend: vectors.f32 (float32, một dòng / doc), docs.jsonl, meta.json.
+
+    `docs`: dict có `_id`, các field _source và `vector_embedding`. Ghi vào thư mục tạm rồi đổi tên -> không có
+    lúc nào server đọc phải index dở dang."""
+    out_dir = out_dir.rstrip("/")
+    tmp, old = out_dir + ".tmp", out_dir + ".old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    count = 0
+    with open(os.path.join(tmp, "vectors.f32"), "wb") as vf, open(os.path.join(tmp, "docs.jsonl"), "w", encoding="utf-8") as df:
+        for doc in docs:
+            doc = dict(doc)
+            vec = np.asarray(doc.pop("vector_embedding"), dtype=np.float32)
+            if vec.shape != (dims,):
+                raise ValueError(f"{doc.get('_id')}: vector shape {vec.shape}, expected ({dims},)")
+            vf.write(vec.tobytes())
+            df.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            count += 1
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dims": dims, "count": count, "created_at": time.time(), **(meta or {})}, f, ensure_ascii=False)
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return count
+
+
+class BM25Field:
+    """BM25 (k1=1.2, b=0.75 như ES) trên một field, token đã bỏ dấu."""
+
+    def __init__(self, texts: List[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.n = len(texts)
+        self.tokens = [tokenize(t) for t in texts]
+        self.lengths = np.array([len(t) for t in self.tokens], dtype=np.float32)
+        self.avgdl = float(self.lengths.mean()) if self.n and self.lengths.sum() else 1.0
+        postings = defaultdict(lambda: ([], []))
+        for i, toks in enumerate(self.tokens):
+            for tok, tf in Counter(toks).items():
+                postings[tok][0].append(i)
+                postings[tok][1].append(tf)
+        self.postings = {tok: (np.array(ids, dtype=np.int64), np.array(tf, dtype=np.float32))
+                         for tok, (ids, tf) in postings.items()}
+
+    def docs_with(self, token: str) -> np.ndarray:
+        return self.postings.get(token, (np.empty(0, dtype=np.int64), None))[0]
+
+    def scores(self, q_tokens: List[str]) -> np.ndarray:
+        out = np.zeros(self.n, dtype=np.float32)
+        for tok in set(q_tokens):
+            if tok not in self.postings:
+                continue
+            ids, tf = self.postings[tok]
+            idf = math.log(1 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[ids] / self.avgdl)
+            out[ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return out
+
+    def phrase_mask(self, q_tokens: List[str]) -> np.ndarray:
+        """Doc chứa nguyên cụm token liên tiếp (match_phrase)."""
+        mask = np.zeros(self.n, dtype=bool)
+        if not q_tokens:
+            return mask
+        candidates = None
+        for tok in set(q_tokens):
+            ids = set(self.docs_with(tok).tolist())
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return mask
+        k = len(q_tokens)
+        for i in candidates:
+            toks = self.tokens[i]
+            if any(toks[j:j + k] == q_tokens for j in range(len(toks) - k + 1)):
+                mask[i] = True
+        return mask
+
+
+class IVFIndex:
+    """Inverted-file thô cho corpus lớn: k-means trên vector đã chuẩn hoá, chỉ quét `nprobe` cụm gần nhất."""
+
+    def __init__(self, matrix: np.ndarray, norms: np.ndarray, nlist: Optional[int] = None, iters: int = 10, seed: int = 0):
+        n = len(matrix)
+        self.nlist = nlist or max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample_ids = rng.choice(n, size=min(n, self.nlist * 64), replace=False)
+        sample = matrix[np.sort(sample_ids)] / norms[np.sort(sample_ids)][:, None]
+        centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)]
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = sample[assign == c]
+                if len(members):
+                    v = members.mean(axis=0)
+                    centroids[c] = v / (np.linalg.norm(v) or 1.0)
+        self.centroids = centroids.astype(np.float32)
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            assign[start:start + 65536] = np.argmax(matrix[start:start + 65536] @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = np.argsort(-(self.centroids @ q))[:nprobe]
+        return np.concatenate([self.lists[c] for c in probe])
+
+
+class LocalSearchBackend:
+    """Thay AsyncElasticsearch trong resources["es"]: nhận đúng body mà build_es_query tạo ra.
+
+    knn (cosine, score (1+cos)/2 như ES) + bool.should multi_match (BM25, phrase / best_fields, boost `field^n`),
+    cộng điểm hai phần như hybrid search của ES; filter `match` / `term` trong bool must / must_not."""
+
+    def __init__(self, docs: List[dict], vectors: np.ndarray, index_name: str = "snakes",
+                 ivf_min: int = LOCAL_IVF_MIN, nprobe: int = LOCAL_IVF_NPROBE):
+        self.docs = docs
+        self.vectors = vectors
+        self.index_name = index_name
+        self.nprobe = nprobe
+        self.norms = np.linalg.norm(vectors, axis=1).astype(np.float32) if len(vectors) else np.zeros(0, np.float32)
+        self.norms[self.norms == 0] = 1.0
+        self.by_id = {d["_id"]: i for i, d in enumerate(docs)}
+        self._fields: Dict[str, BM25Field] = {}
+        self._masks: Dict[tuple, np.ndarray] = {}
+        self.ivf = IVFIndex(vectors, self.norms) if len(docs) >= ivf_min else None
+        for field in ("vietnamese_name", "scientific_name", "common_names", "countries"):
+            self._field(field)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LocalSearchBackend":
+        t = time.perf_counter()
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "docs.jsonl"), encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f]
+        vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                            shape=(meta["count"], meta["dims"])) if meta["count"] else np.zeros((0, meta["dims"]), np.float32)
+        backend = cls(docs, vectors, index_name=meta.get("index", "snakes"), **kwargs)
+        logger.info(f"📂 Local search index: {len(docs)} docs from {path} in {time.perf_counter() - t:.2f}s"
+                    f"{' (IVF)' if backend.ivf else ''}")
+        return backend
+
+    def _field(self, name: str) -> BM25Field:
+        if name not in self._fields:
+            self._fields[name] = BM25Field([d.get(name) or "" for d in self.docs])
+        return self._fields[name]
+
+    # --- filter ---
+    def _clause_mask(self, clause: dict) -> np.ndarray:
+        kind, spec = next(iter(clause.items()))
+        field, value = next(iter(spec.items()))
+        if isinstance(value, dict):
+            value = value.get("query", value.get("value"))
+        key = (kind, field, str(value))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.zeros(len(self.docs), dtype=bool)
+            if kind == "term":
+                mask[:] = [d.get(field) == value for d in self.docs]
+            elif kind == "match":  # toán tử OR như ES: chỉ cần một token khớp
+                f = self._field(field)
+                for tok in tokenize(value):
+                    mask[f.docs_with(tok)] = True
+            else:
+                raise ValueError(f"Unsupported filter clause: {kind}")
+            self._masks[key] = mask
+        return mask
+
+    def _filter_mask(self, flt: Optional[dict]) -> Optional[np.ndarray]:
+        b = (flt or {}).get("bool", {})
+        if not b.get("must") and not b.get("must_not"):
+            return None
+        mask = np.ones(len(self.docs), dtype=bool)
+        for clause in b.get("must", []):
+            mask &= self._clause_mask(clause)
+        for clause in b.get("must_not", []):
+            mask &= ~self._clause_mask(clause)
+        return mask
+
+    # --- scoring ---
+    def _knn(self, knn: dict) -> Dict[int, float]:
+        q = np.asarray(knn["query_vector"], dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        k = knn.get("k", 10)
+        allowed = self._filter_mask(knn.get("filter"))
+        ids = None
+        if self.ivf is not None:
+            ids = self.ivf.candidates(q, self.nprobe)
+            if allowed is not None:
+                ids = ids[allowed[ids]]
+            if len(ids) < k:
+                ids = None  # filter quá chặt trong các cụm đã probe -> quét chính xác
+        if ids is None:
+            ids = np.flatnonzero(allowed) if allowed is not None else None
+        if ids is None:
+            sims = (self.vectors @ q) / self.norms
+            ids = np.arange(len(self.docs))
+        else:
+            sims = (self.vectors[ids] @ q) / self.norms[ids]
+        if not len(ids):
+            return {}
+        top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k] if len(sims) > k else np.arange(len(sims))
+        return {int(ids[i]): float((1 + sims[i]) / 2) for i in top}
+
+    def _multi_match(self, mm: dict) -> np.ndarray:
+        q_tokens = tokenize(mm["query"])
+        best = np.zeros(len(self.docs), dtype=np.float32)
+        for spec in mm.get("fields", []):
+            name, _, boost = spec.partition("^")
+            f = self._field(name)
+            s = f.scores(q_tokens)
+            if mm.get("type") == "phrase":
+                s = s * f.phrase_mask(q_tokens)
+            np.maximum(best, s * float(boost or 1), out=best)  # best_fields / phrase: lấy field điểm cao nhất
+        return best
+
+    def _query(self, query: dict) -> Optional[np.ndarray]:
+        b = query.get("bool")
+        if b is None:
+            if "multi_match" in query:
+                return self._multi_match(query["multi_match"])
+            return None
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for clause in b.get("should", []):
+            if "multi_match" in clause:
+                scores += self._multi_match(clause["multi_match"])
+        allowed = self._filter_mask(b.get("filter"))
+        if allowed is not None:
+            scores[~allowed] = 0
+        return scores
+
+    def _source(self, doc: dict, fields) -> dict:
+        if not fields:
+            return {k: v for k, v in doc.items() if k != "_id"}
+        return {k: doc[k] for k in fields if k in doc}
+
+    def _run(self, body: dict) -> dict:
+        started = time.perf_counter()
+        size = body.get("size", 10)
+        combined: Dict[int, float] = {}
+        if "knn" in body:
+            combined.update(self._knn(body["knn"]))
+        if "query" in body:
+            scores = self._query(body["query"])
+            if scores is not None:
+                for i in np.flatnonzero(scores > 0):
+                    combined[int(i)] = combined.get(int(i), 0.0) + float(scores[i])
+        top = sorted(combined.items(), key=lambda kv: -kv[1])[:size]
+        hits = [{"_index": self.index_name, "_id": self.docs[i]["_id"], "_score": s,
+                 "_source": self._source(self.docs[i], body.get("_source"))} for i, s in top]
+        took = int((time.perf_counter() - started) * 1000)
+        return {"took": took, "timed_out": False,
+                "hits": {"total": {"value": len(combined), "relation": "eq"}, "hits": hits}}
+
+    # --- API giống AsyncElasticsearch (phần main.py dùng) ---
+    async def search(self, index: str = None, body: dict = None, **kwargs) -> dict:
+        return await asyncio.to_thread(self._run, body or kwargs)
+
+    async def msearch(self, searches: list = None, body: list = None, **kwargs) -> dict:
+        items = searches or body
+        started = time.perf_counter()
+        responses = await asyncio.to_thread(lambda: [self._run(b) for b in items[1::2]])
+        return {"took": int((time.perf_counter() - started) * 1000), "responses": responses}
+
+    async def mget(self, index: str = None, ids: list = None, body: dict = None, **kwargs) -> dict:
+        ids = ids or (body or {}).get("ids", [])
+        fields = kwargs.get("_source")
+        out = []
+        for _id in ids:
+            i = self.by_id.get(_id)
+            if i is None:
+                out.append({"_index": self.index_name, "_id": _id, "found": False})
+            else:
+                out.append({"_index": self.index_name, "_id": _id, "found": True,
+                            "_source": self._source(self.docs[i], fields)})
+        return {"docs": out}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"docs": len(self.docs), "dims": self.vectors.shape[1] if self.vectors.ndim == 2 else 0,
+                "ivf_lists": self.ivf.nlist if self.ivf else 0, "filter_masks": len(self._masks)}
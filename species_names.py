@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from search_backend import tokenize
+
+logger = logging.getLogger("snake_rag")
+
+# Tên 1 từ ("cobra", "naja") thường là tên chung của nhiều loài -> chỉ nhận tên từ 2 token trở lên
+MIN_TOKENS = 2
+_END = ""  # token không bao giờ rỗng nên dùng làm khoá đánh dấu cuối tên
+
+
+def name_variants(doc: dict) -> set:
+    names = [doc.get("scientific_name"), doc.get("vietnamese_name")]
+    names += str(doc.get("common_names") or "").split(",")
+    out = set()
+    for name in names:
+        tokens = tokenize(name)
+        if len(tokens) >= MIN_TOKENS:
+            out.add(" ".join(tokens))
+    return out
+
+
+def build_name_dictionary(docs: Iterable[dict]) -> Dict[str, str]:
+    """Tên đã bỏ dấu -> _id. Tên trùng giữa nhiều loài bị loại (để những câu đó đi đường search bình thường)."""
+    owners = defaultdict(set)
+    for doc in docs:
+        for name in name_variants(doc):
+            owners[name].add(doc["_id"])
+    names = {name: next(iter(ids)) for name, ids in owners.items() if len(ids) == 1}
+    logger.info(f"📖 Name dictionary: {len(names)} names, {len(owners) - len(names)} ambiguous dropped")
+    return names
+
+
+def write_name_dictionary(path: str, names: Dict[str, str], meta: dict = None):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.time(), **(meta or {}), "names": names}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class SpeciesMatcher:
+    """Trie theo token trên tên đã bỏ dấu: quét câu hỏi một lượt, lấy match dài nhất tại mỗi vị trí (khớp nguyên từ)."""
+
+    def __init__(self, names: Dict[str, str]):
+        self.root = {}
+        self.size = len(names)
+        self.doc_ids = sorted(set(names.values()))
+        for name, doc_id in names.items():
+            node = self.root
+            for tok in name.split():
+                node = node.setdefault(tok, {})
+            node[_END] = (doc_id, name)
+
+    @classmethod
+    def load(cls, path: str) -> "SpeciesMatcher":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("names", {}))
+
+    def find(self, text: str) -> List[dict]:
+        tokens = tokenize(text)
+        found = []
+        i = 0
+        while i < len(tokens):
+            node, best = self.root, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if _END in node:
+                    best = (j, node[_END])
+            if best is None:
+                i += 1
+                continue
+            j, (doc_id, name) = best
+            found.append({"doc_id": doc_id, "name": name, "start": i, "end": j + 1})
+            i = j + 1
+        return found
+
+    def __len__(self) -> int:
+        return self.size
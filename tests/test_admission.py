@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from admission import KeyLimiter, Overloaded, StageGate
+
+
+def fake_request(host="10.0.0.1", headers=None):
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers or {})
+
+
+def test_key_limiter_rejects_when_bucket_empty():
+    limiter = KeyLimiter(rate=1, burst=2)
+    limiter.check("k")
+    limiter.check("k")
+    with pytest.raises(Overloaded) as e:
+        limiter.check("k")
+    assert e.value.status == 429
+    limiter.check("other")  # bucket riêng cho từng key
+
+
+def test_key_limiter_batch_waits_for_tokens_beyond_burst():
+    limiter = KeyLimiter(rate=5, burst=20)
+    assert limiter.check("k", cost=20) == 0
+    assert limiter.check("k", cost=10, max_wait=5) == pytest.approx(2, abs=0.05)
+    # Đã nợ 10 token: batch tiếp theo phải chờ quá lâu -> 429, không trừ token
+    with pytest.raises(Overloaded) as e:
+        limiter.check("k", cost=20, max_wait=5)
+    assert e.value.status == 429
+
+
+def test_key_limiter_batch_that_never_fits_is_413():
+    limiter = KeyLimiter(rate=1, burst=5)
+    with pytest.raises(Overloaded) as e:
+        limiter.check("k", cost=20, max_wait=10)
+    assert e.value.status == 413
+
+
+def test_key_limiter_evicts_least_recent_key():
+    limiter = KeyLimiter(rate=1, burst=1, max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        limiter.check(key, max_wait=10)
+    assert list(limiter.buckets) == ["a", "c"]
+
+
+@pytest.mark.parametrize("key", ["dev_mode", "client-key"])
+def test_max_size_batch_is_accepted_with_default_config(monkeypatch, key):
+    import main
+
+    monkeypatch.setattr(main, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(main, "KEY_LIMITER", KeyLimiter(main.KEY_LIMITER.rate, main.KEY_LIMITER.burst))
+    monkeypatch.setattr(main, "ANON_LIMITER", KeyLimiter(main.ANON_LIMITER.rate, main.ANON_LIMITER.burst))
+    main.BatchQueryRequest(questions=["rắn hổ mang"] * main.BATCH_MAX_QUESTIONS)
+    wait = main.check_quota(fake_request(), key, cost=main.BATCH_MAX_QUESTIONS, max_wait=main.BATCH_QUOTA_MAX_WAIT)
+    assert 0 <= wait <= main.BATCH_QUOTA_MAX_WAIT
+    # Dồn batch liên tục: quota vẫn giới hạn -> cuối cùng là 429 (không phải 413)
+    with pytest.raises(HTTPException) as e:
+        for _ in range(10):
+            main.check_quota(fake_request(), key, cost=main.BATCH_MAX_QUESTIONS, max_wait=main.BATCH_QUOTA_MAX_WAIT)
+    assert e.value.status_code == 429
+
+
+def test_stage_gate_sheds_when_queue_full():
+    async def scenario():
+        gate = StageGate("embed", limit=1, max_queue=1, max_wait=1.0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert gate.queued == 1
+        with pytest.raises(Overloaded) as e:
+            async with gate.slot():
+                pass
+        assert e.value.reason == "queue_full"
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert gate.inflight == 0 and gate.admitted == 2
+
+    asyncio.run(scenario())
+
+
+def test_stage_gate_times_out_waiting():
+    async def scenario():
+        gate = StageGate("es", limit=1, max_queue=4, max_wait=0.05)
+        async with gate.slot():
+            with pytest.raises(Overloaded) as e:
+                async with gate.slot():
+                    pass
+        assert e.value.reason == "timeout" and gate.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_address_only_trusts_forwarded_for_from_known_proxies():
+    from admission import client_address, parse_networks
+
+    proxies = parse_networks("10.0.0.0/8, 127.0.0.1")
+    assert client_address("10.0.0.5", "203.0.113.7", proxies) == "203.0.113.7"
+    # Client tự ghi phần bên trái: lấy hop đầu tiên (từ phải) không phải proxy
+    assert client_address("10.0.0.5", "1.1.1.1, 203.0.113.7, 10.0.0.9", proxies) == "203.0.113.7"
+    # Kết nối thẳng (không qua proxy): header bị bỏ qua
+    assert client_address("198.51.100.2", "203.0.113.7", proxies) == "198.51.100.2"
+    assert client_address("10.0.0.5", None, proxies) == "10.0.0.5"
+    assert client_address("10.0.0.5", "203.0.113.7", []) == "10.0.0.5"
+
+
+def test_anonymous_quota_is_per_client_behind_proxy(monkeypatch):
+    import main
+    from admission import parse_networks
+
+    monkeypatch.setattr(main, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(main, "ANON_LIMITER", KeyLimiter(rate=1, burst=1))
+    monkeypatch.setattr(main, "TRUSTED_PROXIES", parse_networks("10.0.0.1"))
+    main.check_quota(fake_request("10.0.0.1", {"x-forwarded-for": "203.0.113.1"}), "dev_mode")
+    main.check_quota(fake_request("10.0.0.1", {"x-forwarded-for": "203.0.113.2"}), "dev_mode")
+    with pytest.raises(HTTPException):
+        main.check_quota(fake_request("10.0.0.1", {"x-forwarded-for": "203.0.113.1"}), "dev_mode")
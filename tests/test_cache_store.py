@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+import pytest
+
+from cache_store import JsonCodec, LRUCache, SemanticCache, SQLiteCache, TieredCache, estimate_size
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache("t", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" mới dùng -> "b" bị đẩy ra
+    cache.set("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_respects_byte_budget():
+    vector = np.zeros(256, dtype=np.float32)
+    size = estimate_size(vector)
+    cache = LRUCache("t", max_entries=100, max_bytes=size * 2)
+    for key in "abc":
+        cache.set(key, vector)
+    assert len(cache) == 2 and cache.stats()["bytes"] <= size * 2
+    cache.set("huge", np.zeros(4096, dtype=np.float32))  # lớn hơn cả budget -> không cache
+    assert "huge" not in cache and len(cache) == 2
+
+
+def test_lru_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = LRUCache("t", ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=100)
+    now[0] += 11
+    assert cache.get("a") is None and cache.get("b") == 2
+    s = cache.stats()
+    assert s["expirations"] == 1 and s["hits"] == 1 and s["misses"] == 1
+
+
+def test_tiered_cache_promotes_shared_hits(tmp_path):
+    shared = SQLiteCache("t", str(tmp_path / "cache.db"), JsonCodec)
+    writer = TieredCache(LRUCache("t"), shared)
+    reader = TieredCache(LRUCache("t"), shared)  # worker khác, LRU riêng
+    writer.set("k", {"answer": "rắn"})
+    assert reader.get("k") == {"answer": "rắn"}
+    assert "k" in reader.local
+    assert reader.get("missing", "default") == "default"
+    assert shared.stats()["hits"] == 1
+
+
+def unit(*values) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+
+INTENT = {"intent_type": "listing", "limit": 10, "must_country": "Vietnam", "must_not_country": None, "danger_level": None}
+
+
+def test_semantic_cache_hits_only_with_same_filters():
+    cache = SemanticCache(capacity=4, threshold=0.95)
+    cache.set(unit(1, 0, 0), INTENT, "answer")
+    value, sim = cache.get(unit(1, 0.05, 0), INTENT)
+    assert value == "answer" and sim > 0.95
+    assert cache.get(unit(0, 1, 0), INTENT)[0] is None  # khác nghĩa
+    assert cache.get(unit(1, 0, 0), {**INTENT, "must_country": "Laos"})[0] is None
+
+
+@pytest.mark.parametrize("field, value", [("limit", 5), ("danger_level", "Venomous"), ("must_not_country", "China"),
+                                          ("intent_type", "detail")])
+def test_semantic_cache_filter_key_covers_every_intent_field(field, value):
+    assert SemanticCache.filter_key(INTENT) != SemanticCache.filter_key({**INTENT, field: value})
+
+
+def test_semantic_cache_replaces_least_recently_used_slot():
+    cache = SemanticCache(capacity=2, threshold=0.99)
+    cache.set(unit(1, 0, 0), INTENT, "a")
+    time.sleep(0.001)
+    cache.set(unit(0, 1, 0), INTENT, "b")
+    time.sleep(0.001)
+    assert cache.get(unit(1, 0, 0), INTENT)[0] == "a"
+    cache.set(unit(0, 0, 1), INTENT, "c")
+    assert cache.get(unit(0, 1, 0), INTENT)[0] is None
+    assert cache.get(unit(1, 0, 0), INTENT)[0] == "a"
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
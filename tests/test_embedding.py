@@ -0,0 +1,115 @@
+import time
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from embedding import EmbedBatcher, EmbedWorkerError, EmbedWorkerPool
+
+
+class FakeWorker:
+    """Thay _EmbedWorker: không spawn process, `fail` lần encode đầu tiên làm worker chết."""
+
+    def __init__(self, idx: int, fail: int = 0, restart_s: float = 0.0):
+        self.idx = idx
+        self.lock = threading.Lock()
+        self.dead = False
+        self.queued = False
+        self.fail = fail
+        self.restart_s = restart_s
+        self.calls = 0
+        self.restarted = threading.Event()
+        self.proc = None
+
+    def encode(self, texts):
+        if self.fail:
+            self.fail -= 1
+            self.dead = True
+            raise EmbedWorkerError(f"Worker {self.idx} failed")
+        self.calls += 1
+        return np.full((len(texts), 2), self.idx, dtype=np.float32)
+
+    def healthy(self):
+        return True
+
+    def restart(self):
+        time.sleep(self.restart_s)
+        self.restarted.set()
+
+    def shutdown(self):
+        pass
+
+
+def make_pool(*workers, health_interval=0.01):
+    pool = EmbedWorkerPool("fake", len(workers), dims=2, capacity=2, call_timeout=1, health_interval=health_interval)
+    pool.workers = list(workers)
+    for w in workers:
+        pool._release(w)
+    return pool
+
+
+def test_dead_worker_is_skipped_and_chunk_retried():
+    broken, healthy = FakeWorker(0, fail=1), FakeWorker(1)
+    pool = make_pool(broken, healthy)
+    out = pool.encode(["a", "b"])
+    assert out.shape == (2, 2) and (out == 1).all()
+    assert broken.dead and pool.stats()["dead"] == 1
+    # Worker chết không quay lại hàng đợi: các request sau chỉ đi vào worker còn sống
+    for _ in range(3):
+        pool.encode(["c"])
+    assert healthy.calls == 4 and broken.calls == 0
+
+
+def test_restart_happens_in_health_loop_without_blocking_requests():
+    broken, healthy = FakeWorker(0, fail=1, restart_s=0.3), FakeWorker(1)
+    pool = make_pool(broken, healthy)
+    pool._monitor = threading.Thread(target=pool._health_loop, daemon=True)
+    pool._monitor.start()
+    try:
+        t = time.perf_counter()
+        pool.encode(["a"])
+        pool.encode(["b"])
+        assert time.perf_counter() - t < 0.2  # không chờ model load của worker hỏng
+        assert broken.restarted.wait(2)
+        deadline = time.time() + 2
+        while broken.dead and time.time() < deadline:
+            time.sleep(0.01)
+        assert not broken.dead and broken.queued
+    finally:
+        pool._stop.set()
+
+
+def test_large_batch_is_split_across_workers():
+    pool = make_pool(FakeWorker(0), FakeWorker(1))
+    out = pool.encode(["q"] * 7)
+    assert out.shape == (7, 2)
+    assert sum(w.calls for w in pool.workers) == 4  # capacity 2 -> 4 chunk
+
+
+def test_no_live_worker_raises():
+    pool = make_pool(FakeWorker(0, fail=2))
+    with pytest.raises(EmbedWorkerError):
+        pool.encode(["a"])
+
+
+def test_batcher_runs_batches_concurrently():
+    def encode(texts):
+        time.sleep(0.1)
+        return [t.upper() for t in texts]
+
+    async def run(concurrency):
+        batcher = EmbedBatcher(encode, max_batch=4, window_ms=1, max_queue=100, concurrency=concurrency)
+        await batcher.start()
+        t = time.perf_counter()
+        out = await asyncio.gather(*(batcher.encode(f"q{i}") for i in range(16)))
+        elapsed = time.perf_counter() - t
+        stats = batcher.stats()
+        await batcher.stop()
+        return out, elapsed, stats
+
+    out, elapsed, stats = asyncio.run(run(4))
+    assert out == [f"Q{i}" for i in range(16)]
+    assert stats["peak_inflight_batches"] > 1
+    _, serial, _ = asyncio.run(run(1))
+    assert elapsed < serial
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+
+DIMS = 4
+
+
+def vec(i: float) -> np.ndarray:
+    return np.full(DIMS, i, dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = EmbeddingStore(str(tmp_path), "test/model", DIMS, namespace="queries", max_rows=3)
+    yield s
+    s.close()
+
+
+def test_put_get_roundtrip_and_dedup(store):
+    assert store.put_many(["a", "b"], [vec(1), vec(2)]) == 2
+    assert store.put_many(["a"], [vec(9)]) == 0  # key đã có không bị ghi lại
+    got = store.get_many(["a", "b", "missing"])
+    assert set(got) == {"a", "b"}
+    np.testing.assert_array_equal(got["a"], vec(1))
+    assert store.get("missing") is None
+    assert store.stats()["entries"] == 2
+
+
+def test_max_rows_evicts_oldest_and_reuses_rows(store):
+    for i, key in enumerate("abcde"):
+        store.put(key, vec(i))
+    assert len(store) == 3 and store.stats()["evicted"] == 2
+    assert store.get("a") is None and store.get("b") is None
+    np.testing.assert_array_equal(store.get("e"), vec(4))
+    assert [k for k, _ in store.recent(10)] == ["e", "d", "c"]
+    assert store.stats()["capacity"] <= 3  # file không lớn quá max_rows
+
+
+def test_dims_mismatch_is_rejected(tmp_path):
+    EmbeddingStore(str(tmp_path), "m", DIMS).close()
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), "m", DIMS + 1)
+
+
+def test_reader_drops_row_overwritten_by_other_process(tmp_path):
+    writer = EmbeddingStore(str(tmp_path), "m", DIMS, max_rows=2)
+    reader = EmbeddingStore(str(tmp_path), "m", DIMS, max_rows=2)
+    writer.put_many(["a", "b"], [vec(1), vec(2)])
+    lookup = reader._rows_for
+    calls = []
+
+    def racing_rows_for(keys):
+        rows = lookup(keys)
+        if not calls:
+            # Giữa lúc reader đọc index và copy vector: process khác đẩy "a" ra và ghi "c" vào đúng dòng đó
+            writer.put("c", vec(3))
+        calls.append(keys)
+        return rows
+
+    reader._rows_for = racing_rows_for
+    got = reader.get_many(["a", "b"])
+    assert "a" not in got  # không trả vector của câu hỏi khác
+    np.testing.assert_array_equal(got["b"], vec(2))
+    np.testing.assert_array_equal(reader.get("c"), vec(3))
+    writer.close()
+    reader.close()
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from es_client import CircuitBreaker, ResilientSearch, SearchUnavailable, is_server_failure
+
+
+class FakeES:
+    """Client giả: mỗi lần search lấy (delay, lỗi) tiếp theo trong `script`, hết script thì trả lời sau `delay`."""
+
+    def __init__(self, delay=0.0, script=None):
+        self.delay = delay
+        self.script = list(script or [])
+        self.calls = 0
+        self.cancelled = 0
+
+    async def search(self, index=None, body=None, **kwargs):
+        self.calls += 1
+        delay, error = self.script.pop(0) if self.script else (self.delay, None)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if error is not None:
+            raise error
+        return {"call": self.calls}
+
+
+def status_error(status):
+    e = Exception(f"HTTP {status}")
+    e.meta = SimpleNamespace(status=status)
+    return e
+
+
+def test_is_server_failure_ignores_client_errors():
+    assert not is_server_failure(status_error(400))
+    assert is_server_failure(status_error(503))
+    assert is_server_failure(status_error(429))
+    assert is_server_failure(ConnectionError("refused"))
+
+
+def test_breaker_opens_then_half_open_probe_closes_it(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5, half_open_max=1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] += 5
+    assert breaker.allow()  # probe duy nhất
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.stats()["short_circuited"] == 2
+
+
+def test_failed_probe_reopens_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+    breaker.record_failure()
+    now[0] += 5
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2 and not breaker.allow()
+
+
+def test_resilient_search_short_circuits_when_es_is_down():
+    async def run():
+        client = FakeES(script=[(0, ConnectionError("down"))] * 2)
+        es = ResilientSearch(client, breaker=CircuitBreaker(failure_threshold=2), hedge=False)
+        for _ in range(2):
+            with pytest.raises(SearchUnavailable):
+                await es.search(index="snakes", body={})
+        with pytest.raises(SearchUnavailable, match="circuit open"):
+            await es.search(index="snakes", body={})
+        return client.calls, es.stats()
+
+    calls, stats = asyncio.run(run())
+    assert calls == 2  # request thứ ba không chạm tới ES
+    assert stats["state"] == "open" and stats["failures"] == 2
+
+
+def test_client_error_does_not_trip_breaker():
+    async def run():
+        es = ResilientSearch(FakeES(script=[(0, status_error(400))]), breaker=CircuitBreaker(failure_threshold=1),
+                             hedge=False)
+        with pytest.raises(Exception, match="HTTP 400"):
+            await es.search(index="snakes", body={})
+        return es.breaker.state
+
+    assert asyncio.run(run()) == "closed"
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    async def run():
+        client = FakeES(delay=0.001)
+        es = ResilientSearch(client, hedge_min_ms=20, hedge_max_ms=50, hedge_budget=1.0)
+        for _ in range(20):  # đủ mẫu cho percentile
+            await es.search(index="snakes", body={})
+        client.script = [(1.0, None), (0.0, None)]  # primary treo, bản sao trả lời ngay
+        t = time.perf_counter()
+        res = await es.search(index="snakes", body={})
+        elapsed = time.perf_counter() - t
+        await asyncio.sleep(0)
+        return res, elapsed, client, es
+
+    res, elapsed, client, es = asyncio.run(run())
+    assert res == {"call": 22} and elapsed < 0.5
+    assert es.hedged == 1 and es.hedge_wins == 1 and client.cancelled == 1
+
+
+def test_hedging_respects_budget():
+    async def run():
+        client = FakeES(delay=0.001)
+        es = ResilientSearch(client, hedge_min_ms=5, hedge_max_ms=5, hedge_budget=0.0)
+        for _ in range(20):
+            await es.search(index="snakes", body={})
+        client.script = [(0.05, None)]
+        await es.search(index="snakes", body={})
+        return client.calls, es.hedged
+
+    assert asyncio.run(run()) == (21, 0)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("elasticsearch")
+pytest.importorskip("dotenv")
+pytest.importorskip("tqdm")
+
+import etl_snake
+from embedding_store import EmbeddingStore
+
+ROWS = [
+    {"scientific_name": "Naja naja", "common_names": "Indian cobra", "family": "Elapidae", "danger_level": "Venomous",
+     "max_len": 150},
+    {"scientific_name": "Python bivittatus", "common_names": "Burmese python", "family": "Pythonidae",
+     "danger_level": "Non-venomous", "max_len": 500},
+]
+AI = {"Naja naja": {"vietnamese_name": "Rắn hổ mang Ấn Độ", "biology": "Sống ở đồng bằng."}}
+
+
+def indexed(rows, ai):
+    _, contexts, _ = etl_snake.split_changed(rows, ai, {})
+    return {etl_snake.doc_id(r["scientific_name"]): c["hash"] for r, c in zip(rows, contexts)}
+
+
+def test_unchanged_documents_are_skipped():
+    existing = indexed(ROWS, AI)
+    rows, contexts, unchanged = etl_snake.split_changed(ROWS, AI, existing)
+    assert rows == [] and contexts == [] and unchanged == 2
+
+
+def test_changed_mysql_or_wiki_data_is_reindexed():
+    existing = indexed(ROWS, AI)
+    edited = [ROWS[0], {**ROWS[1], "max_len": 600}]
+    rows, _, unchanged = etl_snake.split_changed(edited, AI, existing)
+    assert [r["scientific_name"] for r in rows] == ["Python bivittatus"] and unchanged == 1
+
+    rows, contexts, _ = etl_snake.split_changed(ROWS, {"Naja naja": {**AI["Naja naja"], "biology": "Mới."}}, existing)
+    assert [r["scientific_name"] for r in rows] == ["Naja naja"]
+    assert contexts[0]["hash"] != existing["Naja_naja"]
+
+
+def test_document_without_snippet_is_rewritten():
+    existing = {**indexed(ROWS, AI), "Naja_naja": None}  # fetch_existing_hashes: bản index cũ chưa có snippet
+    rows, _, unchanged = etl_snake.split_changed(ROWS, AI, existing)
+    assert [r["scientific_name"] for r in rows] == ["Naja naja"] and unchanged == 1
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1, 0, 0] for t in texts], dtype=np.float32)
+
+
+def test_encode_with_store_only_encodes_new_content(tmp_path, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(etl_snake, "get_model", lambda: model)
+    store = EmbeddingStore(str(tmp_path), "test/model", 4)
+    texts = ["a", "bb"]
+    keys = [etl_snake.content_hash(t) for t in texts]
+    vectors, n = etl_snake.encode_with_store(texts, keys, 8, store)
+    assert n == 2 and model.encoded == texts
+
+    texts.append("ccc")
+    keys.append(etl_snake.content_hash("ccc"))
+    vectors, n = etl_snake.encode_with_store(texts, keys, 8, store)
+    assert n == 1 and model.encoded[2:] == ["ccc"]
+    np.testing.assert_array_equal(vectors[1], [2, 1, 0, 0])
+
+    vectors, n = etl_snake.encode_with_store(texts + ["new"], keys + ["k"], 8, store, store_only=True)
+    assert n == 0 and vectors[3] is None and len(model.encoded) == 3
+    store.close()
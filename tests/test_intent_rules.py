@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from intent_rules import IntentRules
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "intent_corpus.jsonl")
+MIN_CONFIDENCE = 0.7  # = PARSER_MIN_CONFIDENCE mặc định của main.py
+FIELDS = ("intent_type", "limit", "must_country", "must_not_country", "danger_level")
+
+with open(CORPUS, encoding="utf-8") as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+rules = IntentRules()
+
+
+def expected(label: dict) -> dict:
+    listing = label.get("intent_type") == "listing"
+    return {"intent_type": "listing" if listing else "detail", "limit": 10 if listing else 5,
+            "must_country": None, "must_not_country": None, "danger_level": None, **label}
+
+
+@pytest.mark.parametrize("case", CASES, ids=[c["q"] for c in CASES])
+def test_confident_parse_matches_corpus_label(case):
+    intent, confidence, reasons = rules.parse(case["q"])
+    want = expected(case["intent"])
+    # Câu rule không chắc phải rơi xuống LLM parser; câu rule đủ tự tin thì phải đúng
+    assert confidence < MIN_CONFIDENCE or {f: intent[f] for f in FIELDS} == {f: want[f] for f in FIELDS}, reasons
+
+
+def test_most_of_corpus_is_handled_without_llm():
+    confident = sum(rules.parse(c["q"])[1] >= MIN_CONFIDENCE for c in CASES)
+    assert confident / len(CASES) >= 0.8
+
+
+@pytest.mark.parametrize("query, country", [
+    ("rắn ở Lào Cai", "Vietnam"),
+    ("rắn độc ở Mỹ Tho", "Vietnam"),
+    ("rắn miền nam Trung Quốc", "China"),
+    ("rắn ở miền nam", "Vietnam"),
+    ("rắn ở Lào", "Laos"),
+])
+def test_place_names_resolve_to_the_right_country(query, country):
+    intent, confidence, _ = rules.parse(query)
+    assert intent["must_country"] == country and confidence >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("query", ["rắn ở Lào và Campuchia", "rắn Đông Nam Á trừ Thái Lan và Myanmar"])
+def test_several_countries_go_to_llm(query):
+    _, confidence, reasons = rules.parse(query)
+    assert "extra_countries" in reasons and confidence < MIN_CONFIDENCE
+
+
+def test_negated_country_and_limit():
+    intent, confidence, reasons = rules.parse("Liệt kê 3 loài rắn độc ngoại trừ Việt Nam")
+    assert intent == {"intent_type": "listing", "limit": 3, "must_country": None, "must_not_country": "Vietnam",
+                      "danger_level": "Venomous"}
+    assert confidence == 1.0 and reasons == []
+
+
+def test_danger_question_is_not_a_filter():
+    intent, confidence, _ = rules.parse("Rắn cạp nong có độc không?")
+    assert intent["danger_level"] is None and confidence == 1.0
+
+
+def test_unscoped_negation_lowers_confidence():
+    _, confidence, reasons = rules.parse("rắn không ăn chuột")
+    assert reasons == ["negation"] and confidence < MIN_CONFIDENCE
+
+
+def test_ambiguous_alias_needs_accent_or_place_cue():
+    assert rules.parse("rắn lao vào người")[0]["must_country"] is None
+    assert rules.parse("rắn ở lao")[0]["must_country"] == "Laos"
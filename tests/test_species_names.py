@@ -0,0 +1,35 @@
+from species_names import SpeciesMatcher, build_name_dictionary, write_name_dictionary
+
+DOCS = [
+    {"_id": "Ophiophagus_hannah", "scientific_name": "Ophiophagus hannah", "vietnamese_name": "Rắn hổ mang chúa",
+     "common_names": "King cobra, Hamadryad"},
+    {"_id": "Naja_naja", "scientific_name": "Naja naja", "vietnamese_name": "Rắn hổ mang Ấn Độ",
+     "common_names": "Indian cobra, Cobra"},
+    {"_id": "Naja_kaouthia", "scientific_name": "Naja kaouthia", "vietnamese_name": "Rắn hổ mang một mắt kính",
+     "common_names": "Monocled cobra, Indian cobra"},
+]
+
+
+def test_dictionary_drops_single_token_and_shared_names():
+    names = build_name_dictionary(DOCS)
+    assert names["ran ho mang chua"] == "Ophiophagus_hannah"
+    assert names["naja naja"] == "Naja_naja"
+    assert "cobra" not in names and "hamadryad" not in names  # 1 token
+    assert "indian cobra" not in names  # trùng giữa hai loài
+
+
+def test_matcher_prefers_longest_whole_word_match():
+    matcher = SpeciesMatcher(build_name_dictionary(DOCS))
+    found = matcher.find("Rắn hổ mang chúa khác gì rắn hổ mang một mắt kính?")
+    assert [(m["doc_id"], m["start"], m["end"]) for m in found] == [("Ophiophagus_hannah", 0, 4),
+                                                                   ("Naja_kaouthia", 6, 12)]
+    assert matcher.find("rắn hổ mang") == []  # chỉ là tiền tố của tên
+    assert matcher.find("king cobras") == []  # không khớp nửa từ
+
+
+def test_matcher_loads_written_dictionary(tmp_path):
+    path = str(tmp_path / "names.json")
+    write_name_dictionary(path, build_name_dictionary(DOCS), {"index": "snakes_v1"})
+    matcher = SpeciesMatcher.load(path)
+    assert len(matcher) == len(build_name_dictionary(DOCS))
+    assert matcher.find("king cobra")[0]["doc_id"] == "Ophiophagus_hannah"